@@ -2,13 +2,28 @@
 
 import readyelp
 import cleanyelp
-from sklearn.feature_extraction.text import CountVectorizer
+import featurecache
+import instrument
+import temporalindex
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
 from sklearn.svm import LinearSVC
 from sklearn.naive_bayes import MultinomialNB
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn import metrics
 import numpy
+import scipy.sparse
 import random
+import sys
+import time
+import itertools
+import multiprocessing
+
+# Classifiers and hyperparameter grids compared by model_sweep.
+SWEEP_MODELS = {"MultinomialNB" : MultinomialNB, "LogisticRegression" : LogisticRegression, "LinearSVC" : LinearSVC}
+SWEEP_GRID = {"MultinomialNB" : {"alpha" : [0.1, 0.5, 1.0]}, "LogisticRegression" : {"C" : [0.1, 1.0, 10.0]}, "LinearSVC" : {"C" : [0.1, 1.0, 10.0]}}
+
+# Set in the parent before the pool is forked so that sweep workers share the feature matrices without copying them.
+_sweep_data = None
 
 def random_class():
     assignment = random.random()
@@ -17,28 +32,50 @@ def random_class():
     else:
         return "negative"
 
-def influence_baseline(train_reviews, test_reviews, user_dict):
-    """ Implements a baseline classifier that uses only review influencers.  That is, for each review in the test set, the label assigned is the majority label from the influencers of that review in the test set where an influencer is defined as a review of the same business at an earlier date from a user who is friends with the user who created the given test review. """
-    Y_predict = []
+def influence_baseline(train_reviews, test_reviews, user_dict, recency_half_life = None):
+    """ Implements a baseline classifier that uses only review influencers.  That is, for each review in the test set, the label assigned is the majority label from the influencers of that review in the test set where an influencer is defined as a review of the same business at an earlier date from a user who is friends with the user who created the given test review.  Influencer lists are stored as a sparse adjacency matrix over the test reviews and the votes are taken with one matrix-vector product.  If recency_half_life is given, each influencer's vote is weighted by 0.5 ** (days between the reviews / recency_half_life). """
+    review_id_list = test_reviews.keys()
+    row_of = dict((review_id, row) for row, review_id in enumerate(review_id_list))
+    num_reviews = len(review_id_list)
+
+    # Ratings are encoded as -1 for "negative" and +1 for any other klass.
+    ratings = numpy.ones(num_reviews)
+    indptr = numpy.zeros(num_reviews + 1, dtype = numpy.int64)
+    indices = []
     total_train_influencers = 0
     total_test_influences = 0
     no_influencers = 0
-    for review_id in test_reviews:
-        review = test_reviews[review_id]
-        influencer_list = review["friend_reviews_of_business"]
-        influence_sum = 0
-        for influencer_id in influencer_list:
-            if influencer_id in test_reviews:
-                influencer = test_reviews[influencer_id]
-            else:
-                continue
-            if influencer["rating"] == "negative":
-                influence_sum -= 1
-            else:
-                influence_sum += 1
-        if influence_sum < 0:
+    for row in range(num_reviews):
+        review = test_reviews[review_id_list[row]]
+        if review["rating"] == "negative":
+            ratings[row] = -1
+        num_test_influencers = 0
+        for influencer_id in review["friend_reviews_of_business"]:
+            if influencer_id in row_of:
+                indices.append(row_of[influencer_id])
+                num_test_influencers += 1
+            elif influencer_id in train_reviews:
+                total_train_influencers += 1
+        total_test_influences += num_test_influencers
+        if num_test_influencers == 0:
+            no_influencers += 1
+        indptr[row + 1] = len(indices)
+    indices = numpy.array(indices, dtype = numpy.int64)
+
+    if recency_half_life is None:
+        weights = numpy.ones(len(indices))
+    else:
+        dates = numpy.array([temporalindex.date_ordinal(test_reviews[review_id]["date"]) for review_id in review_id_list])
+        rows = numpy.repeat(numpy.arange(num_reviews), numpy.diff(indptr))
+        weights = 0.5 ** (numpy.abs(dates[rows] - dates[indices]) / float(recency_half_life))
+    influencers = scipy.sparse.csr_matrix((weights, indices, indptr), shape = (num_reviews, num_reviews))
+    influence_sum = influencers.dot(ratings)
+
+    Y_predict = []
+    for row in range(num_reviews):
+        if influence_sum[row] < 0:
             Y_predict.append("negative")
-        elif influence_sum > 0:
+        elif influence_sum[row] > 0:
             Y_predict.append("positive")
         else:
             Y_predict.append("UNKNOWN")
@@ -47,8 +84,8 @@ def influence_baseline(train_reviews, test_reviews, user_dict):
     print "Test reviews with no influencers:", no_influencers
     return Y_predict
 
-def bag_of_words_probabilities(train_reviews, test_reviews):
-    """ Implements a baseline bag-of-words classifier.  Returns a dictionary mapping tuples (review_id, class) to the probability that that review belongs to that class. """
+def bag_of_words_features(train_reviews, test_reviews, feature_cache = None):
+    """ Returns (X_train, Y_train, X_test), the bag-of-words matrices of the training and test reviews in the order of their keys and the training labels.  If a FeatureCache is given, the train and test matrices are read from or saved to it instead of refitting the vectorizer. """
     train_corpus = []
     test_corpus = []
     Y_train = []
@@ -57,19 +94,30 @@ def bag_of_words_probabilities(train_reviews, test_reviews):
         train_corpus.append(review["text"])
         Y_train.append(review["rating"])
 
-    vectorizer = CountVectorizer(stop_words = 'english')
-    X_train = vectorizer.fit_transform(train_corpus)
-
     for review_id in test_reviews:
         review = test_reviews[review_id]
         test_corpus.append(review["text"])
 
+    with instrument.span("vectorise", len(train_corpus) + len(test_corpus)):
+        if feature_cache is not None:
+            X_train, X_test, vocabulary = feature_cache.vectorize(train_corpus, test_corpus, {"stop_words" : "english"})
+        else:
+            vectorizer = CountVectorizer(stop_words = 'english')
+            X_train = vectorizer.fit_transform(train_corpus)
+            X_test = vectorizer.transform(test_corpus)
+    return X_train, Y_train, X_test
+
+def bag_of_words_probabilities(train_reviews, test_reviews, feature_cache = None):
+    """ Implements a baseline bag-of-words classifier.  Returns a dictionary mapping tuples (review_id, class) to the probability that that review belongs to that class.  If a FeatureCache is given, the train and test matrices are read from or saved to it instead of refitting the vectorizer. """
+    X_train, Y_train, X_test = bag_of_words_features(train_reviews, test_reviews, feature_cache)
+
     # clf = LinearSVC(class_weight = 'auto').fit(X_train, Y_train)
     # clf = LogisticRegression().fit(X_train, Y_train)
-    clf = MultinomialNB().fit(X_train, Y_train)
+    with instrument.span("fit", len(Y_train)):
+        clf = MultinomialNB().fit(X_train, Y_train)
 
-    X_test = vectorizer.transform(test_corpus)
-    Y_probability = clf.predict_proba(X_test)
+    with instrument.span("predict", len(test_reviews)):
+        Y_probability = clf.predict_proba(X_test)
 
     probability_dict = {}
     review_id_list = test_reviews.keys()
@@ -79,9 +127,56 @@ def bag_of_words_probabilities(train_reviews, test_reviews):
     return probability_dict
 
 
-def bag_of_words_baseline(train_reviews, test_reviews):
+def _batches(items, batch_size):
+    """ Yields lists of up to batch_size items from the iterable items. """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def streaming_bag_of_words_probabilities(train_path, test_reviews, model = "nb", batch_size = 10000, n_features = 2 ** 20, klass_list = None):
+    """ Out-of-core counterpart of bag_of_words_probabilities.  Training reviews are streamed from the json file at train_path in mini-batches, hashed into n_features columns with a HashingVectorizer, and used to update the classifier with partial_fit, so that memory is bounded by batch_size rather than by the corpus or its vocabulary.  model is "nb" for MultinomialNB or "sgd" for logistic regression trained by stochastic gradient descent.  Returns the same dictionary as bag_of_words_probabilities. """
+    if klass_list is None:
+        klass_list = ["negative", "positive"]
+    if model == "nb":
+        # MultinomialNB needs non-negative term counts, as CountVectorizer gives.
+        vectorizer = HashingVectorizer(stop_words = 'english', n_features = n_features, alternate_sign = False, norm = None)
+        clf = MultinomialNB()
+    elif model == "sgd":
+        vectorizer = HashingVectorizer(stop_words = 'english', n_features = n_features)
+        clf = SGDClassifier(loss = "log")
+    else:
+        raise ValueError("Unknown streaming model: %s" % model)
+
+    num_train = 0
+    with instrument.span("streaming_fit") as fit_span:
+        for batch in _batches(readyelp.iter_records(train_path), batch_size):
+            X_batch = vectorizer.transform([review["text"] for review in batch])
+            Y_batch = [review["rating"] for review in batch]
+            clf.partial_fit(X_batch, Y_batch, classes = klass_list)
+            num_train += len(batch)
+        fit_span.items = num_train
+    print "Streamed training reviews:", num_train
+
+    positive_column = list(clf.classes_).index(klass_list[1])
+    probability_dict = {}
+    for batch in _batches(test_reviews, batch_size):
+        X_batch = vectorizer.transform([test_reviews[review_id]["text"] for review_id in batch])
+        Y_probability = clf.predict_proba(X_batch)
+        for i in range(len(batch)):
+            probability_dict[batch[i]] = Y_probability[i][positive_column]
+
+    return probability_dict
+
+
+def bag_of_words_baseline(train_reviews, test_reviews, feature_cache = None):
     """ Runs the baseline classifier and returns an array of predicted classes. """
-    Y_probability = bag_of_words_probabilities(train_reviews, test_reviews)
+    Y_probability = bag_of_words_probabilities(train_reviews, test_reviews, feature_cache)
     Y_predict = []
 
     for review_id in test_reviews:
@@ -95,10 +190,73 @@ def bag_of_words_baseline(train_reviews, test_reviews):
 
 
 
+def _fit_and_score(task):
+    """ Sweep worker.  Fits one model configuration on the shared training matrix and scores it on the shared test matrix. """
+    name, params = task
+    X_train, Y_train, X_test, Y_test = _sweep_data
+    start = time.time()
+    clf = SWEEP_MODELS[name](**params).fit(X_train, Y_train)
+    fit_seconds = time.time() - start
+    start = time.time()
+    Y_predict = clf.predict(X_test)
+    predict_seconds = time.time() - start
+    precision, recall, f1, support = metrics.precision_recall_fscore_support(Y_test, Y_predict, average = 'macro')
+    return {"model" : name, "params" : params, "precision" : precision, "recall" : recall, "f1" : f1, "fit_seconds" : fit_seconds, "predict_seconds" : predict_seconds}
+
+
+def _expand_grid(param_grid):
+    """ Returns the list of (model name, params) configurations in param_grid. """
+    tasks = []
+    for name in sorted(param_grid):
+        grid = param_grid[name]
+        keys = sorted(grid)
+        for values in itertools.product(*[grid[key] for key in keys]):
+            tasks.append((name, dict(zip(keys, values))))
+    return tasks
+
+
+def model_sweep(train_reviews, test_reviews, param_grid = None, processes = None, feature_cache = None):
+    """ Vectorises the reviews once, then fits and evaluates every configuration in param_grid (by default SWEEP_GRID) on a process pool that shares the sparse feature matrices.  Prints a table of macro precision, recall and F1 with fit and predict times, and returns its rows. """
+    global _sweep_data
+    if param_grid is None:
+        param_grid = SWEEP_GRID
+    if feature_cache is None:
+        feature_cache = featurecache.FeatureCache()
+
+    train_corpus = [train_reviews[review_id]["text"] for review_id in train_reviews]
+    Y_train = [train_reviews[review_id]["rating"] for review_id in train_reviews]
+    test_corpus = [test_reviews[review_id]["text"] for review_id in test_reviews]
+    Y_test = [test_reviews[review_id]["rating"] for review_id in test_reviews]
+    with instrument.span("vectorise", len(train_corpus) + len(test_corpus)):
+        X_train, X_test, vocabulary = feature_cache.vectorize(train_corpus, test_corpus, {"stop_words" : "english"})
+
+    tasks = _expand_grid(param_grid)
+    with instrument.span("sweep", len(tasks)):
+        _sweep_data = (X_train, Y_train, X_test, Y_test)
+        try:
+            if processes == 1:
+                results = [_fit_and_score(task) for task in tasks]
+            else:
+                pool = multiprocessing.Pool(processes)
+                try:
+                    results = pool.map(_fit_and_score, tasks)
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            _sweep_data = None
+
+    print "%-20s %-16s %9s %9s %9s %9s %9s" % ("model", "params", "precision", "recall", "f1", "fit (s)", "pred (s)")
+    for result in results:
+        params = ",".join("%s=%s" % (key, result["params"][key]) for key in sorted(result["params"]))
+        print "%-20s %-16s %9.3f %9.3f %9.3f %9.2f %9.2f" % (result["model"], params, result["precision"], result["recall"], result["f1"], result["fit_seconds"], result["predict_seconds"])
+    return results
+
+
 """ This module implements the baseline classifier.  MultinomialNB, LogisticRegression, and LinearSVC each give comparable performance in their current configurations. """
 def main():
-    train_reviews = readyelp.read_reviews_to_dict("./train_reviews.json")
-    test_reviews = readyelp.read_reviews_to_dict("./test_reviews.json")
+    train_reviews = readyelp.read_split("train")
+    test_reviews = readyelp.read_split("test")
     user_dict = readyelp.read_users_to_dict("./users_limited.json")
     klass_list = ["negative", "positive"]
     test_corpus = []
@@ -113,13 +271,17 @@ def main():
     print "Random model metrics:"
     print metrics.classification_report(gold_labels, Y_random, target_names = klass_list)
 
-    Y_bag_of_words = bag_of_words_baseline(train_reviews, test_reviews)
+    feature_cache = featurecache.FeatureCache()
+    with instrument.span("bag_of_words", len(test_reviews)):
+        Y_bag_of_words = bag_of_words_baseline(train_reviews, test_reviews, feature_cache)
+    feature_cache.report()
     print "Bag of words baseline model metrics:"
     print metrics.classification_report(gold_labels, Y_bag_of_words, target_names = klass_list)
 
     Y_random_influence = []
     Y_bow_influence = []
-    Y_influence = influence_baseline(train_reviews, test_reviews, user_dict)
+    with instrument.span("influence_baseline", len(test_reviews)):
+        Y_influence = influence_baseline(train_reviews, test_reviews, user_dict)
     for i in range(len(Y_influence)):
         if Y_influence[i] == "UNKNOWN":
             Y_bow_influence.append(Y_bag_of_words[i])
@@ -137,5 +299,39 @@ def main():
 
 
 
+def streaming_main(model = "nb"):
+    """ Evaluates the bag-of-words classifier trained out of core on ./train_reviews.json, without holding the training reviews in memory, on the test split. """
+    test_reviews = readyelp.read_split("test", lazy_text = True)
+    with instrument.span("streaming_bag_of_words", len(test_reviews)):
+        Y_probability = streaming_bag_of_words_probabilities("./train_reviews.json", test_reviews, model)
+    gold_labels = []
+    Y_predict = []
+    for review_id in test_reviews:
+        gold_labels.append(test_reviews[review_id]["rating"])
+        if Y_probability[review_id] >= 0.5:
+            Y_predict.append("positive")
+        else:
+            Y_predict.append("negative")
+    print "Streaming bag of words model metrics:"
+    print metrics.classification_report(gold_labels, Y_predict, target_names = ["negative", "positive"])
+
+
+def sweep_main():
+    """ Runs model_sweep on the training and test split. """
+    train_reviews = readyelp.read_split("train")
+    test_reviews = readyelp.read_split("test")
+    model_sweep(train_reviews, test_reviews)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    instrument.enable()
+    if len(sys.argv) > 1 and sys.argv[1] == "sweep":
+        sweep_main()
+    elif len(sys.argv) > 1 and sys.argv[1] == "stream":
+        if len(sys.argv) > 2:
+            streaming_main(sys.argv[2])
+        else:
+            streaming_main()
+    else:
+        main()
+    instrument.write_report()
\ No newline at end of file
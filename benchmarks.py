@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+""" Benchmarks for the data preparation steps and the classification pipeline, run on synthetic data so that they do not depend on the Yelp Academic Dataset. """
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import numpy
+import cleanyelp
+import readyelp
+import recordio
+import synthyelp
+import instrument
+import baselineclassifier
+import reviewcrf
+import reviewgraph
+
+# (users, reviews) of the synthetic datasets benchmark_pipeline runs on.
+PIPELINE_SCALES = [(1000, 10000), (3000, 30000), (10000, 100000)]
+
+PIPELINE_STAGES = ["ingest", "clean_review_dict", "find_review_pairs_by_friends", "split", "naive_bayes", "crf_train", "crf_tag", "min_cut"]
+
+# File suffix of each codec benchmark_record_io measures, keyed by the codec name recordio uses (None for plain files).
+RECORD_IO_CODECS = [(None, ".json"), ("gzip", ".json.gz"), ("bz2", ".json.bz2")]
+
+
+def synthetic_user_graph(directory, num_users = 1000000, friends_per_user = 5, test_fraction = 0.3, dropped_fraction = 0.2, seed = 0):
+    """ Writes users.json, train_reviews.json and test_reviews.json to directory.  Review counts per user follow a heavy-tailed (Pareto) distribution, as on Yelp, and each user has about 2 * friends_per_user friends; dropped_fraction of the reviews appear in neither split so that the user filter has work to do. """
+    rng = random.Random(seed)
+    user_ids = ["u%09d" % i for i in xrange(num_users)]
+    friends = [[] for i in xrange(num_users)]
+    for i in xrange(num_users):
+        for j in xrange(friends_per_user):
+            friend = rng.randrange(num_users)
+            if friend != i:
+                friends[i].append(user_ids[friend])
+                friends[friend].append(user_ids[i])
+
+    with open(os.path.join(directory, "users.json"), 'w') as users_file:
+        with open(os.path.join(directory, "train_reviews.json"), 'w') as train_file:
+            with open(os.path.join(directory, "test_reviews.json"), 'w') as test_file:
+                for i in xrange(num_users):
+                    num_reviews = min(int(rng.paretovariate(1.2)), 5000)
+                    review_ids = ["r%09d_%d" % (i, j) for j in xrange(num_reviews)]
+                    for review_id in review_ids:
+                        assignment = rng.random()
+                        if assignment < dropped_fraction:
+                            continue
+                        review = {"review_id" : review_id, "user_id" : user_ids[i]}
+                        if assignment < dropped_fraction + test_fraction:
+                            test_file.write(json.dumps(review) + '\n')
+                        else:
+                            train_file.write(json.dumps(review) + '\n')
+                    users_file.write(json.dumps({"user_id" : user_ids[i], "friends" : friends[i], "reviews" : review_ids}) + '\n')
+
+
+def _legacy_filter_users(users_path, review_paths, output_path):
+    """ The user filter as it was before it was rewritten, kept as the benchmark reference. """
+    user_dict = readyelp.read_users_to_dict(users_path)
+    train_reviews = readyelp.read_reviews_to_dict(review_paths[0])
+    test_reviews = readyelp.read_reviews_to_dict(review_paths[1])
+
+    users_limited = []
+
+    for user_id in user_dict:
+        user = user_dict[user_id]
+        user_review_list = user["reviews"]
+        for review_id in user_review_list:
+            if review_id not in train_reviews and review_id not in test_reviews:
+                user_review_list.remove(review_id)
+        if len(user_review_list) > 0:
+            user["reviews"] = user_review_list
+            users_limited.append(user)
+
+    readyelp.write_output(users_limited, output_path)
+
+
+def benchmark_filter_users(num_users = 1000000, seed = 0):
+    """ Times the legacy and the current user filter on a synthetic graph of num_users users.  Returns the two timings in seconds. """
+    directory = tempfile.mkdtemp(prefix = "yelp_bench_")
+    try:
+        synthetic_user_graph(directory, num_users, seed = seed)
+        users_path = os.path.join(directory, "users.json")
+        review_paths = (os.path.join(directory, "train_reviews.json"), os.path.join(directory, "test_reviews.json"))
+
+        start = time.time()
+        _legacy_filter_users(users_path, review_paths, os.path.join(directory, "users_legacy.json"))
+        legacy_seconds = time.time() - start
+
+        start = time.time()
+        cleanyelp.filter_users(users_path, review_paths, os.path.join(directory, "users_limited.json"))
+        current_seconds = time.time() - start
+    finally:
+        shutil.rmtree(directory)
+
+    print "filter_users on %d users: legacy %.2fs, current %.2fs (%.1fx)" % (num_users, legacy_seconds, current_seconds, legacy_seconds / current_seconds)
+    return legacy_seconds, current_seconds
+
+
+def _legacy_write(records, output_path):
+    """ Record writing as it was before recordio, one json.dump and newline write per record, kept as the benchmark reference. """
+    with open(output_path, 'w+') as output_file:
+        for record in records:
+            json.dump(record, output_file)
+            output_file.write('\n')
+
+
+def _legacy_read(input_path):
+    with open(input_path) as input_file:
+        for line in input_file:
+            json.loads(line)
+
+
+def benchmark_record_io(num_reviews = 100000, seed = 0):
+    """ Times writing and reading a synthetic review file of num_reviews reviews through recordio with each codec, reading with each installed json backend, alongside the record-at-a-time writer and stdlib reader that recordio replaced.  Throughput is in MB/s of uncompressed json.  Returns a dictionary mapping each measurement name to its MB/s. """
+    directory = tempfile.mkdtemp(prefix = "yelp_bench_")
+    throughput = {}
+    try:
+        review_path = os.path.join(directory, "review.json")
+        synthyelp.generate_dataset(review_path, os.path.join(directory, "user.json"), max(1, num_reviews // 10), num_reviews, seed = seed)
+        records = list(recordio.iter_records(review_path, backend = "json"))
+        megabytes = os.path.getsize(review_path) / (1024.0 * 1024)
+
+        def measure(name, func, *args):
+            start = time.time()
+            func(*args)
+            throughput[name] = megabytes / max(time.time() - start, 1e-9)
+
+        measure("legacy write", _legacy_write, records, os.path.join(directory, "legacy.json"))
+        measure("legacy read", _legacy_read, os.path.join(directory, "legacy.json"))
+        for codec, suffix in RECORD_IO_CODECS:
+            codec_name = codec or "plain"
+            path = os.path.join(directory, "records" + suffix)
+            measure("%s write" % codec_name, recordio.write_records, records, path)
+            for backend in sorted(recordio.available_backends()):
+                measure("%s read %s" % (codec_name, backend), lambda: sum(1 for record in recordio.iter_records(path, backend)))
+            print "%s: %.1f MB on disk" % (codec_name, os.path.getsize(path) / (1024.0 * 1024))
+    finally:
+        shutil.rmtree(directory)
+
+    print "Record I/O on %d reviews (%.1f MB of json):" % (num_reviews, megabytes)
+    for name in sorted(throughput):
+        print "%-30s%8.1f MB/s" % (name, throughput[name])
+    return throughput
+
+
+def _run_pipeline_stages(review_path, user_path, crf_params, processes):
+    """ Runs each stage of the classification pipeline once in the current directory, each in an instrument span named after it. """
+    klass_list = ["negative", "positive"]
+    with instrument.span("ingest"):
+        reviews_by_user = {}
+        readyelp.stream_review_dataset_file(review_path, "./reviews.json", reviews_by_user, processes)
+        readyelp.stream_user_dataset_file(user_path, "./users.json", reviews_by_user, processes)
+    review_dict = readyelp.read_reviews_to_dict("./reviews.json", lazy_text = True)
+    user_dict = readyelp.read_users_to_dict("./users.json")
+    with instrument.span("clean_review_dict", len(review_dict)):
+        cleanyelp.clean_review_dict(review_dict, user_dict, output_path = "./clean_reviews.json")
+    with instrument.span("find_review_pairs_by_friends") as pair_span:
+        pair_span.items = len(cleanyelp.find_review_pairs_by_friends(user_dict, review_dict, processes))
+    with instrument.span("split", len(review_dict)):
+        cleanyelp.stream_split_data_by_business(0.75, 0, "./clean_reviews.json")
+
+    train_reviews = readyelp.read_reviews_to_dict("./train_reviews.json")
+    test_reviews = readyelp.read_reviews_to_dict("./test_reviews.json")
+    user_dict = readyelp.read_users_to_dict("./users_limited.json")
+    with instrument.span("naive_bayes", len(train_reviews) + len(test_reviews)):
+        ind_pref = baselineclassifier.bag_of_words_probabilities(train_reviews, test_reviews)
+    with instrument.span("crf_train", len(train_reviews)):
+        model_path = reviewcrf.train_crf_incremental(train_reviews, user_dict, "./crfmodels", params = crf_params)
+    with instrument.span("crf_tag") as tag_span:
+        pair_str = reviewcrf.crftag_probabilities(test_reviews, user_dict, processes, model_path)
+        tag_span.items = len(pair_str)
+    with instrument.span("min_cut", len(test_reviews)):
+        reviewgraph.build_graph(klass_list, test_reviews, ind_pref, pair_str, decompose = True, processes = processes)
+
+
+def growth_exponent(sizes, seconds):
+    """ Returns the slope of log(seconds) against log(sizes), the exponent k of a fit seconds ~ sizes ** k.  Returns None when fewer than two points can be fitted. """
+    points = [(size, second) for size, second in zip(sizes, seconds) if size > 0 and second > 0]
+    if len(set(size for size, second in points)) < 2:
+        return None
+    log_sizes = numpy.log([size for size, second in points])
+    log_seconds = numpy.log([second for size, second in points])
+    return numpy.polyfit(log_sizes, log_seconds, 1)[0]
+
+
+def benchmark_pipeline(scales = PIPELINE_SCALES, seed = 0, crf_params = {"max_iterations" : 20}, processes = 1, report_path = "./benchmark_report.json"):
+    """ Generates a synthetic dataset at each (users, reviews) scale, times every pipeline stage on it, and prints the seconds per stage at each scale with the growth exponent of each stage in the number of reviews.  CRF training is capped by crf_params so that its time reflects the cost per iteration.  Writes the spans, timings and exponents to report_path and returns the table as a dictionary mapping each stage to its list of seconds. """
+    instrument.enable()
+    timings = dict((stage, []) for stage in PIPELINE_STAGES)
+    sizes = []
+    working_directory = os.getcwd()
+    for num_users, num_reviews in scales:
+        directory = tempfile.mkdtemp(prefix = "yelp_bench_")
+        try:
+            os.chdir(directory)
+            synthyelp.generate_dataset("./review.json", "./user.json", num_users, num_reviews, seed = seed)
+            first_span = len(instrument.spans())
+            with instrument.span("scale_%d" % num_reviews, num_reviews):
+                _run_pipeline_stages("./review.json", "./user.json", crf_params, processes)
+        finally:
+            os.chdir(working_directory)
+            shutil.rmtree(directory)
+        stage_seconds = dict((record["name"], record["seconds"]) for record in instrument.spans()[first_span:] if record["depth"] == 1)
+        for stage in PIPELINE_STAGES:
+            timings[stage].append(stage_seconds[stage])
+        sizes.append(num_reviews)
+
+    growth = dict((stage, growth_exponent(sizes, timings[stage])) for stage in PIPELINE_STAGES)
+    print "%-30s" % "stage" + "".join("%12s" % ("%d rev" % size) for size in sizes) + "%10s" % "growth"
+    for stage in PIPELINE_STAGES:
+        exponent = "n/a" if growth[stage] is None else "%.2f" % growth[stage]
+        print "%-30s" % stage + "".join("%11.2fs" % second for second in timings[stage]) + "%10s" % exponent
+    instrument.write_report(report_path, {"scales" : scales, "seed" : seed, "timings" : timings, "growth" : growth})
+    return timings
+
+
+def main():
+    """ Takes an optional benchmark name, "filter_users" (the default) followed by a number of users, "pipeline" followed by numbers of reviews to run at, with ten reviews per user, or "recordio" followed by a number of reviews. """
+    if len(sys.argv) > 1 and sys.argv[1] == "recordio":
+        if len(sys.argv) > 2:
+            benchmark_record_io(int(sys.argv[2]))
+        else:
+            benchmark_record_io()
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "pipeline":
+        scales = PIPELINE_SCALES
+        if len(sys.argv) > 2:
+            scales = [(int(size) // 10, int(size)) for size in sys.argv[2:]]
+        benchmark_pipeline(scales)
+        return
+    num_users = 1000000
+    args = [arg for arg in sys.argv[1:] if arg != "filter_users"]
+    if args:
+        num_users = int(args[0])
+    benchmark_filter_users(num_users)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,76 @@
 #!/usr/bin/env python
 
+import os
+import sys
 import readyelp
 import cleanyelp
 import baselineclassifier
+import featurecache
 import reviewcrf
 import reviewgraph
+import pipeline
+import instrument
 from sklearn import metrics
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
 
-def main():
+klass_list = ["negative", "positive"]
+
+
+def ingest_stage(inputs, review_path, user_path):
+    reviews_by_user = {}
+    readyelp.stream_review_dataset_file(review_path, "./reviews.json", reviews_by_user)
+    readyelp.stream_user_dataset_file(user_path, "./users.json", reviews_by_user)
+
+
+def clean_stage(inputs, earlier_only, window_days, max_influencers):
+    review_dict = readyelp.read_reviews_to_dict("./reviews.json", lazy_text = True)
+    user_dict = readyelp.read_users_to_dict("./users.json")
+    cleanyelp.clean_review_dict(review_dict, user_dict, earlier_only, "./clean_reviews.json", window_days, max_influencers)
+
+
+def split_stage(inputs, train_ratio_of_total, seed, store_path):
+    cleanyelp.stream_split_data_by_business(train_ratio_of_total, seed, "./clean_reviews.json", store_path = store_path)
+
+
+def featurise_stage(inputs, store_path, feature_cache_dir):
+    """ Returns the bag-of-words matrices of the split, from baselineclassifier.bag_of_words_features with a FeatureCache in feature_cache_dir, with the training labels and the test review_ids in row order. """
+    train_reviews = readyelp.read_split("train", store_path)
+    test_reviews = readyelp.read_split("test", store_path)
+    X_train, Y_train, X_test = baselineclassifier.bag_of_words_features(train_reviews, test_reviews, featurecache.FeatureCache(feature_cache_dir))
+    return X_train, Y_train, X_test, test_reviews.keys()
+
+
+def train_nb_stage(inputs, alpha):
+    """ Returns the individual class preferences of the test reviews. """
+    X_train, Y_train, X_test, test_ids = inputs["featurise"]
+    clf = MultinomialNB(alpha = alpha).fit(X_train, Y_train)
+    Y_probability = clf.predict_proba(X_test)
+    return dict((test_ids[i], Y_probability[i][1]) for i in range(len(test_ids)))
 
-    ## Only call the below once, when data needs to be cleaned and split ##
-    cleanyelp.split_data_by_business(0.75)
-    #######################################################################
 
-    train_reviews = readyelp.read_reviews_to_dict("./train_reviews.json")
-    test_reviews = readyelp.read_reviews_to_dict("./test_reviews.json")
+def train_crf_stage(inputs, algorithm, crf_params, store_path):
+    """ Returns the path of the trained CRF model. """
+    train_reviews = readyelp.read_split("train", store_path)
     user_dict = readyelp.read_users_to_dict("./users_limited.json")
-    klass_list = ["negative", "positive"]
-
-    # Calculate class preferences of individual classifier
-    ind_pref = baselineclassifier.bag_of_words_probabilities(train_reviews, test_reviews)
-    print "Individual preferences calculated."
-    # Train CRF model
-    reviewcrf.train_crf(train_reviews, user_dict)
-    # Calculate pair strengths
-    pair_str = reviewcrf.crftag_probabilities(test_reviews, user_dict)
-    print "Pair strengths calculated."
-    # Build review graph
-    min_cut_classes = reviewgraph.build_graph(klass_list, test_reviews, ind_pref, pair_str)
-    print "Graph cut."
-    # Make min-cut classification
+    return reviewcrf.train_crf_incremental(train_reviews, user_dict, algorithm = algorithm, params = crf_params)
+
+
+def pair_score_stage(inputs, processes, store_path):
+    test_reviews = readyelp.read_split("test", store_path)
+    user_dict = readyelp.read_users_to_dict("./users_limited.json")
+    return reviewcrf.crftag_probabilities(test_reviews, user_dict, processes, inputs["train_crf"])
+
+
+def min_cut_stage(inputs, backend, processes, store_path):
+    test_reviews = readyelp.read_split("test", store_path, lazy_text = True)
+    return reviewgraph.build_graph(klass_list, test_reviews, inputs["train_nb"], inputs["pair_score"], backend, decompose = True, processes = processes)
+
+
+def evaluate_stage(inputs, store_path):
+    """ Returns the classification report of the min-cut classes. """
+    test_reviews = readyelp.read_split("test", store_path, lazy_text = True)
+    min_cut_classes = inputs["min_cut"]
     Y_gold = []
     Y_predict = []
     for test_id in test_reviews:
@@ -40,11 +80,45 @@ def main():
             Y_predict.append("positive")
         else:
             Y_predict.append("negative")
+    return metrics.classification_report(Y_gold, Y_predict, target_names = klass_list)
+
 
-    classification_metrics = metrics.classification_report(Y_gold, Y_predict, target_names = klass_list)
+def classification_pipeline(review_path, user_path, train_ratio_of_total = 0.75, seed = 0, earlier_only = False, window_days = None, max_influencers = None, alpha = 1.0, algorithm = "lbfgs", crf_params = None, backend = None, processes = None, cache_dir = "./pipeline_cache", store_path = None, feature_cache_dir = "./feature_cache"):
+    """ Returns the pipeline ingest -> clean -> split -> featurise -> train NB -> train CRF -> pair score -> min-cut -> evaluate for the Yelp dataset files at review_path and user_path.  Stages are cached by their inputs and parameters, so changing only the CRF parameters reruns only the CRF, pair scoring, min-cut and evaluation stages.  earlier_only, window_days and max_influencers select the influencers of each review as in cleanyelp.clean_review_dict, which also limits the pairs the CRF is trained on and scores.  If store_path is given, the split is also written to a review store there, which the later stages read memory-mapped instead of the split's json files. """
+    stages = pipeline.Pipeline(cache_dir)
+    stages.add(pipeline.Stage("ingest", ingest_stage, params = {"review_path" : review_path, "user_path" : user_path}, input_files = [review_path, user_path], output_files = ["./reviews.json", "./users.json"]))
+    stages.add(pipeline.Stage("clean", clean_stage, ["ingest"], {"earlier_only" : earlier_only, "window_days" : window_days, "max_influencers" : max_influencers}, output_files = ["./clean_reviews.json"]))
+    split_files = ["./train_reviews.json", "./test_reviews.json", "./users_limited.json"]
+    if store_path is not None:
+        split_files += [os.path.join(store_path, name) for name in ["meta.json", "subset_train.npy", "subset_test.npy"]]
+    stages.add(pipeline.Stage("split", split_stage, ["clean"], {"train_ratio_of_total" : train_ratio_of_total, "seed" : seed, "store_path" : store_path}, output_files = split_files))
+    stages.add(pipeline.Stage("featurise", featurise_stage, ["split"], {"store_path" : store_path, "feature_cache_dir" : feature_cache_dir}))
+    stages.add(pipeline.Stage("train_nb", train_nb_stage, ["featurise"], {"alpha" : alpha}))
+    stages.add(pipeline.Stage("train_crf", train_crf_stage, ["split"], {"algorithm" : algorithm, "crf_params" : crf_params or {}, "store_path" : store_path}, returns_files = True))
+    stages.add(pipeline.Stage("pair_score", pair_score_stage, ["split", "train_crf"], {"processes" : processes, "store_path" : store_path}))
+    stages.add(pipeline.Stage("min_cut", min_cut_stage, ["split", "train_nb", "pair_score"], {"backend" : backend, "processes" : processes, "store_path" : store_path}))
+    stages.add(pipeline.Stage("evaluate", evaluate_stage, ["split", "min_cut"], {"store_path" : store_path}))
+    return stages
 
-    print classification_metrics
+
+def main():
+    """ Takes optional arguments: the pathnames of the Yelp Academic Dataset reviews and users json files, --profile to dump a cProfile of each stage that runs to ./profiles, and --store to have the stages after the split read it from a memory-mapped review store.  A timing and memory report of the run is written to ./instrument_report.json. """
+    args = [arg for arg in sys.argv[1:] if arg not in ("--profile", "--store")]
+    instrument.enable()
+    if "--profile" in sys.argv:
+        instrument.enable_profiling()
+    review_path = "../yelp_data/yelp_academic_dataset_review.json"
+    user_path = "../yelp_data/yelp_academic_dataset_user.json"
+    if len(args) > 1:
+        review_path = args[0]
+        user_path = args[1]
+    store_path = None
+    if "--store" in sys.argv:
+        store_path = readyelp.REVIEW_STORE_PATH
+    results = classification_pipeline(review_path, user_path, store_path = store_path).run(["evaluate"])
+    print results["evaluate"]
+    instrument.write_report()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
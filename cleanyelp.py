@@ -1,13 +1,25 @@
 #!/usr/bin/env/ python
 
 import readyelp
-import datetime
+import reviewstore
+import instrument
+import pipeline
+import reviewstats
+import temporalindex
 import random
+import time
+import re
+import json
+import hashlib
+import multiprocessing
+
+# Set in the parent before the pool is forked so that pair join workers share the business index and friend sets without pickling them.
+_pair_join_state = None
 
 
 def split_data(train_ratio_of_total = 0.5):
     """ Splits the data randomly according to the ratio of training data to the total size of the data set provided.  The default argument of 0.5 splits the data evenly between training and test sets. """
-    reviews = readyelp.read_reviews_to_dict("./reviews.json")
+    reviews = readyelp.read_reviews_to_dict("./reviews.json", lazy_text = True)
     users = readyelp.read_users_to_dict("./users.json")
     clean_review_dict(reviews, users)
 
@@ -27,9 +39,9 @@ def split_data(train_ratio_of_total = 0.5):
     filter_users()
 
 
-def split_data_by_business(train_ratio_of_total = 0.5):
-    """ Splits the data such that all reviews of a particular business end up in either the training set or the test set.  This prevents links between reviews from being lost during the split. """
-    reviews = readyelp.read_reviews_to_dict("./reviews.json")
+def split_data_by_business(train_ratio_of_total = 0.5, store_path = None):
+    """ Splits the data such that all reviews of a particular business end up in either the training set or the test set.  This prevents links between reviews from being lost during the split.  If store_path is given, the reviews are also written to a review store there with the split recorded as its "train" and "test" subsets. """
+    reviews = readyelp.read_reviews_to_dict("./reviews.json", lazy_text = True)
     users = readyelp.read_users_to_dict("./users.json")
 
     businesses = business_reviews_dict(reviews)
@@ -58,6 +70,72 @@ def split_data_by_business(train_ratio_of_total = 0.5):
 
     readyelp.write_output(train, "./train_reviews.json")
     readyelp.write_output(test, "./test_reviews.json")
+    # Users are limited to the reviews written to the split files, which are all the reviews of users.json's authors in reviews.json.
+    kept_ids = set(review["review_id"] for review in train)
+    kept_ids.update(review["review_id"] for review in test)
+    filter_users(review_ids = kept_ids)
+
+    if store_path is not None:
+        readyelp.write_review_store(reviews, store_path)
+        store = reviewstore.ReviewStore(store_path)
+        store.write_subset("train", train_ids, pipeline.file_digest("./train_reviews.json"))
+        store.write_subset("test", test_ids, pipeline.file_digest("./test_reviews.json"))
+
+
+def _business_hash_fraction(business_id, seed):
+    """ Maps a business_id to a number in [0, 1) using a hash of the id and the seed, so that a business is always assigned the same way for the same seed. """
+    if isinstance(business_id, unicode):
+        business_id = business_id.encode('utf-8')
+    digest = hashlib.md5("%s:%s" % (seed, business_id)).hexdigest()
+    return int(digest[:15], 16) / float(16 ** 15)
+
+
+def _route_reviews_by_business(input_path, output_paths, assign):
+    """ Streams the reviews in input_path to output_paths in a single pass.  assign maps a business_id to the index of its output file.  Lines are copied unchanged.  Returns the number of reviews written to each file. """
+    counts = [0] * len(output_paths)
+    output_files = [open(output_path, 'w+') for output_path in output_paths]
+    try:
+        with open(input_path) as input_file:
+            for line in input_file:
+                if not line.strip(): continue
+                output = assign(_string_field(line, _BUSINESS_ID_PATTERN, "business_id"))
+                output_files[output].write(line)
+                counts[output] += 1
+    finally:
+        for output_file in output_files:
+            output_file.close()
+    return counts
+
+
+def stream_split_data_by_business(train_ratio_of_total = 0.5, seed = 0, input_path = "./reviews.json", train_path = "./train_reviews.json", test_path = "./test_reviews.json", store_path = None):
+    """ Streaming counterpart of split_data_by_business.  Each business is assigned to the training or test set by a seeded hash of its business_id, and each review is routed to its output file in one pass with bounded memory.  The split is reproducible for a given seed.  If store_path is given, the reviews are also written to a review store there, streamed from input_path, with the split recorded as its "train" and "test" subsets. """
+    def assign(business_id):
+        if _business_hash_fraction(business_id, seed) < train_ratio_of_total:
+            return 0
+        return 1
+    with instrument.span("split") as split_span:
+        train_count, test_count = _route_reviews_by_business(input_path, [train_path, test_path], assign)
+        split_span.items = train_count + test_count
+    print "Split reviews into training and test sets:", train_count, test_count
+    with instrument.span("filter_users") as filter_span:
+        filter_span.items = filter_users(review_paths = (train_path, test_path))
+    if store_path is not None:
+        with instrument.span("review_store", train_count + test_count):
+            readyelp.write_review_store(readyelp.iter_records(input_path), store_path)
+            store = reviewstore.ReviewStore(store_path)
+            store.write_subset("train", _read_review_ids(train_path), pipeline.file_digest(train_path))
+            store.write_subset("test", _read_review_ids(test_path), pipeline.file_digest(test_path))
+    return train_count, test_count
+
+
+def stream_kfold_split_by_business(num_folds, seed = 0, input_path = "./reviews.json", output_pattern = "./fold_%d_reviews.json"):
+    """ Splits the reviews in input_path into num_folds files such that all reviews of a business end up in the same fold, using the same seeded hash as stream_split_data_by_business.  Returns the list of fold paths. """
+    fold_paths = [output_pattern % fold for fold in range(num_folds)]
+    def assign(business_id):
+        return int(_business_hash_fraction(business_id, seed) * num_folds)
+    counts = _route_reviews_by_business(input_path, fold_paths, assign)
+    print "Reviews per fold:", counts
+    return fold_paths
 
 
 def business_reviews_dict(reviews):
@@ -76,32 +154,109 @@ def business_reviews_dict(reviews):
 
 
 
-def filter_users():
-    """ Removes from the set of users any users that do not have reviews in either the training or test datasets. """
-    user_dict = readyelp.read_users_to_dict("./users.json")
-    train_reviews = readyelp.read_reviews_to_dict("./train_reviews.json")
-    test_reviews = readyelp.read_reviews_to_dict("./test_reviews.json")
+def _field_pattern(field):
+    return re.compile(r'"%s":\s*"([^"\\]*)"' % field)
 
-    users_limited = []
+_REVIEW_ID_PATTERN = _field_pattern("review_id")
+_USER_ID_PATTERN = _field_pattern("user_id")
+_BUSINESS_ID_PATTERN = _field_pattern("business_id")
+
+
+def _string_field(line, pattern, field):
+    """ Returns the value of a top level string field of the json object on line.  A regular expression is tried first so that long review text is not decoded, and json is used when the value contains escapes. """
+    match = pattern.search(line)
+    if match is not None:
+        return match.group(1)
+    return json.loads(line)[field]
+
+
+def _read_review_authors(review_paths):
+    """ Returns the set of review_id's and the set of user_id's of their authors found in the review files at review_paths. """
+    review_ids = set()
+    user_ids = set()
+    for review_path in review_paths:
+        with open(review_path) as review_file:
+            for line in review_file:
+                if not line.strip(): continue
+                review_ids.add(_string_field(line, _REVIEW_ID_PATTERN, "review_id"))
+                user_ids.add(_string_field(line, _USER_ID_PATTERN, "user_id"))
+    return review_ids, user_ids
 
-    for user_id in user_dict:
-        user = user_dict[user_id]
-        user_review_list = user["reviews"]
-        for review_id in user_review_list:
-            if review_id not in train_reviews and review_id not in test_reviews:
-                user_review_list.remove(review_id)
-        if len(user_review_list) > 0:
-            user["reviews"] = user_review_list
-            users_limited.append(user)
 
-    readyelp.write_output(users_limited, "./users.json")
+def _read_review_ids(review_path):
+    """ Returns the review_id's of the review file at review_path in file order. """
+    with open(review_path) as review_file:
+        return [_string_field(line, _REVIEW_ID_PATTERN, "review_id") for line in review_file if line.strip()]
 
 
-def find_influencers(review, review_dict, user_dict):
-    """ Given a review, returns a list of reviews of the same business created by friends of the user who created the given review.  These reviews are thought to influence the sentiment of the given review. """
+def filter_users(users_path = "./users.json", review_paths = ("./train_reviews.json", "./test_reviews.json"), output_path = "./users_limited.json", review_ids = None):
+    """ Removes from the set of users any users that do not have reviews in either the training or test datasets, prunes each user's review list to those reviews, and drops friends that were removed.  The surviving review_id's are read from review_paths unless given as the set review_ids.  Users are streamed from users_path to output_path and only id sets are held in memory.  Returns the number of users written. """
+    if review_ids is None:
+        review_ids, authors = _read_review_authors(review_paths)
+        # When review lists were built from the same reviews, as readyelp does, the users listed in users_path that wrote a surviving review are exactly the users that survive, so friends can be checked against this set before the users are read.
+        with open(users_path) as users_file:
+            surviving_users = set(_string_field(line, _USER_ID_PATTERN, "user_id") for line in users_file if line.strip())
+        surviving_users &= authors
+    else:
+        surviving_users = set()
+        with open(users_path) as users_file:
+            for line in users_file:
+                if not line.strip(): continue
+                user = json.loads(line)
+                if any(review_id in review_ids for review_id in user["reviews"]):
+                    surviving_users.add(user["user_id"])
+
+    written = 0
+    with open(users_path) as users_file:
+        with open(output_path, 'w+') as output_file:
+            for line in users_file:
+                if not line.strip(): continue
+                user = json.loads(line)
+                user_reviews = [review_id for review_id in user["reviews"] if review_id in review_ids]
+                if not user_reviews: continue
+                user["reviews"] = user_reviews
+                user["friends"] = [friend_id for friend_id in user["friends"] if friend_id in surviving_users]
+                output_file.write(json.dumps(user))
+                output_file.write('\n')
+                written += 1
+    return written
+
+
+def business_reviewers_index(review_dict, user_dict):
+    """ Builds, in one pass over the users' review lists, a dictionary mapping each business_id to a dictionary from user_id to that user's reviews of the business.  Reviews are stored as (review_id, date) tuples in the order of the user's review list, and reviews not in review_dict are skipped. """
+    index = {}
+    for user_id in user_dict:
+        for review_id in user_dict[user_id]["reviews"]:
+            if review_id not in review_dict: continue
+            review = review_dict[review_id]
+            business_id = review["business_id"]
+            if business_id not in index:
+                index[business_id] = {}
+            reviewers = index[business_id]
+            if user_id in reviewers:
+                reviewers[user_id].append((review_id, review["date"]))
+            else:
+                reviewers[user_id] = [(review_id, review["date"])]
+    return index
+
+
+def find_influencers(review, review_dict, user_dict, index = None, earlier_only = False, window_days = None, max_influencers = None, temporal_index = None):
+    """ Given a review, returns a list of reviews of the same business created by friends of the user who created the given review.  These reviews are thought to influence the sentiment of the given review.  If index (as built by business_reviewers_index) is given, the friend list is intersected with the reviewers of the business instead of scanning every friend's reviews.  If earlier_only is True, only reviews dated strictly before the given review are returned.  If window_days or max_influencers is given, only friends' reviews dated on or before the given review are returned, oldest first: those at most window_days days older than it, and only the most recent max_influencers of them.  These are found by binary search in temporal_index, a temporalindex.TemporalIndex of review_dict, which is built for the call when not given. """
     influencers = []
     user = user_dict[review["user_id"]]
     friend_list = user["friends"]
+    if window_days is not None or max_influencers is not None:
+        if temporal_index is None:
+            temporal_index = temporalindex.TemporalIndex(review_dict, user_dict)
+        return temporal_index.friend_reviews(review["business_id"], friend_list, review["date"], window_days, max_influencers, earlier_only)
+    if index is not None:
+        business_reviewers = index.get(review["business_id"], {})
+        for friend_id in friend_list:
+            if friend_id not in business_reviewers: continue
+            for friend_review_id, friend_review_date in business_reviewers[friend_id]:
+                if earlier_only and friend_review_date >= review["date"]: continue
+                influencers.append(friend_review_id)
+        return influencers
     for friend_id in friend_list:
         friend = user_dict[friend_id]
         friend_review_list = friend["reviews"]
@@ -109,22 +264,15 @@ def find_influencers(review, review_dict, user_dict):
             if friend_review_id not in review_dict: continue
             friend_review = review_dict[friend_review_id]
             if friend_review["business_id"] == review["business_id"]:
+                if earlier_only and friend_review["date"] >= review["date"]: continue
                 influencers.append(friend_review_id)
     return influencers
 
 
 def median_date(review_dict):
-    review_dates = []
-    for review_id in review_dict:
-        review = review_dict[review_id]
-        review_dates.append(review["date"])
-    return review_dates[len(review_dates) / 2]
-
-
-def _convert_review_date(date_string):
-    """ Converts the string representation of a date to a python date object. """
-    review_date = datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
-    return review_date
+    """ Returns the median date string of the reviews in review_dict, the date at position len(review_dict) / 2 in date order, selected in linear time. """
+    days = [temporalindex.date_ordinal(review_dict[review_id]["date"]) for review_id in review_dict]
+    return temporalindex.ordinal_date_string(temporalindex.quantile_days(days, [0.5])[0])
 
 
 def _convert_star_rating_to_binary_klass(star_rating):
@@ -145,113 +293,140 @@ def _convert_star_rating_to_three_klass(star_rating):
         return "neutral"
 
 
-def clean_review_dict(review_dict, user_dict):
-    """ Removes reviews created by users not in user_dict, standardizes star ratings to their appropriate klass, standardizes review date to python date object, and adds to each review a list of prior reviews of the same business by friends of the user. """
+def clean_review_dict(review_dict, user_dict, earlier_only = False, output_path = "./reviews.json", window_days = None, max_influencers = None):
+    """ Removes reviews created by users not in user_dict, standardizes star ratings to their appropriate klass, and adds to each review a list of reviews of the same business by friends of the user.  If earlier_only is True, that list is restricted to reviews dated strictly before the review.  window_days and max_influencers restrict it further to recent earlier reviews as in find_influencers, using a temporal index built once for the whole dictionary.  The cleaned reviews are written to output_path. """
     ids_to_remove_from_reviews = []
     to_write_to_file = []
-    for review_id in review_dict:
-        review = review_dict[review_id]
-        review["rating"] = _convert_star_rating_to_binary_klass(review["rating"])
-        review_date_string = _convert_review_date(review["date"])
-        if review["user_id"] not in user_dict:
-            ids_to_remove_from_reviews.append(review_id)
-        else:
-            friend_reviews_of_business = find_influencers(review, review_dict, user_dict)
-            if len(friend_reviews_of_business) == 0:
+    index = None
+    temporal_index = None
+    if window_days is None and max_influencers is None:
+        with instrument.span("business_index", len(review_dict)):
+            index = business_reviewers_index(review_dict, user_dict)
+    else:
+        with instrument.span("temporal_index", len(review_dict)):
+            temporal_index = temporalindex.TemporalIndex(review_dict, user_dict)
+    with instrument.span("influencer_search", len(review_dict)):
+        for review_id in review_dict:
+            review = review_dict[review_id]
+            review["rating"] = _convert_star_rating_to_binary_klass(review["rating"])
+            if review["user_id"] not in user_dict:
                 ids_to_remove_from_reviews.append(review_id)
             else:
-                review["friend_reviews_of_business"] = friend_reviews_of_business
-                review_dict[review_id] = review
-                to_write_to_file.append(review)
-    for review_id in ids_to_remove_from_reviews:
-        del review_dict[review_id]
-    readyelp.write_output(to_write_to_file, "./reviews.json")
-
-
-def _user_reviews_by_business(review_ids, review_dict):
-    """ Returns a dictionary mapping a business_id to a review_id. """
-    review_dict_by_business = {}
-    for r_id in review_ids:
-        if r_id not in review_dict: continue
-        review = review_dict[r_id]
-        review_dict_by_business[review["business_id"]] = r_id
-    return review_dict_by_business
-
-
-def find_review_pairs_by_friends(user_dict, review_dict):
-    """ Returns a set of pairs of review_id's where a pair of friends reviewed the same business. """
-    common_review_pairs = set()
-    for user_id in user_dict:
-        user = user_dict[user_id]
-        user_friends = user["friends"]
-        user_reviews = user["reviews"]
-        user_businesses = _user_reviews_by_business(user_reviews, review_dict)
-        for friend_id in user_friends:
-            friend = user_dict[friend_id]
-            friend_reviews = friend["reviews"]
-            friend_businesses = _user_reviews_by_business(friend_reviews, review_dict)
-            for business_id in friend_businesses:
-                # Identify whether the friend reviewed any of the same businesses as the user and add review_id's to set.
-                if business_id in user_businesses:
-                    friend_review_id = friend_businesses[business_id]
-                    friend_review = review_dict[friend_review_id]
-                    user_review_id = user_businesses[business_id]
-                    user_review = review_dict[user_review_id]
-                    if user_review["date"] > friend_review["date"]:
-                        common_review_pairs.add((user_review_id, friend_review_id))
-                    elif user_review["date"] == friend_review["date"] and user_review_id > friend_review_id:
-                        common_review_pairs.add((user_review_id, friend_review_id))
+                friend_reviews_of_business = find_influencers(review, review_dict, user_dict, index, earlier_only, window_days, max_influencers, temporal_index)
+                if len(friend_reviews_of_business) == 0:
+                    ids_to_remove_from_reviews.append(review_id)
+                else:
+                    review["friend_reviews_of_business"] = friend_reviews_of_business
+                    review_dict[review_id] = review
+                    to_write_to_file.append(review)
+        for review_id in ids_to_remove_from_reviews:
+            del review_dict[review_id]
+    with instrument.span("write_reviews", len(to_write_to_file)):
+        readyelp.write_output(to_write_to_file, output_path)
+
+
+def later_earlier_pair(user_review, friend_review):
+    """ Given (review_id, date) tuples for a user's review and a friend's review of the same business, returns the pair (user_review_id, friend_review_id) if the user's review is the later one, breaking date ties by review_id, and None otherwise. """
+    if user_review[1] > friend_review[1]:
+        return (user_review[0], friend_review[0])
+    elif user_review[1] == friend_review[1] and user_review[0] > friend_review[0]:
+        return (user_review[0], friend_review[0])
+    return None
+
+
+def _business_friend_pairs(business_ids):
+    """ Pair join worker.  For each business, emits the ordered pairs of reviews whose authors are friends. """
+    index, friend_sets, pair_order = _pair_join_state
+    pairs = []
+    for business_id in business_ids:
+        reviewers = index[business_id]
+        if len(reviewers) < 2: continue
+        for user_id in reviewers:
+            friends = friend_sets.get(user_id)
+            if not friends: continue
+            # An author's last review of the business stands for the author.
+            user_review = reviewers[user_id][-1]
+            if len(friends) < len(reviewers):
+                friends_of_business = [friend_id for friend_id in friends if friend_id in reviewers]
+            else:
+                friends_of_business = [friend_id for friend_id in reviewers if friend_id in friends]
+            for friend_id in friends_of_business:
+                pair = pair_order(user_review, reviewers[friend_id][-1])
+                if pair is not None:
+                    pairs.append(pair)
+    return pairs
+
+
+def find_review_pairs_by_friends(user_dict, review_dict, processes = 1, pair_order = later_earlier_pair):
+    """ Returns a set of pairs of review_id's where a pair of friends reviewed the same business.  Reviews are grouped by business once and, for each business, only author pairs that are friends are joined.  pair_order decides the order of each pair and defaults to (later, earlier).  With processes > 1 the businesses are split into shards joined on a process pool. """
+    global _pair_join_state
+    start_time = time.time()
+    with instrument.span("pair_join") as join_span:
+        index = business_reviewers_index(review_dict, user_dict)
+        friend_sets = {}
+        for business_id in index:
+            for user_id in index[business_id]:
+                if user_id not in friend_sets:
+                    friend_sets[user_id] = set(user_dict[user_id]["friends"])
+
+        business_ids = index.keys()
+        _pair_join_state = (index, friend_sets, pair_order)
+        try:
+            if processes == 1:
+                pair_lists = [_business_friend_pairs(business_ids)]
+            else:
+                num_shards = processes * 4
+                shards = [business_ids[i::num_shards] for i in range(num_shards)]
+                pool = multiprocessing.Pool(processes)
+                try:
+                    pair_lists = pool.map(_business_friend_pairs, shards)
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            _pair_join_state = None
+
+        common_review_pairs = set()
+        for pairs in pair_lists:
+            common_review_pairs.update(pairs)
+        join_span.items = len(common_review_pairs)
+    elapsed = max(time.time() - start_time, 1e-9)
+    print "Joined %d friend review pairs over %d businesses in %.2fs: %.0f pairs/s" % (len(common_review_pairs), len(business_ids), elapsed, len(common_review_pairs) / elapsed)
     return common_review_pairs
 
 
 def klass_counts(review_dict, klass_list):
-    counts = {"total" : 0}
-    for klass in klass_list:
-        counts[klass] = 0.0
+    """ Returns a dictionary of the number of reviews in review_dict of each klass, with the total under "total", as counted by reviewstats.ReviewStats. """
+    stats = reviewstats.ReviewStats()
     for review_id in review_dict:
-        counts["total"] += 1
-        review = review_dict[review_id]
-        counts[review["rating"]] += 1
+        stats.add_review(review_dict[review_id]["rating"])
+    counts = {"total" : stats.num_reviews}
+    for klass in klass_list:
+        counts[klass] = float(stats.klass_counts[klass])
     return counts
 
 
 def _homophily_counts(review_pairs, review_dict, klass_list):
-    """ Counts instances of homophily in pairs of reviews, for each class.  Homophily is used here to mean that the later review shares the sentiment of the earlier review. """
-    raw_counts = {}
-    homophily_counts = {}
-    total = 0
-    for klass in klass_list:
-        raw_counts[klass] = 0.0
-        homophily_counts[klass] = 0.0
+    """ Counts instances of homophily in pairs of reviews, for each class.  Homophily is used here to mean that the later review shares the sentiment of the earlier review.  The counts are those of reviewstats.ReviewStats. """
+    stats = reviewstats.ReviewStats()
     for review_tuple in review_pairs:
-        total += 1
-        first_review = review_dict[review_tuple[0]]
-        second_review = review_dict[review_tuple[1]]
-        raw_counts[first_review["rating"]] += 1
-        if first_review["rating"] == second_review["rating"]:
-            homophily_counts[first_review["rating"]] += 1
+        stats.add_pair(review_dict[review_tuple[0]]["rating"], review_dict[review_tuple[1]]["rating"])
     for klass in klass_list:
-        print klass + " proportion of total, homophily proportion:", (raw_counts[klass]/total), (homophily_counts[klass] / raw_counts[klass])
+        print klass + " proportion of total, homophily proportion:", stats.pair_proportion(klass), stats.homophily(klass)
 
 
 def main():
-    """ Invoking cleanyelp.py will output basic statistics from the yelp data. """
-    user_dict = readyelp.read_users_to_dict("./users.json")
-    print "Total number of users with friends:", len(user_dict)
-
-    review_dict = readyelp.read_reviews_to_dict("./train_reviews.json")
-    # clean_review_dict(review_dict, user_dict)
-    print "Total number of reviews from these users:", len(review_dict)
-
-    common_review_pairs = find_review_pairs_by_friends(user_dict, review_dict)
-    print "Total number of friend review pairs of the same business:", len(common_review_pairs)
-
-
+    """ Invoking cleanyelp.py will output basic statistics from the yelp data.  The statistics are computed in a single streaming pass over the training reviews sorted by business; see reviewstats. """
     klass_list = ["negative", "positive"]
-    raw_counts = klass_counts(review_dict, klass_list)
+    stats = reviewstats.compute_review_statistics("./train_reviews.json", "./users.json")
+    print "Total number of users with friends:", stats.num_users
+    print "Total number of reviews from these users:", stats.num_reviews
+    print "Total number of friend review pairs of the same business:", stats.num_pairs
+
+    for klass in klass_list:
+        print "Total reviews with " + klass + " sentiment:", stats.klass_counts[klass]
     for klass in klass_list:
-        print "Total reviews with " + klass + " sentiment:", raw_counts[klass]
-    _homophily_counts(common_review_pairs, review_dict, klass_list)
+        print klass + " proportion of total, homophily proportion:", stats.pair_proportion(klass), stats.homophily(klass)
 
 
 if __name__ == "__main__":
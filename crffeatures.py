@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+""" Compact features for the review pair CRF.  Each review is reduced to hashed indicators for its most frequent terms, counts of positive and negative lexicon words, and a bucket for its author's number of friends.  The later review of a pair also carries a bucket for the number of days between the two reviews.  Review features are cached by review_id, so a review is featurised once however many pairs it appears in. """
+
+import re
+import math
+import zlib
+import collections
+import temporalindex
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+TOKEN_PATTERN = re.compile(r"[a-z][a-z']+")
+
+POSITIVE_WORDS = frozenset(["amazing", "awesome", "best", "delicious", "excellent", "fantastic", "favorite", "fresh", "friendly", "good", "great", "happy", "love", "loved", "nice", "perfect", "recommend", "tasty", "wonderful", "yummy"])
+
+NEGATIVE_WORDS = frozenset(["awful", "bad", "bland", "cold", "dirty", "disappointed", "disappointing", "gross", "horrible", "mediocre", "overpriced", "poor", "rude", "slow", "terrible", "worst", "wrong", "greasy", "inedible", "stale"])
+
+
+def _bucket(value):
+    """ Returns a logarithmic bucket for a non-negative count, so that 0, 1, 2-3, 4-7, ... fall into separate buckets. """
+    if value <= 0:
+        return 0
+    return int(math.log(value, 2)) + 1
+
+
+class PairFeatureExtractor(object):
+    """ Builds CRF items for pairs of reviews, caching the features of each review by its review_id. """
+
+    def __init__(self, user_dict, top_k = 10, num_buckets = 2 ** 18):
+        self.user_dict = user_dict
+        self.top_k = top_k
+        self.num_buckets = num_buckets
+        self.cache = {}
+
+    def config(self):
+        """ Returns a dictionary describing the features this extractor builds, for telling apart models trained on different features. """
+        lexicon = "\n".join(sorted(POSITIVE_WORDS)) + "\n\n" + "\n".join(sorted(NEGATIVE_WORDS))
+        return {"top_k" : self.top_k, "num_buckets" : self.num_buckets, "lexicon" : "%08x" % (zlib.crc32(lexicon) & 0xffffffff)}
+
+    def _term_feature(self, term):
+        if isinstance(term, unicode):
+            term = term.encode('utf-8')
+        return "w%d" % ((zlib.crc32(term) & 0xffffffff) % self.num_buckets)
+
+    def review_features(self, review_id, review):
+        """ Returns the feature dictionary of a review, computing it on first use. """
+        if review_id in self.cache:
+            return self.cache[review_id]
+        tokens = [token for token in TOKEN_PATTERN.findall(review["text"].lower()) if token not in ENGLISH_STOP_WORDS]
+        counts = collections.Counter(tokens)
+        features = {}
+        for term, count in counts.most_common(self.top_k):
+            features[self._term_feature(term)] = 1.0
+        features["positive_words"] = float(sum(counts[term] for term in POSITIVE_WORDS if term in counts))
+        features["negative_words"] = float(sum(counts[term] for term in NEGATIVE_WORDS if term in counts))
+        # An author without a user record, such as one filtered out of users_limited.json, counts as having no friends.
+        num_friends = 0
+        if review["user_id"] in self.user_dict:
+            num_friends = len(self.user_dict[review["user_id"]]["friends"])
+        features["friends_%d" % _bucket(num_friends)] = 1.0
+        self.cache[review_id] = features
+        return features
+
+    def pair_xseq(self, earlier_id, earlier_review, later_id, later_review):
+        """ Returns the CRF item sequence for a pair of reviews, the earlier review first.  The later item adds the bucketed gap in days between the two reviews. """
+        earlier_item = self.review_features(earlier_id, earlier_review)
+        later_item = dict(self.review_features(later_id, later_review))
+        gap = temporalindex.date_ordinal(later_review["date"]) - temporalindex.date_ordinal(earlier_review["date"])
+        later_item["gap_%d" % _bucket(gap)] = 1.0
+        return [earlier_item, later_item]
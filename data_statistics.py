@@ -1,7 +1,8 @@
 #!/usr/bin/env/ python
 
-from parse_yelp_json import read_users_to_dict, read_reviews_to_dict
 import datetime
+import cleanyelp
+import reviewstats
 
 klass_list = ["positive", "negative", "neutral"]
 
@@ -28,14 +29,6 @@ def convert_star_ratings_to_binary(review_dict):
         review_dict[review_id] = review
 
 
-def user_reviews_by_business(review_ids, review_dict):
-    """Returns a dictionary mapping business_id's to reviews."""
-    review_dict_by_business = {}
-    for r_id in review_ids:
-        review = review_dict[r_id]
-        review_dict_by_business[review["business_id"]] = r_id
-    return review_dict_by_business
-
 def remove_reviews_from_users_without_friends(review_dict, user_dict):
     to_remove_from_reviews = []
     for review_id in review_dict:
@@ -45,66 +38,42 @@ def remove_reviews_from_users_without_friends(review_dict, user_dict):
     for review_id in to_remove_from_reviews:
         del review_dict[review_id]
 
-def find_review_pairs_by_friends(user_dict, review_dict):
+def earlier_later_pair(user_review, friend_review):
+    """Given (review_id, date) tuples for a user's review and a friend's review of the same business, returns the pair (user_review_id, friend_review_id) if the user's review is earlier or on the same date, and None otherwise."""
+    if user_review[1] <= friend_review[1]:
+        return (user_review[0], friend_review[0])
+    return None
+
+def find_review_pairs_by_friends(user_dict, review_dict, processes = 1):
     """Returns a set of pairs of review_id's where a pair of friends reviewed the same business."""
-    friend_review_pairs = set()
-    for user_id in user_dict:
-        user = user_dict[user_id]
-        user_friends = user["friends"]
-        user_reviews = user["reviews"]
-        user_businesses = user_reviews_by_business(user_reviews, review_dict)
-        # Iterate through a user's friends
-        for friend_id in user_friends:
-            friend = user_dict[friend_id]
-            friend_reviews = friend["reviews"]
-            friend_businesses = user_reviews_by_business(friend_reviews, review_dict)
-            # Iterate through the businesses reviewed by that friend
-            for business_id in friend_businesses:
-                # Identify whether the friend reviewed any of the same businesses as the user and add review_id's to set
-                if business_id in user_businesses:
-                    friend_review_id = friend_businesses[business_id]
-                    friend_review = review_dict[friend_review_id]
-                    user_review_id = user_businesses[business_id]
-                    user_review = review_dict[user_review_id]
-                    # First review in tuple is always earlier or on the same date as the second
-                    if (user_review["date"] <= friend_review["date"]):
-                        friend_review_pairs.add((user_review_id, friend_review_id))
-    return friend_review_pairs
+    # First review in tuple is always earlier or on the same date as the second
+    return cleanyelp.find_review_pairs_by_friends(user_dict, review_dict, processes, earlier_later_pair)
 
 def klass_counts(review_pairs, review_dict):
-    # Initialize both raw and homophily counts to 0 for each class
-    raw_counts = {}
-    homophily_counts = {}
-    total = 0
-    for klass in klass_list:
-        raw_counts[klass] = 0.0
-        homophily_counts[klass] = 0.0
-    # Update counts from review pairs
+    """ Prints the proportion of review_pairs whose first review has each class and their homophily, as counted by reviewstats.ReviewStats. """
+    stats = reviewstats.ReviewStats()
     for review_tuple in review_pairs:
-        total += 1
-        first_review = review_dict[review_tuple[0]]
-        second_review = review_dict[review_tuple[1]]
-        raw_counts[first_review["stars"]] += 1
-        if first_review["stars"] == second_review["stars"]:
-            homophily_counts[first_review["stars"]] += 1
-    # Print counts
+        stats.add_pair(review_dict[review_tuple[0]]["stars"], review_dict[review_tuple[1]]["stars"])
     for klass in klass_list:
-        print klass + " raw count and homophily: ", (raw_counts[klass]/total), (homophily_counts[klass] / raw_counts[klass])
-
-def main():
-    user_dict = read_users_to_dict("./users.json")
-    print "Total number of users with friends is ", len(user_dict)
-
-    review_dict = read_reviews_to_dict("./reviews.json")
-    remove_reviews_from_users_without_friends(review_dict, user_dict)
-    convert_review_dates(review_dict)
-    convert_star_ratings_to_binary(review_dict)
-    print "Total number of reviews from these users is ", len(review_dict)
+        print klass + " raw count and homophily: ", stats.pair_proportion(klass), stats.homophily(klass)
 
-    friend_review_pairs = find_review_pairs_by_friends(user_dict, review_dict)
-    print "Total number of friend review pairs of the same business ", len(friend_review_pairs)
+def three_klass(review):
+    """ Returns 'negative' for a review with fewer than 3 stars, 'positive' for more than 3 stars and 'neutral' otherwise. """
+    stars = review.get("stars", review.get("rating"))
+    if stars < 3:
+        return "negative"
+    elif stars > 3:
+        return "positive"
+    return "neutral"
 
-    klass_counts(friend_review_pairs, review_dict)
+def main():
+    """ Prints the class counts and homophily of friend review pairs, computed in a single streaming pass over the reviews sorted by business.  Only reviews by users in users.json are counted. """
+    stats = reviewstats.compute_review_statistics("./reviews.json", "./users.json", three_klass, earlier_later_pair, known_users_only = True)
+    print "Total number of users with friends is ", stats.num_users
+    print "Total number of reviews from these users is ", stats.num_reviews
+    print "Total number of friend review pairs of the same business ", stats.num_pairs
+    for klass in klass_list:
+        print klass + " raw count and homophily: ", stats.pair_proportion(klass), stats.homophily(klass)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
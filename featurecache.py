@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+""" A persistent cache of bag-of-words feature matrices.  Entries are keyed by a hash of the training and test corpora and the vectorizer configuration, and hold the fitted vocabulary and the sparse train and test matrices, so that repeated experiments on the same data skip tokenisation. """
+
+import os
+import json
+import time
+import hashlib
+import scipy.sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+
+def _hash_corpus(digest, corpus):
+    digest.update("%d\n" % len(corpus))
+    for document in corpus:
+        if isinstance(document, unicode):
+            document = document.encode('utf-8')
+        digest.update("%d:" % len(document))
+        digest.update(document)
+
+
+class FeatureCache(object):
+    """ Caches the output of CountVectorizer on disk in cache_dir and counts cache hits and misses. """
+
+    def __init__(self, cache_dir = "./feature_cache"):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def key(self, train_corpus, test_corpus, vectorizer_params):
+        """ Returns the cache key for a pair of corpora and a vectorizer configuration. """
+        digest = hashlib.sha1()
+        digest.update(json.dumps(vectorizer_params, sort_keys = True))
+        _hash_corpus(digest, train_corpus)
+        _hash_corpus(digest, test_corpus)
+        return digest.hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def vectorize(self, train_corpus, test_corpus, vectorizer_params = None):
+        """ Returns (X_train, X_test, vocabulary) for the given corpora, as CountVectorizer(**vectorizer_params) would produce them with fit_transform on train_corpus and transform on test_corpus.  Results are read from the cache when present and written to it otherwise. """
+        if vectorizer_params is None:
+            vectorizer_params = {"stop_words" : "english"}
+        key = self.key(train_corpus, test_corpus, vectorizer_params)
+        meta_path = self._path(key, ".json")
+
+        if os.path.exists(meta_path):
+            start = time.time()
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            X_train = scipy.sparse.load_npz(self._path(key, "_train.npz"))
+            X_test = scipy.sparse.load_npz(self._path(key, "_test.npz"))
+            self.hits += 1
+            self.seconds_saved += meta["seconds"] - (time.time() - start)
+            return X_train, X_test, meta["vocabulary"]
+
+        start = time.time()
+        vectorizer = CountVectorizer(**vectorizer_params)
+        X_train = vectorizer.fit_transform(train_corpus)
+        X_test = vectorizer.transform(test_corpus)
+        seconds = time.time() - start
+        self.misses += 1
+
+        vocabulary = dict((term, int(column)) for term, column in vectorizer.vocabulary_.iteritems())
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        scipy.sparse.save_npz(self._path(key, "_train.npz"), X_train.tocsr())
+        scipy.sparse.save_npz(self._path(key, "_test.npz"), X_test.tocsr())
+        # The metadata file is written last and marks the entry as complete.
+        with open(meta_path, 'w') as meta_file:
+            json.dump({"params" : vectorizer_params, "seconds" : seconds, "vocabulary" : vocabulary}, meta_file)
+        return X_train, X_test, vocabulary
+
+    def report(self):
+        print "Feature cache hits, misses:", self.hits, self.misses
+        print "Feature cache time saved: %.2fs" % self.seconds_saved
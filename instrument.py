@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+""" Timing, memory and throughput instrumentation.  Code under measurement opens a span around each stage or sub-step; spans nest, so a span opened inside another is recorded under the path "outer/inner".  Each span records its wall time, the item count set on it and the resulting throughput, and the peak resident set size of the process when it closed.  Spans are only recorded once enable has been called, so that library code may open spans freely in long-running processes; entry points that write a report enable recording first.  The spans of a run are collected by this module and written as a JSON report with write_report.  Spans are only recorded in the process that opens them, so work done in pool workers is timed by the span around the pool in the parent. """
+
+import os
+import re
+import sys
+import json
+import time
+import datetime
+import resource
+import cProfile
+import contextlib
+
+# Closed spans of this run, in the order they closed.
+_spans = []
+# Spans currently open, outermost first.
+_stack = []
+_profile_dir = None
+_enabled = False
+
+
+class Span(object):
+    """ An open span.  Set items to the number of items processed (reviews, pairs, edges, ...) to have the throughput reported. """
+
+    def __init__(self, name, path, items = None):
+        self.name = name
+        self.path = path
+        self.items = items
+
+
+def _peak_rss_kb():
+    """ Returns the peak resident set size of this process in kilobytes. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on OS X and in kilobytes elsewhere.
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+def _children_peak_rss_kb():
+    """ Returns the largest peak resident set size of the finished child processes in kilobytes. """
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+
+def enable(enabled = True):
+    """ Starts recording spans, or stops if enabled is False.  While recording is off, span only yields a Span and nothing is kept. """
+    global _enabled
+    _enabled = enabled
+
+
+def enable_profiling(profile_dir = "./profiles"):
+    """ Runs cProfile under every outermost span from now on and dumps its statistics to profile_dir/<span name>.prof, for reading with pstats or snakeviz, and enables recording.  Pass None to stop profiling. """
+    global _profile_dir
+    if profile_dir is not None:
+        enable()
+    if profile_dir is not None and not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    _profile_dir = profile_dir
+
+
+@contextlib.contextmanager
+def span(name, items = None):
+    """ Times the enclosed block as a span called name and yields the Span, whose items may be set inside the block.  Nothing is recorded unless enable has been called. """
+    if not _enabled:
+        yield Span(name, name, items)
+        return
+    path = "/".join([open_span.name for open_span in _stack] + [name])
+    current = Span(name, path, items)
+    profiler = None
+    # Only one profiler can be active at a time, so nested spans are covered by their outermost span's profile.
+    if _profile_dir is not None and not _stack:
+        profiler = cProfile.Profile()
+    _stack.append(current)
+    peak_at_start = _peak_rss_kb()
+    start = time.time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield current
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        seconds = time.time() - start
+        _stack.pop()
+        peak = _peak_rss_kb()
+        record = {"name" : name, "path" : path, "depth" : len(_stack), "start" : start, "seconds" : seconds, "peak_rss_kb" : peak, "peak_rss_growth_kb" : peak - peak_at_start, "children_peak_rss_kb" : _children_peak_rss_kb()}
+        if current.items is not None:
+            record["items"] = current.items
+            record["items_per_second"] = current.items / max(seconds, 1e-9)
+        if profiler is not None:
+            record["profile"] = os.path.join(_profile_dir, "%s.prof" % re.sub(r"[^\w.-]", "_", name))
+            profiler.dump_stats(record["profile"])
+        _spans.append(record)
+
+
+def spans():
+    """ Returns the records of the spans closed so far. """
+    return list(_spans)
+
+
+def totals():
+    """ Returns a dictionary mapping each span path to its number of calls, total seconds and total items. """
+    result = {}
+    for record in _spans:
+        total = result.setdefault(record["path"], {"calls" : 0, "seconds" : 0.0, "items" : 0, "peak_rss_kb" : 0})
+        total["calls"] += 1
+        total["seconds"] += record["seconds"]
+        total["items"] += record.get("items", 0)
+        total["peak_rss_kb"] = max(total["peak_rss_kb"], record["peak_rss_kb"])
+    return result
+
+
+def reset():
+    """ Forgets the spans recorded so far. """
+    del _spans[:]
+
+
+def report(extra = None):
+    """ Returns the report of this run as a dictionary, with any extra fields (such as the run's parameters) merged in. """
+    result = {"created" : datetime.datetime.now().isoformat(), "argv" : sys.argv, "spans" : spans(), "totals" : totals(), "peak_rss_kb" : _peak_rss_kb()}
+    if extra:
+        result.update(extra)
+    return result
+
+
+def write_report(output_path = "./instrument_report.json", extra = None):
+    """ Writes the report of this run to output_path as JSON and prints a summary of the outermost spans. """
+    run_report = report(extra)
+    with open(output_path, 'w') as output_file:
+        json.dump(run_report, output_file, indent = 2, sort_keys = True)
+    for record in run_report["spans"]:
+        if record["depth"] == 0:
+            print "%-24s %9.2fs %10d KB peak RSS" % (record["name"], record["seconds"], record["peak_rss_kb"])
+    print "Instrumentation report written to", output_path
+    return run_report
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+""" Online min-cut classification of newly arriving reviews.  The fitted bag-of-words model, the CRF tagger and the review graph of each business are kept in memory; a new review is scored, linked to the reviews of the same business by friends of its author and by users who count its author as a friend, and only the cut of the connected component of the review graph that it joins is solved again. """
+
+import pycrfsuite
+import readyelp
+import reviewcrf
+import reviewgraph
+import crffeatures
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+
+class OnlineReviewClassifier(object):
+    """ Classifies reviews one at a time, or in batches, against the reviews it has already seen. """
+
+    def __init__(self, vectorizer, clf, crf_model_path, user_dict, klass_list = None, backend = None):
+        if klass_list is None:
+            klass_list = ["negative", "positive"]
+        self.vectorizer = vectorizer
+        self.clf = clf
+        self.positive_column = list(clf.classes_).index(klass_list[1])
+        self.tagger = pycrfsuite.Tagger()
+        self.tagger.open(crf_model_path)
+        self.user_dict = user_dict
+        self.extractor = crffeatures.PairFeatureExtractor(user_dict)
+        self.klass_list = klass_list
+        self.backend = backend
+        self.reviews = {}
+        self.ind_pref = {}
+        self.classes = {}
+        # business_id -> user_id -> review_ids of that user for the business
+        self.business_reviewers = {}
+        # review_id -> the root review_id of its connected component of the review graph
+        self.component_of = {}
+        # root review_id -> (set of the component's review_ids, {(friend review_id, review_id) : pair strength})
+        self.components = {}
+        self._friend_sets = {}
+
+    @classmethod
+    def from_training(cls, train_reviews, user_dict, crf_model_path = None, backend = None):
+        """ Fits the bag-of-words classifier on train_reviews and, unless crf_model_path is given, trains the CRF with reviewcrf.train_crf_incremental.  Returns a classifier with no reviews seen yet. """
+        vectorizer = CountVectorizer(stop_words = 'english')
+        X_train = vectorizer.fit_transform([train_reviews[review_id]["text"] for review_id in train_reviews])
+        clf = MultinomialNB().fit(X_train, [train_reviews[review_id]["rating"] for review_id in train_reviews])
+        if crf_model_path is None:
+            crf_model_path = reviewcrf.train_crf_incremental(train_reviews, user_dict)
+        return cls(vectorizer, clf, crf_model_path, user_dict, backend = backend)
+
+    def _friends(self, user_id):
+        if user_id not in self._friend_sets:
+            if user_id in self.user_dict:
+                self._friend_sets[user_id] = set(self.user_dict[user_id]["friends"])
+            else:
+                self._friend_sets[user_id] = set()
+        return self._friend_sets[user_id]
+
+    def _link(self, review):
+        """ Records the influencers of a new review and adds it as an influencer of the reviews of the same business whose authors count its author as a friend.  Returns the pairs formed with the new review, oriented by reviewcrf.friend_review_pairs. """
+        review_id = review["review_id"]
+        user_id = review["user_id"]
+        reviewers = self.business_reviewers.setdefault(review["business_id"], {})
+        friends = self._friends(user_id)
+        linked = {review_id : review}
+        for reviewer_id in reviewers:
+            is_friend = reviewer_id in friends
+            is_friend_of = user_id in self._friends(reviewer_id)
+            if not is_friend and not is_friend_of: continue
+            for other_id in reviewers[reviewer_id]:
+                other = self.reviews[other_id]
+                linked[other_id] = other
+                if is_friend:
+                    review["friend_reviews_of_business"].append(other_id)
+                if is_friend_of:
+                    other["friend_reviews_of_business"].append(review_id)
+        reviewers.setdefault(user_id, []).append(review_id)
+        return [pair for pair in reviewcrf.friend_review_pairs(linked) if review_id in pair]
+
+    def _merge(self, review_id, pairs):
+        """ Makes a component of the new review, merging into it the components of the reviews it is paired with, and adds the pairs with their strengths.  Returns the root of the merged component. """
+        roots = set(self.component_of[other_id] for pair in pairs for other_id in pair if other_id != review_id)
+        if roots:
+            # The smaller components are merged into the largest, so each review changes component O(log n) times.
+            root = max(roots, key = lambda root: len(self.components[root][0]))
+        else:
+            root = review_id
+            self.components[root] = (set(), {})
+        members, pair_str = self.components[root]
+        for other_root in roots:
+            if other_root == root: continue
+            other_members, other_pair_str = self.components.pop(other_root)
+            for other_id in other_members:
+                self.component_of[other_id] = root
+            members.update(other_members)
+            pair_str.update(other_pair_str)
+        members.add(review_id)
+        self.component_of[review_id] = root
+        for pair in pairs:
+            xseq = self.extractor.pair_xseq(pair[0], self.reviews[pair[0]], pair[1], self.reviews[pair[1]])
+            pair_str[pair] = reviewcrf.score_xseq(self.tagger, xseq)[0]
+        return root
+
+    def _attach(self, reviews):
+        """ Scores the given reviews with the bag-of-words model and adds them, with their pair edges, to the review graph.  Returns the review_ids added. """
+        X = self.vectorizer.transform([review["text"] for review in reviews])
+        probabilities = self.clf.predict_proba(X)
+        added = []
+        for review, probability in zip(reviews, probabilities):
+            review_id = review["review_id"]
+            # The classifier keeps its own influencer lists, so the review is copied rather than modified.
+            review = dict(review)
+            review["friend_reviews_of_business"] = []
+            self.reviews[review_id] = review
+            self.ind_pref[review_id] = probability[self.positive_column]
+            self._merge(review_id, self._link(review))
+            added.append(review_id)
+        return added
+
+    def _solve(self, root):
+        """ Solves the cut of one component of the review graph and updates the classes of its reviews. """
+        members, pair_str = self.components[root]
+        component_reviews = dict((review_id, self.reviews[review_id]) for review_id in members)
+        ind_pref = dict((review_id, self.ind_pref[review_id]) for review_id in members)
+        classes = reviewgraph.build_graph(self.klass_list, component_reviews, ind_pref, pair_str, self.backend, verbose = False)
+        self.classes.update(classes)
+
+    def classify_new_review(self, review):
+        """ Adds a review object (with review_id, user_id, business_id, date and text) and returns its klass.  The classes of earlier reviews of the same business may change as a result; see klass_of. """
+        return self.classify_new_reviews([review])[0]
+
+    def classify_new_reviews(self, reviews):
+        """ Adds a batch of review objects and returns the klass of each, solving the cut of each component of the review graph touched once. """
+        for root in set(self.component_of[review_id] for review_id in self._attach(reviews)):
+            self._solve(root)
+        return [self.klass_of(review["review_id"]) for review in reviews]
+
+    def klass_of(self, review_id):
+        """ Returns the current klass of a review that has been added. """
+        return self.klass_list[self.classes[review_id]]
+
+
+def main():
+    train_reviews = readyelp.read_split("train")
+    test_reviews = readyelp.read_split("test")
+    user_dict = readyelp.read_users_to_dict("./users_limited.json")
+    classifier = OnlineReviewClassifier.from_training(train_reviews, user_dict)
+    reviews = sorted(test_reviews.values(), key = lambda review: review["date"])
+    Y_predict = classifier.classify_new_reviews(reviews)
+    print "Classified reviews:", len(Y_predict)
+
+
+if __name__ == "__main__":
+    main()
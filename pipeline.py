@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+""" A small stage runner with content-addressed caching.  A pipeline is a DAG of named stages.  Each stage's fingerprint is a hash of its name, its parameters, the fingerprints of the stages it depends on and the contents of its input files, and a stage is only run when no result is cached for its current fingerprint. """
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import instrument
+
+
+def file_digest(path, block_size = 1 << 20):
+    """ Returns the sha1 of the contents of the file at path. """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        while True:
+            block = input_file.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+class Stage(object):
+    """ A pipeline stage.  func is called with a dictionary of the values of the stages in deps, keyed by stage name, and with params as keyword arguments; its return value is cached.  input_files are files the stage reads that no other stage produces, and output_files are files it writes.  If returns_files is True, the stage's value is the path, or a list of the paths, of further files it wrote whose names are only known once it has run.  A cached result is only used while every output file is unchanged. """
+
+    def __init__(self, name, func, deps = (), params = None, input_files = (), output_files = (), returns_files = False):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.params = params or {}
+        self.input_files = list(input_files)
+        self.output_files = list(output_files)
+        self.returns_files = returns_files
+
+    def outputs(self, value):
+        """ Returns the paths of the files written by a run of this stage that returned value. """
+        if not self.returns_files:
+            return self.output_files
+        if isinstance(value, basestring):
+            return self.output_files + [value]
+        return self.output_files + list(value)
+
+
+class Pipeline(object):
+    """ Runs stages in dependency order, skipping stages whose results are cached in cache_dir. """
+
+    def __init__(self, cache_dir = "./pipeline_cache"):
+        self.cache_dir = cache_dir
+        self.stages = {}
+        self.order = []
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+        else:
+            self.manifest = {"stages" : {}, "files" : {}}
+
+    def add(self, stage):
+        for dep in stage.deps:
+            if dep not in self.stages:
+                raise ValueError("Stage %s depends on unknown stage %s" % (stage.name, dep))
+        self.stages[stage.name] = stage
+        self.order.append(stage.name)
+        return stage
+
+    def _save_manifest(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        with open(self.manifest_path, 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent = 2, sort_keys = True)
+
+    def _input_digest(self, path):
+        """ Returns the content hash of an input file, reusing the recorded hash while its size and modification time are unchanged. """
+        stamp = _file_stamp(path)
+        recorded = self.manifest["files"].get(path)
+        if recorded is not None and recorded["stamp"] == stamp:
+            return recorded["sha1"]
+        sha1 = file_digest(path)
+        self.manifest["files"][path] = {"stamp" : stamp, "sha1" : sha1}
+        return sha1
+
+    def _value_path(self, name, fingerprint):
+        return os.path.join(self.cache_dir, "%s-%s.pkl" % (name, fingerprint))
+
+    def fingerprint(self, name, fingerprints):
+        stage = self.stages[name]
+        digest = hashlib.sha1()
+        digest.update(name)
+        digest.update(json.dumps(stage.params, sort_keys = True))
+        for dep in stage.deps:
+            digest.update(fingerprints[dep])
+        for path in stage.input_files:
+            digest.update(path)
+            digest.update(self._input_digest(path))
+        return digest.hexdigest()
+
+    def _is_cached(self, name, fingerprint):
+        recorded = self.manifest["stages"].get(name)
+        if recorded is None or recorded["fingerprint"] != fingerprint:
+            return False
+        if not os.path.exists(self._value_path(name, fingerprint)):
+            return False
+        for path, stamp in recorded["outputs"].items():
+            if not os.path.exists(path) or _file_stamp(path) != stamp:
+                return False
+        return True
+
+    def run(self, targets = None):
+        """ Runs the stages needed for targets (by default every stage) and returns a dictionary of the values of the targets.  Prints whether each stage was run or cached. """
+        if targets is None:
+            targets = self.order
+        needed = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].deps)
+
+        fingerprints = {}
+        values = {}
+        for name in self.order:
+            if name not in needed: continue
+            stage = self.stages[name]
+            fingerprint = self.fingerprint(name, fingerprints)
+            fingerprints[name] = fingerprint
+            if self._is_cached(name, fingerprint):
+                print "Stage %s: cached" % name
+                continue
+            inputs = {}
+            for dep in stage.deps:
+                if dep not in values:
+                    with open(self._value_path(dep, fingerprints[dep]), 'rb') as value_file:
+                        values[dep] = pickle.load(value_file)
+                inputs[dep] = values[dep]
+            start = time.time()
+            with instrument.span(name):
+                values[name] = stage.func(inputs, **stage.params)
+            seconds = time.time() - start
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(self._value_path(name, fingerprint), 'wb') as value_file:
+                pickle.dump(values[name], value_file, pickle.HIGHEST_PROTOCOL)
+            self.manifest["stages"][name] = {"fingerprint" : fingerprint, "seconds" : seconds, "outputs" : dict((path, _file_stamp(path)) for path in stage.outputs(values[name]))}
+            self._save_manifest()
+            print "Stage %s: ran in %.2fs" % (name, seconds)
+        self._save_manifest()
+
+        results = {}
+        for name in targets:
+            if name not in values:
+                with open(self._value_path(name, fingerprints[name]), 'rb') as value_file:
+                    values[name] = pickle.load(value_file)
+            results[name] = values[name]
+        return results
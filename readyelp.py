@@ -1,75 +1,236 @@
 #!/usr/bin/env/ python
 
 import json
+import os
+import time
+import collections
+import multiprocessing
+import reviewstore
+import socialgraph
+import reviewrecord
+import instrument
+import recordio
+import pipeline
+
+# Default size of the byte ranges handed to each ingestion worker, and the default ceiling on the raw bytes held in flight by the streaming parsers.
+CHUNK_BYTES = 16 * 1024 * 1024
+MAX_MEMORY_BYTES = 512 * 1024 * 1024
+
+REVIEW_STORE_PATH = "./reviews.store"
+
+# Set in the parent before the pool is forked so that user workers share the review index without pickling it per task.
+_worker_reviews_by_user = None
 
 def parse_review_dataset_file(reviews_output, reviews_by_user, file_path):
     """ Reads yelp reviews from the specified json file from the Yelp Academic Dataset.  Adds relevant information (i.e., user_id, revew_id, business_id, stars, text, date) to output list and indexes reviews by user in reviews_by_user. """
-    with open(file_path) as reviews_json_file:
-        for line in reviews_json_file:
-            review_in = json.loads(line)
-            user_id  = review_in["user_id"]
-            review_id = review_in["review_id"]
-            review_out = {"user_id" : user_id, "review_id" : review_id, "business_id" : review_in["business_id"], "rating" : review_in["stars"], "text" : review_in["text"], "date" : review_in["date"]}
-            reviews_output.append(review_out)
+    for review_in in recordio.iter_records(file_path):
+        user_id  = review_in["user_id"]
+        review_id = review_in["review_id"]
+        review_out = {"user_id" : user_id, "review_id" : review_id, "business_id" : review_in["business_id"], "rating" : review_in["stars"], "text" : review_in["text"], "date" : review_in["date"]}
+        reviews_output.append(review_out)
+        if user_id in reviews_by_user:
+            reviews_by_user[user_id].append(review_id)
+        else:
+            reviews_by_user[user_id] = [review_id]
+
+
+def parse_user_dataset_file(users_output, reviews_by_user, file_path):
+    """ Reads the yelp user json file and parses the user_id and list of friends for inclusion in the output file.  Users with no friends or no reviews in the dataset are excluded.  Includes list of reviews for each user in output list as in reviews_by_user. """
+    for user_in in recordio.iter_records(file_path):
+        user_id = user_in["user_id"]
+        if user_in["friends"] and user_in["review_count"] is not 0:
+            user_out = {"user_id" : user_id, "friends" : user_in["friends"], "reviews" : reviews_by_user[user_id]}
+            users_output.append(user_out)
+
+
+def _line_aligned_ranges(file_path, chunk_bytes):
+    """ Splits the file at file_path into (start, end) byte ranges of roughly chunk_bytes each.  Every boundary is moved forward to the start of the next line so that no json record is split between ranges. """
+    file_size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, 'rb') as input_file:
+        start = 0
+        while start < file_size:
+            end = start + chunk_bytes
+            if end >= file_size:
+                end = file_size
+            else:
+                input_file.seek(end)
+                input_file.readline()
+                end = input_file.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _read_range(file_path, start, end):
+    """ Returns the lines of the file at file_path that lie in the byte range [start, end).  Lines are split at newlines only, as the file is read elsewhere, since json allows carriage returns between tokens. """
+    with open(file_path, 'rb') as input_file:
+        input_file.seek(start)
+        data = input_file.read(end - start)
+    return data.split("\n")
+
+
+def _parse_range(line_worker, file_path, start, end):
+    """ Runs line_worker over the lines in one byte range of a plain input file. """
+    return line_worker(_read_range(file_path, start, end))
+
+
+def _parse_review_lines(lines):
+    """ Worker for stream_review_dataset_file.  Projects the reviews in a block of input lines and returns the serialized output lines along with (user_id, review_id) pairs for the review index. """
+    output_lines = []
+    user_reviews = []
+    for line in lines:
+        if not line.strip(): continue
+        review_in = recordio.loads(line)
+        user_id = review_in["user_id"]
+        review_id = review_in["review_id"]
+        review_out = {"user_id" : user_id, "review_id" : review_id, "business_id" : review_in["business_id"], "rating" : review_in["stars"], "text" : review_in["text"], "date" : review_in["date"]}
+        output_lines.append(json.dumps(review_out))
+        user_reviews.append((user_id, review_id))
+    return output_lines, user_reviews
+
+
+def _parse_user_lines(lines):
+    """ Worker for stream_user_dataset_file.  Projects the users in a block of input lines that have friends and reviews, and returns the serialized output lines.  Users with a review count but no reviews in the review index are skipped, where parse_user_dataset_file raises KeyError. """
+    output_lines = []
+    for line in lines:
+        if not line.strip(): continue
+        user_in = recordio.loads(line)
+        user_id = user_in["user_id"]
+        if user_in["friends"] and user_in["review_count"] != 0 and user_id in _worker_reviews_by_user:
+            user_out = {"user_id" : user_id, "friends" : user_in["friends"], "reviews" : _worker_reviews_by_user[user_id]}
+            output_lines.append(json.dumps(user_out))
+    return output_lines, []
+
+
+def _stream_ranges(line_worker, file_path, output_path, reviews_by_user, processes, chunk_bytes, max_memory_bytes):
+    """ Runs line_worker over blocks of about chunk_bytes of the lines of file_path on a process pool and writes the results to output_path in input order as each block completes.  Plain input is split into line-aligned byte ranges that the workers read themselves; compressed input is decompressed here and its lines are sent to the workers.  At most max_memory_bytes of input are in flight at once.  Returns a dictionary of throughput statistics, whose bytes are uncompressed bytes. """
+    start_time = time.time()
+    if recordio.compression(file_path) is None:
+        blocks = ((_parse_range, (line_worker, file_path, start, end), end - start) for start, end in _line_aligned_ranges(file_path, chunk_bytes))
+    else:
+        blocks = ((line_worker, (lines,), sum(len(line) for line in lines)) for lines in recordio.iter_batches(file_path, chunk_bytes))
+    max_in_flight = max(1, max_memory_bytes // chunk_bytes)
+    stats = {"records" : 0, "bytes" : 0}
+
+    def drain(result):
+        output_lines, user_reviews = result
+        writer.write_lines(output_lines)
+        stats["records"] += len(output_lines)
+        for user_id, review_id in user_reviews:
             if user_id in reviews_by_user:
                 reviews_by_user[user_id].append(review_id)
             else:
                 reviews_by_user[user_id] = [review_id]
-    reviews_json_file.closed
-
 
-def parse_user_dataset_file(users_output, reviews_by_user, file_path):
-    """ Reads the yelp user json file and parses the user_id and list of friends for inclusion in the output file.  Users with no friends or no reviews in the dataset are excluded.  Includes list of reviews for each user in output list as in reviews_by_user. """
-    with open(file_path) as users_json_file:
-        for line in users_json_file:
-            user_in = json.loads(line)
-            user_id = user_in["user_id"]
-            if user_in["friends"] and user_in["review_count"] is not 0:
-                user_out = {"user_id" : user_id, "friends" : user_in["friends"], "reviews" : reviews_by_user[user_id]}
-                users_output.append(user_out)
-    users_json_file.closed
+    with recordio.RecordWriter(output_path) as writer:
+        if processes == 1:
+            for worker, arguments, size in blocks:
+                drain(worker(*arguments))
+                stats["bytes"] += size
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                pending = collections.deque()
+                for worker, arguments, size in blocks:
+                    pending.append((pool.apply_async(worker, arguments), size))
+                    if len(pending) >= max_in_flight:
+                        async_result, size = pending.popleft()
+                        drain(async_result.get())
+                        stats["bytes"] += size
+                while pending:
+                    async_result, size = pending.popleft()
+                    drain(async_result.get())
+                    stats["bytes"] += size
+            finally:
+                pool.close()
+                pool.join()
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    stats["seconds"] = elapsed
+    stats["records_per_second"] = stats["records"] / elapsed
+    stats["mb_per_second"] = stats["bytes"] / elapsed / (1024 * 1024)
+    print "Parsed %d records (%.1f MB) from %s in %.2fs: %.0f records/s, %.1f MB/s" % (stats["records"], stats["bytes"] / (1024.0 * 1024), file_path, elapsed, stats["records_per_second"], stats["mb_per_second"])
+    return stats
+
+
+def stream_review_dataset_file(file_path, output_path, reviews_by_user, processes = None, chunk_bytes = CHUNK_BYTES, max_memory_bytes = MAX_MEMORY_BYTES):
+    """ Streaming, parallel counterpart of parse_review_dataset_file.  Splits the Yelp review json file into byte ranges, projects the same fields across a process pool, and writes the projected reviews straight to output_path in input order.  reviews_by_user is filled as in parse_review_dataset_file.  Returns a dictionary of throughput statistics. """
+    with instrument.span("parse_reviews") as parse_span:
+        stats = _stream_ranges(_parse_review_lines, file_path, output_path, reviews_by_user, processes, chunk_bytes, max_memory_bytes)
+        parse_span.items = stats["records"]
+    return stats
+
+
+def stream_user_dataset_file(file_path, output_path, reviews_by_user, processes = None, chunk_bytes = CHUNK_BYTES, max_memory_bytes = MAX_MEMORY_BYTES):
+    """ Streaming, parallel counterpart of parse_user_dataset_file.  Users with no friends or no reviews in reviews_by_user are excluded.  Unlike parse_user_dataset_file, which raises KeyError for a user whose review_count is not zero but who has no reviews in reviews_by_user, such users are skipped, so that a review file holding part of the dataset can be ingested.  Returns a dictionary of throughput statistics. """
+    global _worker_reviews_by_user
+    _worker_reviews_by_user = reviews_by_user
+    try:
+        with instrument.span("parse_users") as parse_span:
+            stats = _stream_ranges(_parse_user_lines, file_path, output_path, {}, processes, chunk_bytes, max_memory_bytes)
+            parse_span.items = stats["records"]
+        return stats
+    finally:
+        _worker_reviews_by_user = None
 
 
 def write_output(object_list, output_path):
-    """ Given a list of json objects and a filepath, writes the objects to the file, one per line. """
-    with open(output_path, 'w+') as output_file:
+    """ Given a list of json objects and a filepath, writes the objects to the file, one per line, compressed when output_path ends in .gz or .bz2.  ReviewRecords are written as the review objects they stand for.  The file is written under a temporary name and then moved into place, so that records whose text is read lazily from output_path itself stay readable while it is rewritten. """
+    temp_path = output_path + ".tmp"
+    with recordio.RecordWriter(temp_path, codec = recordio.path_compression(output_path)) as writer:
         for json_object in object_list:
-            json.dump(json_object, output_file)
-            output_file.write('\n')
-    output_file.closed
+            if isinstance(json_object, reviewrecord.ReviewRecord):
+                json_object = json_object.to_dict()
+            writer.write(json_object)
+    os.rename(temp_path, output_path)
+
+
+def iter_records(input_path):
+    """ Yields the json objects in the plain or compressed file at input_path one at a time, without holding the file in memory. """
+    return recordio.iter_records(input_path)
 
 
 def read_users_to_dict(input_path):
-    """ Returns a dictionary containing an object for each user in the file at input_path.  Keys are user_id's, values are objects as read from json input. """
-    user_dict = {}
-    with open(input_path) as input_file:
-        for line in input_file:
-            user_object = json.loads(line)
-            user_dict[user_object["user_id"]] = user_object
-    return user_dict
+    """ Returns a dictionary containing an object for each user in the file at input_path.  Keys are user_id's, values are objects as read from json input.  If input_path is a social graph directory, returns a read-only dictionary view over the memory-mapped graph. """
+    if os.path.isdir(input_path):
+        return socialgraph.open_user_dict(input_path)
+    return recordio.read_dict(input_path, "user_id")
+
+
+def read_reviews_to_dict(input_path, subset = None, lazy_text = False):
+    """ Returns a dictionary of yelp reviews contained in the input file.  Keys are review_id, values are review objects read from json.  If lazy_text is True and the file is not compressed, values are reviewrecord.ReviewRecords that read their text from the file only when it is accessed, for stages that mostly use review metadata.  If input_path is a review store directory, returns a memory-mapped dictionary over the store, or over its named subset, whose text is always read on access. """
+    if os.path.isdir(input_path):
+        return reviewstore.open_review_dict(input_path, subset)
+    if lazy_text and recordio.compression(input_path) is None:
+        return reviewrecord.read_review_records(input_path)
+    return recordio.read_dict(input_path, "review_id")
 
 
-def read_reviews_to_dict(input_path):
-    """ Returns a dictionary of yelp reviews contained in the input file.  Keys are review_id, values are review objects read from json. """
-    review_dict = {}
-    with open(input_path) as input_file:
-        for line in input_file:
-            review_object = json.loads(line)
-            review_dict[review_object["review_id"]] = review_object
-    return review_dict
+def write_review_store(reviews, store_path = REVIEW_STORE_PATH):
+    """ Writes reviews to a columnar review store that later stages can open memory-mapped with read_reviews_to_dict. """
+    reviewstore.write_review_store(reviews, store_path)
+
+
+def read_split(name, store_path = REVIEW_STORE_PATH, lazy_text = False):
+    """ Returns the reviews of the named split ("train" or "test").  The split is read from the review store at store_path when it holds that subset and ./<name>_reviews.json is missing or still has the sha1 recorded for the subset when it was written, and from ./<name>_reviews.json otherwise, or always if store_path is None, with lazy_text as in read_reviews_to_dict. """
+    json_path = "./%s_reviews.json" % name
+    if store_path is None:
+        return read_reviews_to_dict(json_path, lazy_text = lazy_text)
+    if os.path.exists(os.path.join(store_path, "meta.json")):
+        store = reviewstore.ReviewStore(store_path)
+        if store.has_subset(name):
+            if not os.path.exists(json_path) or store.subset_source(name) == pipeline.file_digest(json_path):
+                return store.review_dict(name)
+    return read_reviews_to_dict(json_path, lazy_text = lazy_text)
 
 
 def main():
-    users_output = []
-    reviews_output = []
     reviews_by_user = {}
 
-    parse_review_dataset_file(reviews_output, reviews_by_user, "../yelp_data/yelp_academic_dataset_review.json")
-
-    parse_user_dataset_file(users_output, reviews_by_user, "../yelp_data/yelp_academic_dataset_user.json")
+    stream_review_dataset_file("../yelp_data/yelp_academic_dataset_review.json", "./reviews.json", reviews_by_user)
 
-    write_output(users_output, "./users.json")
-    write_output(reviews_output, "./reviews.json")
+    stream_user_dataset_file("../yelp_data/yelp_academic_dataset_user.json", "./users.json", reviews_by_user)
 
 
 
@@ -2,74 +2,228 @@
 
 import pycrfsuite
 import readyelp
-import cleanyelp
-import random
-import numpy
+import crffeatures
+import instrument
+import temporalindex
+import os
+import json
+import time
+import hashlib
+import datetime
+import multiprocessing
 
+CRF_MODEL_DIR = "./crfmodels"
 
-def train_crf(train_reviews, user_dict):
-    """ Given a dictionary of training reviews and a dictionary of user objects, trains a Linear-chain CRF model to tag pairs of reviews as either members of the same class (["1", "1"]) or different classes (["1", "0"]).  Features for the CRF consist of the date and text of each review. """
-    trainer = pycrfsuite.Trainer('lbfgs')
-    for train_id in train_reviews:
-        train_review = train_reviews[train_id]
-        friend_reviews_of_business = train_review["friend_reviews_of_business"]
+# Set in the parent before the pool is forked so that tagging workers share the pair item sequences without pickling them.
+_tag_state = None
+_tagger = None
+
+
+def friend_review_pairs(reviews, window_days = None, max_influencers = None):
+    """ Returns the list of (friend_review_id, review_id) pairs such that the friend review is listed among the influencers of the review, is in reviews, and was created on or before the review.  If window_days is given, the friend review must also be at most window_days days older than the review, and if max_influencers is given, only the most recent max_influencers such friend reviews of each review are paired with it. """
+    pairs = []
+    if window_days is not None or max_influencers is not None:
+        days = {}
+        for review_id in reviews:
+            days[review_id] = temporalindex.date_ordinal(reviews[review_id]["date"])
+        for review_id in reviews:
+            dated_reviews = sorted((days[friend_review_id], friend_review_id) for friend_review_id in reviews[review_id]["friend_reviews_of_business"] if friend_review_id in days)
+            for day, friend_review_id in temporalindex.recent(dated_reviews, days[review_id], window_days, max_influencers):
+                pairs.append((friend_review_id, review_id))
+        return pairs
+    for review_id in reviews:
+        review = reviews[review_id]
+        friend_reviews_of_business = review["friend_reviews_of_business"]
         for friend_review_id in friend_reviews_of_business:
-            if friend_review_id not in train_reviews: continue
-            friend_review = train_reviews[friend_review_id]
-            if friend_review["date"] <= train_review["date"]:
-                friend = user_dict[friend_review["user_id"]]
-                user = user_dict[train_review["user_id"]]
-                friend_item = {"id":friend_review["user_id"], "friends":len(friend["friends"]), "text":friend_review["text"]}
-                train_item = {"id":train_review["user_id"], "friends":len(user["friends"]), "text":train_review["text"]}
-                xseq = [friend_item, train_item]
-                # If the ratings are the same between reviews, both are labeled as "1" in the Y sequence, otherwise the training review is labeled as "0".
-                # This allows for the training of a CRF that determines the probability that the latter review receives the same label as the former - the strength of the link between reviews.
-                if friend_review["rating"] == train_review["rating"]:
-                    yseq = ["1", "1"]
-                else:
-                    yseq = ["1", "0"]
-
-                trainer.append(xseq, yseq)
-    trainer.train("reviewcrfmodel")
-
-def crftag_probabilities(test_reviews, user_dict):
-    """ Given a dictionary of reviews for test, tags pairs of reviews of the same business created by two users who are friends. Returns a dictionary mapping tuples (r1, r2) to the probability that those two reviews should receive the same classification. """
+            if friend_review_id not in reviews: continue
+            friend_review = reviews[friend_review_id]
+            if friend_review["date"] <= review["date"]:
+                pairs.append((friend_review_id, review_id))
+    return pairs
+
+
+def pair_xseqs(pairs, reviews, extractor):
+    """ Returns the CRF item sequence for each pair in pairs. """
+    return [extractor.pair_xseq(friend_review_id, reviews[friend_review_id], review_id, reviews[review_id]) for friend_review_id, review_id in pairs]
+
+
+def _pair_yseq(friend_review, review):
+    # If the ratings are the same between reviews, both are labeled as "1" in the Y sequence, otherwise the later review is labeled as "0".
+    # This allows for the training of a CRF that determines the probability that the latter review receives the same label as the former - the strength of the link between reviews.
+    if friend_review["rating"] == review["rating"]:
+        return ["1", "1"]
+    else:
+        return ["1", "0"]
+
+
+def train_crf(train_reviews, user_dict, extractor = None, window_days = None, max_influencers = None):
+    """ Given a dictionary of training reviews and a dictionary of user objects, trains a Linear-chain CRF model to tag pairs of reviews as either members of the same class (["1", "1"]) or different classes (["1", "0"]).  Features for the CRF are built by a crffeatures.PairFeatureExtractor from the text, author and dates of each review; pass the same extractor to crftag_probabilities to share its feature cache.  window_days and max_influencers limit the training pairs as in friend_review_pairs. """
+    if extractor is None:
+        extractor = crffeatures.PairFeatureExtractor(user_dict)
+    trainer = pycrfsuite.Trainer('lbfgs')
+    pairs = friend_review_pairs(train_reviews, window_days, max_influencers)
+    with instrument.span("crf_features", len(pairs)):
+        xseqs = pair_xseqs(pairs, train_reviews, extractor)
+    for (friend_review_id, train_id), xseq in zip(pairs, xseqs):
+        trainer.append(xseq, _pair_yseq(train_reviews[friend_review_id], train_reviews[train_id]))
+    with instrument.span("crf_train", len(pairs)):
+        trainer.train("reviewcrfmodel")
+
+
+def _read_manifest(model_dir):
+    manifest_path = os.path.join(model_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {"versions" : []}
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def latest_crf_model(model_dir = CRF_MODEL_DIR):
+    """ Returns the path of the latest model trained by train_crf_incremental in model_dir whose file still exists, or None if there is none. """
+    for version in reversed(_read_manifest(model_dir)["versions"]):
+        # Manifests written while train_crf_incremental had a "delta" mode may list models of new pairs only.
+        if version.get("mode", "full") == "full" and os.path.exists(version["model"]):
+            return version["model"]
+    return None
+
+
+def train_crf_incremental(train_reviews, user_dict, model_dir = CRF_MODEL_DIR, algorithm = "lbfgs", params = None, extractor = None, window_days = None, max_influencers = None):
+    """ Trains a versioned CRF model in model_dir and returns its path.  A manifest lists each model version with the hash of its training pairs, the number of pairs that the previous version was not trained on, the training parameters and the training time.  The pairs of the latest version are kept in a pair log in model_dir, which is replaced by each new version.  If any version was trained on the same pairs with the same parameters and its model file still exists, training is skipped and that model is returned.  algorithm and params (e.g. {"max_iterations" : 50}) are passed to pycrfsuite.  The pair hash covers the extractor's feature configuration, so a change of features retrains.  If there are no pairs to train on, no model is written and the latest model is returned, or ValueError is raised if there is none.  window_days and max_influencers limit the training pairs as in friend_review_pairs. """
+    if not os.path.isdir(model_dir):
+        os.makedirs(model_dir)
+    if extractor is None:
+        extractor = crffeatures.PairFeatureExtractor(user_dict)
+    manifest = _read_manifest(model_dir)
+
+    pairs = friend_review_pairs(train_reviews, window_days, max_influencers)
+    yseqs = [_pair_yseq(train_reviews[friend_review_id], train_reviews[train_id]) for friend_review_id, train_id in pairs]
+    keys = ["%s %s %s" % (friend_review_id, train_id, "".join(yseq)) for (friend_review_id, train_id), yseq in zip(pairs, yseqs)]
+    features = extractor.config()
+    data_hash = hashlib.sha1(json.dumps(features, sort_keys = True) + "\n" + "\n".join(sorted(keys))).hexdigest()
+    for version in reversed(manifest["versions"]):
+        if (version["data_hash"], version["algorithm"], version["params"], version.get("mode", "full")) == (data_hash, algorithm, params or {}, "full") and os.path.exists(version["model"]):
+            print "CRF training pairs and parameters unchanged, using", version["model"]
+            return version["model"]
+
+    if not pairs:
+        # crfsuite writes a model without features for an empty training set, which crashes the tagger.
+        previous = latest_crf_model(model_dir)
+        if previous is None:
+            raise ValueError("No CRF training pairs and no earlier model in %s" % model_dir)
+        print "No CRF training pairs, using", previous
+        return previous
+
+    pair_log_path = os.path.join(model_dir, "pairs.log")
+    previous_keys = set()
+    if os.path.exists(pair_log_path):
+        with open(pair_log_path) as pair_log:
+            previous_keys = set(line.rstrip('\n') for line in pair_log)
+    new_pairs = sum(1 for key in keys if key not in previous_keys)
+
+    start = time.time()
+    trainer = pycrfsuite.Trainer(algorithm)
+    if params:
+        trainer.set_params(params)
+    with instrument.span("crf_features", len(pairs)):
+        for pair, yseq in zip(pairs, yseqs):
+            trainer.append(extractor.pair_xseq(pair[0], train_reviews[pair[0]], pair[1], train_reviews[pair[1]]), yseq)
+    version = len(manifest["versions"]) + 1
+    model_path = os.path.join(model_dir, "reviewcrfmodel.v%03d" % version)
+    with instrument.span("crf_train", len(pairs)):
+        trainer.train(model_path)
+    train_seconds = time.time() - start
+
+    with open(pair_log_path, 'w') as pair_log:
+        for key in keys:
+            pair_log.write(key + '\n')
+    manifest["versions"].append({"version" : version, "model" : model_path, "data_hash" : data_hash, "num_pairs" : len(pairs), "new_pairs" : new_pairs, "features" : features, "algorithm" : algorithm, "params" : params or {}, "train_seconds" : train_seconds, "created" : datetime.datetime.now().isoformat()})
+    with open(os.path.join(model_dir, "manifest.json"), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent = 2)
+    print "Trained CRF model version %d on %d pairs (%d new) in %.2fs" % (version, len(pairs), new_pairs, train_seconds)
+    return model_path
+
+
+def _open_tagger(model_path):
+    """ Opens the tagger used by this process. """
+    global _tagger
+    _tagger = pycrfsuite.Tagger()
+    _tagger.open(model_path)
+
+
+def score_xseq(tagger, xseq):
+    """ Tags a pair item sequence and returns (probability that the two reviews have the same class, whether the tagger chose the same class). """
+    yseq = tagger.tag(xseq)
+    # The probability of the labeling yseq, given the input xseq
+    prob_y = tagger.probability(yseq)
+    if yseq[1] == "1":
+        return prob_y, True
+    else:
+        return 1 - prob_y, False
+
+
+def _tag_pair_range(pair_range):
+    """ Tagging worker.  Scores the pairs in the given (start, end) range of the shared item sequences and returns a list of score_xseq results. """
+    start, end = pair_range
+    return [score_xseq(_tagger, xseq) for xseq in _tag_state[start:end]]
+
+
+def crftag_probabilities(test_reviews, user_dict, processes = 1, model_path = "reviewcrfmodel", extractor = None, window_days = None, max_influencers = None):
+    """ Given a dictionary of reviews for test, tags pairs of reviews of the same business created by two users who are friends. Returns a dictionary mapping tuples (r1, r2) to the probability that those two reviews should receive the same classification.  The pair list is enumerated once and, with processes > 1, split into contiguous shards scored by worker processes that each hold their own Tagger; the result is identical to the serial path.  window_days and max_influencers limit the pairs as in friend_review_pairs. """
+    global _tag_state
+    start_time = time.time()
+    if extractor is None:
+        extractor = crffeatures.PairFeatureExtractor(user_dict)
+    pairs = friend_review_pairs(test_reviews, window_days, max_influencers)
+
+    with instrument.span("crf_features", len(pairs)):
+        _tag_state = pair_xseqs(pairs, test_reviews, extractor)
+    with instrument.span("tag", len(pairs)):
+        try:
+            if processes == 1:
+                _open_tagger(model_path)
+                score_lists = [_tag_pair_range((0, len(pairs)))]
+            else:
+                num_shards = (processes or multiprocessing.cpu_count()) * 4
+                shard_size = max(1, (len(pairs) + num_shards - 1) // num_shards)
+                shards = [(start, min(start + shard_size, len(pairs))) for start in range(0, len(pairs), shard_size)]
+                pool = multiprocessing.Pool(processes, _open_tagger, (model_path,))
+                try:
+                    score_lists = pool.map(_tag_pair_range, shards)
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            _tag_state = None
+
     probabilities = {}
-    tagger = pycrfsuite.Tagger()
-    tagger.open("reviewcrfmodel")
     num_same = 0
     num_diff = 0
-    for test_id in test_reviews:
-        test_review = test_reviews[test_id]
-        friend_reviews_of_business = test_review["friend_reviews_of_business"]
-        for friend_review_id in friend_reviews_of_business:
-            if friend_review_id not in test_reviews: continue
-            friend_review = test_reviews[friend_review_id]
-            if friend_review["date"] <= test_review["date"]:
-                friend = user_dict[friend_review["user_id"]]
-                user = user_dict[test_review["user_id"]]
-                friend_item = {"id":friend_review["user_id"], "friends":len(friend["friends"]), "text":friend_review["text"]}
-                test_item = {"id":test_review["user_id"], "friends":len(user["friends"]), "text":test_review["text"]}
-                xseq = [friend_item, test_item]
-                yseq = tagger.tag(xseq)
-                # The probability of the labeling yseq, given the input xseq
-                prob_y = tagger.probability(yseq)
-                if yseq[1] == "1":
-                    probabilities[(friend_review_id, test_id)] = prob_y
-                    num_same += 1
-                else:
-                    probabilities[(friend_review_id, test_id)] = 1 - prob_y
-                    num_diff += 1
+    i = 0
+    for scores in score_lists:
+        for probability, same in scores:
+            probabilities[pairs[i]] = probability
+            if same:
+                num_same += 1
+            else:
+                num_diff += 1
+            i += 1
+    elapsed = max(time.time() - start_time, 1e-9)
     print "Number of same, differnt from CRF:", num_same, num_diff
+    print "Tagged %d pairs in %.2fs: %.0f pairs/s" % (len(pairs), elapsed, len(pairs) / elapsed)
     return probabilities
 
 
 def main():
-    train_reviews = readyelp.read_reviews_to_dict("train_reviews.json")
-    test_reviews = readyelp.read_reviews_to_dict("test_reviews.json")
+    instrument.enable()
+    train_reviews = readyelp.read_split("train")
+    test_reviews = readyelp.read_split("test")
     user_dict = readyelp.read_users_to_dict("users_limited.json")
-    train_crf(train_reviews, user_dict)
-    crftag(test_reviews, user_dict)
+    extractor = crffeatures.PairFeatureExtractor(user_dict)
+    with instrument.span("train_crf"):
+        train_crf(train_reviews, user_dict, extractor)
+    with instrument.span("tag_crf"):
+        crftag_probabilities(test_reviews, user_dict, extractor = extractor)
+    instrument.write_report()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
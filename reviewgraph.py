@@ -1,63 +1,269 @@
 #!/usr/bin/env python
 
-from graph_tool.all import *
+import collections
+import instrument
+import multiprocessing
+import numpy
+import scipy.sparse
+import scipy.sparse.csgraph
 
-def build_graph(klass_list, test_reviews, ind_pref, pair_str):
-    """ Takes a dictionary of preferences for the individual document classifier (ind_pref) and a dictionary of strengths of links between pairs (pair_str).  For the former, keys are tuples of the form (r, c) where r is the review_id and c is the class assignment with highest probability.  The keys for the latter dictionary are tuples of the form (r1, r2) and values are the probability that r1 and r2 have the same class according to the Linear-chain CRF model.  Given these dictionaries, this method returns a graph object where each node is a review or a class.  Edges are defined by the keys to each of ind_pref and pair_str, and edge weight is the associated value. """
-    g = Graph(directed = True)
-    e_weight = g.new_edge_property("double")
-    # Add nodes to the graph for each klass, "negative" and "positive"
-    neg = g.add_vertex()
-    pos = g.add_vertex()
-    print "Added klass nodes."
-    # Add a node to the graph for each review
-    for test_review_id in test_reviews:
-        test_review = test_reviews[test_review_id]
-        v = g.add_vertex()
-        test_review["vertex"] = v
-        test_reviews[test_review_id] = test_review
-    print "Added review nodes."
-    # Add edges connecting each review to the class nodes where edge weight is determined by the individual classifier
+try:
+    import graph_tool.all
+    import graph_tool.flow
+except ImportError:
+    graph_tool = None
+
+# The integer backends solve the cut on capacities scaled by CAPACITY_SCALE and rounded.
+CAPACITY_SCALE = 10 ** 6
+
+# Node numbers of the klass nodes in the review graph.  Review nodes follow them.
+NEGATIVE_NODE = 0
+POSITIVE_NODE = 1
+
+
+def review_graph_arrays(test_reviews, ind_pref, pair_str):
+    """ Builds the review graph as edge arrays.  Returns (review_ids, source, target, capacity) where review_ids[i] is the review at node i + 2, and each edge runs from source[k] to target[k] with capacity[k].  The negative klass node is connected to each review with capacity 1 - ind_pref, each review is connected to the positive klass node with capacity ind_pref, and each pair in pair_str is connected with its strength. """
+    review_ids = list(test_reviews)
+    node_of = dict((review_id, i + 2) for i, review_id in enumerate(review_ids))
+    source = []
+    target = []
+    capacity = []
     for review_id in ind_pref:
-        review = test_reviews[review_id]
-        e_neg = g.add_edge(neg, review["vertex"])
-        e_pos = g.add_edge(review["vertex"], pos)
-        e_weight[e_neg] = (1 - ind_pref[review_id])
-        e_weight[e_pos] = (ind_pref[review_id])
-    print "Added klass edges."
-    # Add edges connecting pairs of reviews of the same business by friends
+        node = node_of[review_id]
+        source.append(NEGATIVE_NODE)
+        target.append(node)
+        capacity.append(1 - ind_pref[review_id])
+        source.append(node)
+        target.append(POSITIVE_NODE)
+        capacity.append(ind_pref[review_id])
     for pair in pair_str:
-        review_1 = test_reviews[pair[0]]
-        review_2 = test_reviews[pair[1]]
-        e = g.add_edge(review_1["vertex"], review_2["vertex"])
-        e_weight[e] = pair_str[pair]
-    print "Graph built."
+        if pair[0] == pair[1]: continue
+        source.append(node_of[pair[0]])
+        target.append(node_of[pair[1]])
+        capacity.append(pair_str[pair])
+    return review_ids, numpy.array(source, dtype = numpy.int32), numpy.array(target, dtype = numpy.int32), numpy.array(capacity, dtype = numpy.float64)
 
-    res = graph_tool.flow.push_relabel_max_flow(g, neg, pos, e_weight)
-    print "Push Relabel run."
-    min_cut, partition = graph_tool.flow.min_st_cut(g, neg, res)
 
-    min_cut_classification = {}
-    for review_id in test_reviews:
-        review = test_reviews[review_id]
-        vertex = review["vertex"]
-        if partition[vertex]:
-            min_cut_classification[review_id] = 0
-        else:
-            min_cut_classification[review_id] = 1
+def _scaled(capacity):
+    return numpy.rint(numpy.clip(capacity, 0, None) * CAPACITY_SCALE).astype(numpy.int64)
 
 
-    return min_cut_classification
+def _source_side_graph_tool(num_nodes, source, target, capacity, s, t):
+    """ Solves the cut with graph_tool's push-relabel maximum flow. """
+    g = graph_tool.all.Graph(directed = True)
+    g.add_vertex(num_nodes)
+    g.add_edge_list(numpy.column_stack((source, target)))
+    e_weight = g.new_edge_property("double")
+    e_weight.a = capacity
+    res = graph_tool.flow.push_relabel_max_flow(g, g.vertex(s), g.vertex(t), e_weight)
+    min_cut, partition = graph_tool.flow.min_st_cut(g, g.vertex(s), res)
+    return numpy.array(partition.a, dtype = bool)
+
+
+def _source_side_scipy(num_nodes, source, target, capacity, s, t):
+    """ Solves the cut with scipy.sparse.csgraph.maximum_flow on integer capacities, then finds the nodes reachable from s in the residual graph. """
+    capacities = scipy.sparse.csr_matrix((_scaled(capacity).astype(numpy.int32), (source, target)), shape = (num_nodes, num_nodes))
+    result = scipy.sparse.csgraph.maximum_flow(capacities, s, t)
+    flow = getattr(result, "flow", None)
+    if flow is None:
+        flow = result.residual
+    residual = (capacities - flow).tocsr()
+    residual.data[residual.data < 0] = 0
+    residual.eliminate_zeros()
+    reachable = scipy.sparse.csgraph.breadth_first_order(residual, s, directed = True, return_predecessors = False)
+    source_side = numpy.zeros(num_nodes, dtype = bool)
+    source_side[reachable] = True
+    return source_side
+
+
+def _source_side_native(num_nodes, source, target, capacity, s, t):
+    """ Solves the cut with a built-in Dinic maximum flow over edge arrays on integer capacities, then finds the nodes reachable from s in the residual graph. """
+    num_edges = len(source)
+    # Edge 2k is the k-th input edge and edge 2k + 1 its residual reverse.
+    edge_to = numpy.empty(2 * num_edges, dtype = numpy.int64)
+    edge_to[0::2] = target
+    edge_to[1::2] = source
+    edge_from = numpy.empty(2 * num_edges, dtype = numpy.int64)
+    edge_from[0::2] = source
+    edge_from[1::2] = target
+    residual = numpy.zeros(2 * num_edges, dtype = numpy.int64)
+    residual[0::2] = _scaled(capacity)
+    order = numpy.argsort(edge_from, kind = 'mergesort')
+    indptr = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(edge_from, minlength = num_nodes))))
+    edge_to = edge_to.tolist()
+    residual = residual.tolist()
+    order = order.tolist()
+    indptr = indptr.tolist()
+
+    def levels():
+        level = [-1] * num_nodes
+        level[s] = 0
+        queue = collections.deque([s])
+        while queue:
+            u = queue.popleft()
+            for k in xrange(indptr[u], indptr[u + 1]):
+                e = order[k]
+                v = edge_to[e]
+                if residual[e] > 0 and level[v] < 0:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        return level
+
+    level = levels()
+    while level[t] >= 0:
+        arc = indptr[:-1]
+        while True:
+            # Find an augmenting path in the level graph, advancing each node's current arc past dead ends.
+            path = []
+            u = s
+            while u != t:
+                advanced = False
+                while arc[u] < indptr[u + 1]:
+                    e = order[arc[u]]
+                    v = edge_to[e]
+                    if residual[e] > 0 and level[v] == level[u] + 1:
+                        path.append(e)
+                        u = v
+                        advanced = True
+                        break
+                    arc[u] += 1
+                if not advanced:
+                    if u == s:
+                        break
+                    level[u] = -1
+                    e = path.pop()
+                    u = edge_to[e ^ 1]
+                    arc[u] += 1
+            if u != t:
+                break
+            bottleneck = min(residual[e] for e in path)
+            for e in path:
+                residual[e] -= bottleneck
+                residual[e ^ 1] += bottleneck
+        level = levels()
+
+    return numpy.array([node_level >= 0 for node_level in level], dtype = bool)
+
+
+MIN_CUT_BACKENDS = {"graph_tool" : _source_side_graph_tool, "scipy" : _source_side_scipy, "native" : _source_side_native}
+
 
+def default_backend():
+    """ Returns graph_tool when it is installed, then scipy when it provides maximum_flow, and the built-in solver otherwise. """
+    if graph_tool is not None:
+        return "graph_tool"
+    if hasattr(scipy.sparse.csgraph, "maximum_flow"):
+        return "scipy"
+    return "native"
 
-def mincutclassification(rgraph):
-    """ Given a graph of reviews as defined above, returns a dictionary mapping review_id's to their classification according to the min cut (max flow) of the graph.  This min cut approach for classification is adapted from Bo Pang and Lillian Lee (2004). """
-    max_flow = maximum_flow(rgraph, "negative", "positive")
-    return max_flow[1]
+
+def min_cut_source_side(num_nodes, source, target, capacity, backend = None, s = NEGATIVE_NODE, t = POSITIVE_NODE):
+    """ Returns a boolean array marking the nodes on the source side of the minimum s-t cut of the graph given by edge arrays, solved with the named backend. """
+    if backend is None:
+        backend = default_backend()
+    return MIN_CUT_BACKENDS[backend](num_nodes, source, target, capacity, s, t)
+
+
+def _solve_component(task):
+    """ Component worker.  Solves the cut of one component given as (num_nodes, source, target, capacity, backend) in local node numbers and returns its source side. """
+    num_nodes, source, target, capacity, backend = task
+    return min_cut_source_side(num_nodes, source, target, capacity, backend)
+
+
+def component_min_cut_source_side(num_nodes, source, target, capacity, backend = None, processes = 1, verbose = True):
+    """ Returns the same source side as min_cut_source_side for a review graph built by review_graph_arrays, by solving each connected component of the review-to-review edges on its own.  Reviews without pair edges are decided by comparing their two klass edges, and larger components are solved on a process pool when processes > 1.  If verbose is True, the number of components is printed.  As components only share the klass nodes, the nodes reachable from the negative klass node in the residual graph, and therefore the partition, are the same as for the whole graph. """
+    if backend is None:
+        backend = default_backend()
+    num_reviews = num_nodes - 2
+    source_side = numpy.zeros(num_nodes, dtype = bool)
+    source_side[NEGATIVE_NODE] = True
+    if num_reviews == 0:
+        return source_side
+
+    # Compare capacities in the units the backend solves in, so that ties are decided as the backend would decide them.
+    if backend == "graph_tool":
+        units = capacity
+    else:
+        units = _scaled(capacity)
+
+    is_pair = (source >= 2) & (target >= 2)
+    pair_graph = scipy.sparse.csr_matrix((numpy.ones(is_pair.sum()), (source[is_pair] - 2, target[is_pair] - 2)), shape = (num_reviews, num_reviews))
+    num_components, component = scipy.sparse.csgraph.connected_components(pair_graph, directed = True, connection = 'weak')
+    component_size = numpy.bincount(component, minlength = num_components)
+
+    # Each edge belongs to the component of its review endpoint.
+    review_node = numpy.where(source >= 2, source, target)
+    edge_component = component[review_node - 2]
+
+    # A review with no pair edges is on the source side exactly when its negative edge is not saturated, that is when it outweighs its positive edge.
+    negative_weight = numpy.zeros(num_reviews, dtype = units.dtype)
+    positive_weight = numpy.zeros(num_reviews, dtype = units.dtype)
+    from_negative = source == NEGATIVE_NODE
+    to_positive = target == POSITIVE_NODE
+    numpy.add.at(negative_weight, target[from_negative] - 2, units[from_negative])
+    numpy.add.at(positive_weight, source[to_positive] - 2, units[to_positive])
+    isolated = component_size[component] == 1
+    source_side[2:][isolated] = negative_weight[isolated] > positive_weight[isolated]
+
+    tasks = []
+    task_nodes = []
+    edge_order = numpy.argsort(edge_component, kind = 'mergesort')
+    edge_bounds = numpy.searchsorted(edge_component[edge_order], numpy.arange(num_components + 1))
+    node_order = numpy.argsort(component, kind = 'mergesort') + 2
+    node_bounds = numpy.searchsorted(numpy.sort(component), numpy.arange(num_components + 1))
+    # Components are disjoint, so one array holds every review's node number within its own component.
+    local = numpy.zeros(num_nodes, dtype = numpy.int32)
+    local[NEGATIVE_NODE] = NEGATIVE_NODE
+    local[POSITIVE_NODE] = POSITIVE_NODE
+    for c in numpy.nonzero(component_size > 1)[0]:
+        edges = edge_order[edge_bounds[c]:edge_bounds[c + 1]]
+        nodes = node_order[node_bounds[c]:node_bounds[c + 1]]
+        local[nodes] = numpy.arange(2, len(nodes) + 2)
+        tasks.append((len(nodes) + 2, local[source[edges]], local[target[edges]], capacity[edges], backend))
+        task_nodes.append(nodes)
+
+    if processes == 1 or len(tasks) < 2:
+        results = [_solve_component(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_solve_component, tasks, chunksize = max(1, len(tasks) // (4 * (processes or multiprocessing.cpu_count()))))
+        finally:
+            pool.close()
+            pool.join()
+    for nodes, component_side in zip(task_nodes, results):
+        source_side[nodes] = component_side[2:]
+    if verbose:
+        print "Solved %d components (%d isolated reviews)" % (len(tasks), isolated.sum())
+    return source_side
+
+
+def build_graph(klass_list, test_reviews, ind_pref, pair_str, backend = None, decompose = False, processes = 1, verbose = True):
+    """ Takes a dictionary of preferences for the individual document classifier (ind_pref) and a dictionary of strengths of links between pairs (pair_str).  For the former, keys are review_ids and values are the probability that the review is positive.  The keys for the latter dictionary are tuples of the form (r1, r2) and values are the probability that r1 and r2 have the same class according to the Linear-chain CRF model.  Given these dictionaries, this method builds a graph where each node is a review or a class, with edges defined by the keys to each of ind_pref and pair_str and edge weight the associated value, and returns a dictionary mapping each review_id to 0 (negative) or 1 (positive) according to the minimum cut between the class nodes.  backend selects the flow solver: "graph_tool", "scipy" or "native".  If decompose is True, the cut is solved per connected component of the review pairs, on processes worker processes.  Progress is printed unless verbose is False, as for callers that build a graph for every arriving review.  test_reviews is not modified. """
+    with instrument.span("build_graph", len(test_reviews)):
+        review_ids, source, target, capacity = review_graph_arrays(test_reviews, ind_pref, pair_str)
+    if verbose:
+        print "Graph built."
+    with instrument.span("max_flow", len(source)):
+        if decompose:
+            source_side = component_min_cut_source_side(len(review_ids) + 2, source, target, capacity, backend, processes, verbose)
+        else:
+            source_side = min_cut_source_side(len(review_ids) + 2, source, target, capacity, backend)
+    if verbose:
+        print "Max flow run."
+
+    min_cut_classification = {}
+    for i in range(len(review_ids)):
+        if source_side[i + 2]:
+            min_cut_classification[review_ids[i]] = 0
+        else:
+            min_cut_classification[review_ids[i]] = 1
+
+    return min_cut_classification
 
 
 def main():
     print "working"
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+""" Compact review records whose text is read on demand.  A ReviewRecord keeps the review's ids, date, rating and influencer list in slots, and only the byte offset of its json line in the source file instead of its text; the text is decoded from a read-only memory map of the source file when a stage asks for it.  Records support the dictionary access used on review objects elsewhere (review["text"], "friend_reviews_of_business" in review, review.get(...)), so stages that read text still see it, and to_dict returns a plain review object for json output. """
+
+import os
+import re
+import json
+import mmap
+
+_RECORD_FIELDS = ("review_id", "user_id", "business_id", "date", "rating")
+# A string field without escapes, a number, or the influencer list.
+_FIELDS_PATTERN = re.compile(r'"(%s|friend_reviews_of_business)":\s*(?:"([^"\\]*)"|(-?[0-9]+(?:\.[0-9]+)?)[,}\s]|(\[[^\]]*\]))' % "|".join(_RECORD_FIELDS))
+_QUOTED_PATTERN = re.compile(r'"([^"]*)"')
+
+
+class TextSource(object):
+    """ A read-only memory map of a review json file, from which the text of the review on the line at a byte offset is decoded.  The map stays valid if the file is later replaced, and is shared by forked worker processes without a shared file position. """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as source_file:
+            if os.fstat(source_file.fileno()).st_size > 0:
+                self.data = mmap.mmap(source_file.fileno(), 0, access = mmap.ACCESS_READ)
+            else:
+                self.data = ""
+
+    def line_at(self, offset):
+        end = self.data.find('\n', offset)
+        if end < 0:
+            end = len(self.data)
+        return self.data[offset:end]
+
+    def text_at(self, offset):
+        return json.loads(self.line_at(offset))["text"]
+
+
+class ReviewRecord(object):
+    """ A review with its text loaded lazily from a TextSource.  friend_reviews_of_business is None when the review has no influencer list. """
+
+    __slots__ = ("review_id", "user_id", "business_id", "date", "rating", "friend_reviews_of_business", "_text", "_source", "_offset")
+
+    FIELDS = ("review_id", "user_id", "business_id", "rating", "text", "date", "friend_reviews_of_business")
+
+    def __init__(self, review_id, user_id, business_id, date, rating, friend_reviews_of_business = None, text = None, source = None, offset = None):
+        self.review_id = review_id
+        self.user_id = user_id
+        self.business_id = business_id
+        self.date = date
+        self.rating = rating
+        self.friend_reviews_of_business = friend_reviews_of_business
+        self._text = text
+        self._source = source
+        self._offset = offset
+
+    @property
+    def text(self):
+        if self._text is not None:
+            return self._text
+        return self._source.text_at(self._offset)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS or (key == "friend_reviews_of_business" and self.friend_reviews_of_business is None):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key == "text":
+            self._text = value
+        elif key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key == "friend_reviews_of_business":
+            return self.friend_reviews_of_business is not None
+        return key in self.FIELDS
+
+    def get(self, key, default = None):
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        return [key for key in self.FIELDS if key in self]
+
+    def to_dict(self):
+        """ Returns the review as a review object, with its text. """
+        return dict((key, self[key]) for key in self.keys())
+
+
+def _record_fields(line):
+    """ Returns a dictionary of the review_id, user_id, business_id, date, rating and, if the review has one, the influencer list of the review on line, or None if a value has escapes.  The fields are found in one regular expression scan of the line, as cleanyelp._string_field finds a field, so that the json escapes of the text are not decoded. """
+    fields = {}
+    for match in _FIELDS_PATTERN.finditer(line.decode('utf-8')):
+        field, string, number, string_list = match.groups()
+        if string is not None:
+            fields[field] = string
+        elif number is not None:
+            fields[field] = float(number) if '.' in number else int(number)
+        else:
+            # A list whose ids have escapes, or that was cut short at a "]" within an id, is left to json.
+            if '\\' in string_list or string_list.count('"') % 2:
+                return None
+            fields[field] = _QUOTED_PATTERN.findall(string_list)
+    influencers = "friend_reviews_of_business" in fields
+    if len(fields) - influencers < len(_RECORD_FIELDS) or (not influencers and '"friend_reviews_of_business"' in line):
+        return None
+    return fields
+
+
+def read_review_records(input_path):
+    """ Returns a dictionary of ReviewRecords for the reviews in the json file at input_path, keyed by review_id.  The fields of each review are found with regular expressions instead of parsing its json line, and its text is not kept; it is read back from input_path when accessed. """
+    source = TextSource(input_path)
+    review_dict = {}
+    offset = 0
+    with open(input_path, 'rb') as input_file:
+        for line in input_file:
+            if line.strip():
+                fields = _record_fields(line)
+                if fields is None:
+                    fields = json.loads(line)
+                review_dict[fields["review_id"]] = ReviewRecord(fields["review_id"], fields["user_id"], fields["business_id"], fields["date"], fields["rating"], fields.get("friend_reviews_of_business"), source = source, offset = offset)
+            offset += len(line)
+    return review_dict
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+
+""" Streaming statistics over the review and user files.  Reviews are externally sorted by business, so that the reviews of each business are contiguous, and the sorted file is split into byte ranges that start and end on business boundaries.  Each range is reduced in one pass to a ReviewStats of class counts, friend pair counts, per-class homophily and the distribution of reviews per business, holding only the reviews of one business at a time; the partial aggregates of the ranges are merged, in parallel when processes > 1.  Friend degrees and reviews per user come from one pass over the user file, whose friend sets and the positions of reviews in the users' review lists are the only data held for the whole run. """
+
+import os
+import json
+import heapq
+import shutil
+import tempfile
+import collections
+import multiprocessing
+import cleanyelp
+
+# Number of reviews sorted in memory at a time by sort_reviews_by_business.
+SORT_CHUNK_RECORDS = 200000
+
+# Set in the parent before the pool is forked so that statistics workers share the friend sets without pickling them.
+_stats_state = None
+
+
+class ReviewStats(object):
+    """ Mergeable aggregate statistics.  Counters are keyed by klass, or by the counted size for the distributions: business_size_counts maps a number of reviews to the number of businesses with that many, degree_counts maps a number of friends to the number of users with that many, and user_review_counts maps a number of reviews to the number of users who wrote that many.  Pairs are counted under the klass of their first review, and a pair is homophilous when both reviews share that klass. """
+
+    def __init__(self):
+        self.num_users = 0
+        self.num_reviews = 0
+        self.num_businesses = 0
+        self.num_pairs = 0
+        self.klass_counts = collections.Counter()
+        self.pair_klass_counts = collections.Counter()
+        self.homophily_counts = collections.Counter()
+        self.business_size_counts = collections.Counter()
+        self.degree_counts = collections.Counter()
+        self.user_review_counts = collections.Counter()
+
+    def merge(self, other):
+        """ Adds the counts of other to these and returns self. """
+        self.num_users += other.num_users
+        self.num_reviews += other.num_reviews
+        self.num_businesses += other.num_businesses
+        self.num_pairs += other.num_pairs
+        self.klass_counts.update(other.klass_counts)
+        self.pair_klass_counts.update(other.pair_klass_counts)
+        self.homophily_counts.update(other.homophily_counts)
+        self.business_size_counts.update(other.business_size_counts)
+        self.degree_counts.update(other.degree_counts)
+        self.user_review_counts.update(other.user_review_counts)
+        return self
+
+    def add_review(self, klass):
+        """ Counts one review of the given klass. """
+        self.num_reviews += 1
+        self.klass_counts[klass] += 1
+
+    def add_pair(self, first_klass, second_klass):
+        """ Counts one friend pair whose first and second reviews have the given klasses. """
+        self.num_pairs += 1
+        self.pair_klass_counts[first_klass] += 1
+        if first_klass == second_klass:
+            self.homophily_counts[first_klass] += 1
+
+    def pair_proportion(self, klass):
+        """ Returns the proportion of pairs whose first review has the given klass. """
+        if self.num_pairs == 0:
+            return 0.0
+        return self.pair_klass_counts[klass] / float(self.num_pairs)
+
+    def homophily(self, klass):
+        """ Returns the proportion of pairs with a first review of the given klass whose second review has the same klass. """
+        if self.pair_klass_counts[klass] == 0:
+            return 0.0
+        return self.homophily_counts[klass] / float(self.pair_klass_counts[klass])
+
+    def to_dict(self):
+        return {"num_users" : self.num_users, "num_reviews" : self.num_reviews, "num_businesses" : self.num_businesses, "num_pairs" : self.num_pairs, "klass_counts" : dict(self.klass_counts), "pair_klass_counts" : dict(self.pair_klass_counts), "homophily_counts" : dict(self.homophily_counts), "business_size_counts" : dict(self.business_size_counts), "degree_counts" : dict(self.degree_counts), "user_review_counts" : dict(self.user_review_counts)}
+
+
+def binary_klass(review):
+    """ Returns the binary klass of a review, converting its star rating when it has not been converted yet. """
+    rating = review.get("rating", review.get("stars"))
+    if isinstance(rating, basestring):
+        return rating
+    return cleanyelp._convert_star_rating_to_binary_klass(rating)
+
+
+def _business_key(line):
+    business_id = cleanyelp._string_field(line, cleanyelp._BUSINESS_ID_PATTERN, "business_id")
+    if isinstance(business_id, unicode):
+        business_id = business_id.encode('utf-8')
+    return business_id
+
+
+def _write_run(keyed_lines, run_path):
+    keyed_lines.sort()
+    with open(run_path, 'w') as run_file:
+        run_file.writelines(keyed_lines)
+
+
+def sort_reviews_by_business(input_path, output_path, chunk_records = SORT_CHUNK_RECORDS, temp_dir = None):
+    """ Writes the reviews in input_path to output_path sorted by business_id, keeping the input order of the reviews of each business.  At most chunk_records reviews are held in memory: sorted runs are written to a temporary directory and merged.  Returns the number of reviews written. """
+    run_dir = tempfile.mkdtemp(prefix = "review_sort_", dir = temp_dir)
+    try:
+        run_paths = []
+        keyed_lines = []
+        number = 0
+        with open(input_path) as input_file:
+            for line in input_file:
+                if not line.strip(): continue
+                if not line.endswith('\n'):
+                    line += '\n'
+                # The input position breaks ties so that each business keeps its input order through the merge.
+                keyed_lines.append("%s\t%012d\t%s" % (_business_key(line), number, line))
+                number += 1
+                if len(keyed_lines) >= chunk_records:
+                    run_paths.append(os.path.join(run_dir, "run%d" % len(run_paths)))
+                    _write_run(keyed_lines, run_paths[-1])
+                    keyed_lines = []
+        if keyed_lines:
+            run_paths.append(os.path.join(run_dir, "run%d" % len(run_paths)))
+            _write_run(keyed_lines, run_paths[-1])
+            keyed_lines = []
+
+        run_files = [open(run_path) for run_path in run_paths]
+        try:
+            with open(output_path, 'w') as output_file:
+                for keyed_line in heapq.merge(*run_files):
+                    output_file.write(keyed_line.split('\t', 2)[2])
+        finally:
+            for run_file in run_files:
+                run_file.close()
+    finally:
+        shutil.rmtree(run_dir)
+    return number
+
+
+def business_aligned_ranges(sorted_path, num_shards):
+    """ Splits a review file sorted by business into at most num_shards (start, end) byte ranges of roughly equal size, each starting on the first review of a business, so that no business is split between ranges. """
+    file_size = os.path.getsize(sorted_path)
+    boundaries = [0]
+    with open(sorted_path, 'rb') as sorted_file:
+        for shard in range(1, num_shards):
+            target = max(boundaries[-1], file_size * shard // num_shards)
+            sorted_file.seek(target)
+            if target > 0:
+                sorted_file.readline()
+            # Move forward past the rest of the business that the line at the aligned position belongs to.
+            position = sorted_file.tell()
+            line = sorted_file.readline()
+            if not line:
+                break
+            business_id = _business_key(line)
+            while line and _business_key(line) == business_id:
+                position = sorted_file.tell()
+                line = sorted_file.readline()
+            if not line:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(file_size)
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1) if boundaries[i + 1] > boundaries[i]]
+
+
+def _range_lines(file_path, start, end):
+    """ Yields the lines of the file at file_path that start in the byte range [start, end). """
+    with open(file_path, 'rb') as input_file:
+        input_file.seek(start)
+        position = start
+        while position < end:
+            line = input_file.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+
+def _add_business(stats, reviewers, num_reviews, friend_sets, pair_order):
+    """ Counts one business: its size and the friend pairs among its reviewers.  reviewers maps each reviewer to (review_id, date, klass, position) of the reviewer's review of the business that comes last in the reviewer's review list, which stands for the reviewer as in cleanyelp.find_review_pairs_by_friends. """
+    stats.num_businesses += 1
+    stats.business_size_counts[num_reviews] += 1
+    if len(reviewers) < 2:
+        return
+    for user_id in reviewers:
+        friends = friend_sets.get(user_id)
+        if not friends: continue
+        user_review = reviewers[user_id]
+        if len(friends) < len(reviewers):
+            friends_of_business = [friend_id for friend_id in friends if friend_id in reviewers]
+        else:
+            friends_of_business = [friend_id for friend_id in reviewers if friend_id in friends]
+        for friend_id in friends_of_business:
+            friend_review = reviewers[friend_id]
+            pair = pair_order(user_review[:2], friend_review[:2])
+            if pair is None: continue
+            if pair[0] == user_review[0]:
+                first, second = user_review, friend_review
+            else:
+                first, second = friend_review, user_review
+            stats.add_pair(first[2], second[2])
+
+
+def _shard_stats(byte_range):
+    """ Statistics worker.  Reduces the reviews in one business-aligned byte range of the sorted review file to a ReviewStats. """
+    sorted_path, friend_sets, review_positions, klass_of, pair_order, known_users_only = _stats_state
+    start, end = byte_range
+    stats = ReviewStats()
+    business_id = None
+    reviewers = {}
+    num_reviews = 0
+    for line in _range_lines(sorted_path, start, end):
+        if not line.strip(): continue
+        review = json.loads(line)
+        user_id = review["user_id"]
+        if known_users_only and user_id not in friend_sets: continue
+        if review["business_id"] != business_id:
+            if business_id is not None:
+                _add_business(stats, reviewers, num_reviews, friend_sets, pair_order)
+            business_id = review["business_id"]
+            reviewers = {}
+            num_reviews = 0
+        klass = klass_of(review)
+        stats.add_review(klass)
+        num_reviews += 1
+        # As in cleanyelp.business_reviewers_index, a reviewer's reviews are those in the reviewer's review list, in the order of that list.
+        position = review_positions.get(review["review_id"])
+        if user_id in friend_sets and position is not None:
+            if user_id not in reviewers or position > reviewers[user_id][3]:
+                reviewers[user_id] = (review["review_id"], review["date"], klass, position)
+    if business_id is not None:
+        _add_business(stats, reviewers, num_reviews, friend_sets, pair_order)
+    return stats
+
+
+def read_friend_sets(user_path):
+    """ Streams the user file and returns (friend_sets, review_positions, stats), where friend_sets maps each user_id to the set of the user's friends, review_positions maps each review_id to its position in its author's review list, and stats holds the user count and the distributions of friends and of reviews per user. """
+    friend_sets = {}
+    review_positions = {}
+    stats = ReviewStats()
+    with open(user_path) as user_file:
+        for line in user_file:
+            if not line.strip(): continue
+            user = json.loads(line)
+            friend_sets[user["user_id"]] = set(user["friends"])
+            for position, review_id in enumerate(user.get("reviews", ())):
+                review_positions[review_id] = position
+            stats.num_users += 1
+            stats.degree_counts[len(user["friends"])] += 1
+            stats.user_review_counts[len(user.get("reviews", ()))] += 1
+    return friend_sets, review_positions, stats
+
+
+def compute_review_statistics(review_path, user_path, klass_of = binary_klass, pair_order = None, known_users_only = False, processes = None, num_shards = None, presorted = False, sorted_path = None):
+    """ Returns a ReviewStats for the reviews in review_path and the users in user_path.  klass_of maps a review to its klass, and pair_order orders the (review_id, date) tuples of two friends' reviews of a business as in cleanyelp.find_review_pairs_by_friends, defaulting to cleanyelp.later_earlier_pair.  Reviews by users not in user_path count towards the class and business counts unless known_users_only is True, and never form pairs; neither do reviews missing from their author's review list.  Unless presorted is True the reviews are first sorted by business into sorted_path, by default review_path with a .by_business suffix, which is removed afterwards.  The sorted file is reduced in num_shards business-aligned ranges (by default four per process) on processes worker processes. """
+    global _stats_state
+    if pair_order is None:
+        pair_order = cleanyelp.later_earlier_pair
+    friend_sets, review_positions, stats = read_friend_sets(user_path)
+
+    remove_sorted = False
+    if presorted:
+        sorted_path = review_path
+    else:
+        if sorted_path is None:
+            sorted_path = review_path + ".by_business"
+            remove_sorted = True
+        sort_reviews_by_business(review_path, sorted_path)
+
+    if num_shards is None:
+        num_shards = (processes or multiprocessing.cpu_count()) * 4
+    shards = business_aligned_ranges(sorted_path, num_shards)
+    _stats_state = (sorted_path, friend_sets, review_positions, klass_of, pair_order, known_users_only)
+    try:
+        if processes == 1:
+            partials = [_shard_stats(shard) for shard in shards]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                partials = pool.map(_shard_stats, shards)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _stats_state = None
+        if remove_sorted:
+            os.remove(sorted_path)
+
+    for partial in partials:
+        stats.merge(partial)
+    return stats
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+
+""" A compact, memory-mapped columnar store for Yelp reviews.  Review, user and business ids are interned to integers, dates are kept as days since the epoch, ratings as int8 and review text as a single utf-8 blob indexed by byte offsets.  The review ids are also written in sorted order, so that a review is found by binary search without building an index in memory.  A store is written once and then opened by later stages without parsing any json. """
+
+import os
+import json
+import array
+import datetime
+import collections
+import numpy
+import temporalindex
+
+EPOCH = datetime.date(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+def _date_to_days(date_string):
+    """ Converts a "YYYY-MM-DD" date string to the number of days since the epoch. """
+    return temporalindex.date_ordinal(date_string) - EPOCH_ORDINAL
+
+
+def _days_to_date(days):
+    """ Converts a number of days since the epoch back to a "YYYY-MM-DD" date string. """
+    return temporalindex.ordinal_date_string(int(days) + EPOCH_ORDINAL)
+
+
+def _utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class _Interner(object):
+    """ Assigns consecutive integer codes to strings in order of first appearance. """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        value = _utf8(value)
+        if value in self.codes:
+            return self.codes[value]
+        code = len(self.values)
+        self.codes[value] = code
+        self.values.append(value)
+        return code
+
+    def save(self, path):
+        width = max([len(value) for value in self.values] or [1])
+        numpy.save(path, numpy.array(self.values, dtype = "S%d" % width))
+
+
+def write_review_store(reviews, store_path):
+    """ Writes the review objects in reviews (a list, or a dictionary keyed by review_id) to a columnar store in the directory store_path.  Ratings may be star values or klass labels such as "positive" and "negative".  If reviews carry a "friend_reviews_of_business" list it is stored as an adjacency list over review codes. """
+    if isinstance(reviews, dict):
+        reviews = reviews.itervalues()
+    if not os.path.isdir(store_path):
+        os.makedirs(store_path)
+
+    review_ids = _Interner()
+    user_ids = _Interner()
+    business_ids = _Interner()
+    users = array.array('i')
+    businesses = array.array('i')
+    dates = array.array('i')
+    ratings = []
+    text_offsets = array.array('l', [0])
+    influencer_indptr = array.array('l', [0])
+    influencer_ids = []
+    has_influencers = False
+
+    with open(os.path.join(store_path, "text.bin"), 'wb') as text_file:
+        for review in reviews:
+            review_ids.code(review["review_id"])
+            users.append(user_ids.code(review["user_id"]))
+            businesses.append(business_ids.code(review["business_id"]))
+            dates.append(_date_to_days(review["date"]))
+            ratings.append(review["rating"])
+            text = _utf8(review["text"])
+            text_file.write(text)
+            text_offsets.append(text_offsets[-1] + len(text))
+            if "friend_reviews_of_business" in review:
+                has_influencers = True
+                influencer_ids.extend(review["friend_reviews_of_business"])
+            influencer_indptr.append(len(influencer_ids))
+
+    count = len(review_ids.values)
+    # Ratings are stored directly when they are star values, and as indices into a sorted label list when they are klass names.
+    rating_labels = None
+    if any(isinstance(rating, basestring) for rating in ratings):
+        rating_labels = sorted(set(ratings))
+        label_codes = dict((label, code) for code, label in enumerate(rating_labels))
+        ratings = [label_codes[rating] for rating in ratings]
+
+    numpy.save(os.path.join(store_path, "user.npy"), numpy.fromiter(users, dtype = numpy.int32, count = count))
+    numpy.save(os.path.join(store_path, "business.npy"), numpy.fromiter(businesses, dtype = numpy.int32, count = count))
+    numpy.save(os.path.join(store_path, "date.npy"), numpy.fromiter(dates, dtype = numpy.int32, count = count))
+    numpy.save(os.path.join(store_path, "rating.npy"), numpy.array(ratings, dtype = numpy.int8))
+    numpy.save(os.path.join(store_path, "text_offsets.npy"), numpy.fromiter(text_offsets, dtype = numpy.int64, count = count + 1))
+    if has_influencers:
+        # Influencers outside of this store are interned after the stored reviews so that their ids survive a round trip.
+        indices = numpy.array([review_ids.code(influencer_id) for influencer_id in influencer_ids], dtype = numpy.int32)
+        numpy.save(os.path.join(store_path, "influencer_indptr.npy"), numpy.fromiter(influencer_indptr, dtype = numpy.int64, count = count + 1))
+        numpy.save(os.path.join(store_path, "influencer_indices.npy"), indices)
+    review_ids.save(os.path.join(store_path, "review_ids.npy"))
+    user_ids.save(os.path.join(store_path, "user_ids.npy"))
+    business_ids.save(os.path.join(store_path, "business_ids.npy"))
+    sorted_ids, id_order = _sorted_id_index(numpy.load(os.path.join(store_path, "review_ids.npy"))[:count])
+    numpy.save(os.path.join(store_path, "review_ids_sorted.npy"), sorted_ids)
+    numpy.save(os.path.join(store_path, "review_id_order.npy"), id_order)
+
+    _write_meta(store_path, {"count" : count, "rating_labels" : rating_labels, "has_influencers" : has_influencers, "subset_sources" : {}})
+
+
+def _sorted_id_index(review_ids):
+    """ Returns the review ids in sorted order and, for each, the row it was stored at. """
+    id_order = numpy.argsort(review_ids, kind = "mergesort").astype(numpy.int32)
+    return review_ids[id_order], id_order
+
+
+def _write_meta(store_path, meta):
+    with open(os.path.join(store_path, "meta.json"), 'w') as meta_file:
+        json.dump(meta, meta_file)
+
+
+class ReviewStore(object):
+    """ A read-only, memory-mapped view of a store written by write_review_store.  Rows are numbered in the order the reviews were written. """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        with open(os.path.join(store_path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        self.meta = meta
+        self.count = meta["count"]
+        self.rating_labels = meta["rating_labels"]
+        self.review_ids = self._load("review_ids.npy")
+        self.user_ids = self._load("user_ids.npy")
+        self.business_ids = self._load("business_ids.npy")
+        self.user = self._load("user.npy")
+        self.business = self._load("business.npy")
+        self.date = self._load("date.npy")
+        self.rating = self._load("rating.npy")
+        self.text_offsets = self._load("text_offsets.npy")
+        if meta["has_influencers"]:
+            self.influencer_indptr = self._load("influencer_indptr.npy")
+            self.influencer_indices = self._load("influencer_indices.npy")
+        else:
+            self.influencer_indptr = None
+            self.influencer_indices = None
+        if self.text_offsets[-1] > 0:
+            self.text_blob = numpy.memmap(os.path.join(store_path, "text.bin"), dtype = numpy.uint8, mode = 'r')
+        else:
+            self.text_blob = numpy.zeros(0, dtype = numpy.uint8)
+        if os.path.exists(os.path.join(store_path, "review_id_order.npy")):
+            self.sorted_ids = self._load("review_ids_sorted.npy")
+            self.id_order = self._load("review_id_order.npy")
+        else:
+            # Stores written before the sorted id column existed are indexed in memory, as numpy arrays.
+            self.sorted_ids, self.id_order = _sorted_id_index(numpy.asarray(self.review_ids[:self.count]))
+
+    def _load(self, name):
+        return numpy.load(os.path.join(self.store_path, name), mmap_mode = 'r')
+
+    def __len__(self):
+        return self.count
+
+    def row(self, review_id):
+        """ Returns the row number of the review with the given review_id, found by binary search in the sorted id column.  Raises KeyError if the store has no such review. """
+        review_id = _utf8(review_id)
+        position = int(numpy.searchsorted(self.sorted_ids, review_id))
+        if position >= self.count or str(self.sorted_ids[position]) != review_id:
+            raise KeyError(review_id)
+        return int(self.id_order[position])
+
+    def review_id(self, row):
+        return str(self.review_ids[row])
+
+    def text(self, row):
+        start = self.text_offsets[row]
+        end = self.text_offsets[row + 1]
+        return self.text_blob[start:end].tostring().decode('utf-8')
+
+    def rating_of(self, row):
+        rating = int(self.rating[row])
+        if self.rating_labels is not None:
+            return self.rating_labels[rating]
+        return rating
+
+    def influencers(self, row):
+        """ Returns the list of influencer review_ids stored for the given row. """
+        start = self.influencer_indptr[row]
+        end = self.influencer_indptr[row + 1]
+        return [str(self.review_ids[code]) for code in self.influencer_indices[start:end]]
+
+    def review(self, row):
+        """ Returns the review at the given row as a review object, as read_reviews_to_dict would return it. """
+        review = {"review_id" : self.review_id(row), "user_id" : str(self.user_ids[self.user[row]]), "business_id" : str(self.business_ids[self.business[row]]), "rating" : self.rating_of(row), "text" : self.text(row), "date" : _days_to_date(self.date[row])}
+        if self.influencer_indptr is not None:
+            review["friend_reviews_of_business"] = self.influencers(row)
+        return review
+
+    def write_subset(self, name, review_ids, source_digest = None):
+        """ Saves the rows of the given review_ids as a named subset of the store, e.g. "train" or "test".  source_digest identifies the file the subset was taken from, such as the sha1 of ./train_reviews.json, so that readers can tell whether that file still holds the same reviews. """
+        rows = numpy.array([self.row(review_id) for review_id in review_ids], dtype = numpy.int32)
+        numpy.save(os.path.join(self.store_path, "subset_%s.npy" % name), rows)
+        self.meta.setdefault("subset_sources", {})[name] = source_digest
+        _write_meta(self.store_path, self.meta)
+
+    def subset_source(self, name):
+        """ Returns the source_digest recorded for the named subset, or None. """
+        return self.meta.get("subset_sources", {}).get(name)
+
+    def has_subset(self, name):
+        return os.path.exists(os.path.join(self.store_path, "subset_%s.npy" % name))
+
+    def subset_rows(self, name):
+        return self._load("subset_%s.npy" % name)
+
+    def review_dict(self, subset = None):
+        """ Returns a StoreReviewDict over all rows of the store, or over the rows of the named subset. """
+        if subset is None:
+            rows = numpy.arange(self.count, dtype = numpy.int32)
+        else:
+            rows = self.subset_rows(subset)
+        return StoreReviewDict(self, rows)
+
+
+class _StoreReview(dict):
+    """ A review object built from a store row.  The first change to one of its fields keeps it in the StoreReviewDict it was read from, so that the change persists, while reviews that are only read are not kept. """
+
+    __slots__ = ("_owner", "_review_id")
+
+    def __init__(self, review, owner, review_id):
+        dict.__init__(self, review)
+        self._owner = owner
+        self._review_id = review_id
+
+    def _changed(self):
+        if self._owner is not None:
+            self._owner._keep(self._review_id, self)
+            self._owner = None
+
+    def __setitem__(self, key, value):
+        self._changed()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._changed()
+        dict.__delitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        self._changed()
+        dict.update(self, *args, **kwargs)
+
+    def setdefault(self, key, default = None):
+        self._changed()
+        return dict.setdefault(self, key, default)
+
+    def pop(self, *args):
+        self._changed()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._changed()
+        return dict.popitem(self)
+
+    def clear(self):
+        self._changed()
+        dict.clear(self)
+
+    def __reduce__(self):
+        # Copies, pickles and worker processes get a plain review object.
+        return (dict, (dict(self),))
+
+
+class StoreReviewDict(collections.MutableMapping):
+    """ A dictionary of reviews keyed by review_id, backed by a ReviewStore.  Review objects are built from the columns on each access and are not kept, so iterating over the dictionary holds only one review at a time.  Objects assigned into the dictionary are kept in memory, and so is a review read from the store once one of its fields is changed in place, so that the change persists.  Changes inside a field's value, such as appending to its influencer list, are not seen; assign the review back after them. """
+
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+        self._in_rows = None
+        self._overrides = {}
+        self._deleted = set()
+
+    def _stored_row(self, review_id):
+        """ Returns the store row of review_id if it is one of this dictionary's rows, and None otherwise. """
+        if self._in_rows is None:
+            self._in_rows = numpy.zeros(self.store.count, dtype = bool)
+            self._in_rows[self.rows] = True
+        try:
+            row = self.store.row(review_id)
+        except KeyError:
+            return None
+        if not self._in_rows[row]:
+            return None
+        return row
+
+    def _keep(self, review_id, review):
+        if review_id not in self._deleted and review_id not in self._overrides:
+            self._overrides[review_id] = review
+
+    def __len__(self):
+        return len(self.rows) - len(self._deleted) + len([review_id for review_id in self._overrides if self._stored_row(review_id) is None])
+
+    def __iter__(self):
+        for row in self.rows:
+            review_id = self.store.review_id(row)
+            if review_id not in self._deleted:
+                yield review_id
+        for review_id in self._overrides:
+            if self._stored_row(review_id) is None:
+                yield review_id
+
+    def __contains__(self, review_id):
+        review_id = _utf8(review_id)
+        if review_id in self._overrides:
+            return True
+        return review_id not in self._deleted and self._stored_row(review_id) is not None
+
+    def __getitem__(self, review_id):
+        review_id = _utf8(review_id)
+        if review_id in self._overrides:
+            return self._overrides[review_id]
+        if review_id in self._deleted:
+            raise KeyError(review_id)
+        row = self._stored_row(review_id)
+        if row is None:
+            raise KeyError(review_id)
+        return _StoreReview(self.store.review(row), self, review_id)
+
+    def __setitem__(self, review_id, review):
+        review_id = _utf8(review_id)
+        self._deleted.discard(review_id)
+        self._overrides[review_id] = review
+
+    def __delitem__(self, review_id):
+        review_id = _utf8(review_id)
+        if review_id not in self:
+            raise KeyError(review_id)
+        self._overrides.pop(review_id, None)
+        if self._stored_row(review_id) is not None:
+            self._deleted.add(review_id)
+
+    def keys(self):
+        return list(self)
+
+
+def open_review_dict(store_path, subset = None):
+    """ Opens the store at store_path and returns a dictionary of its reviews, or of the reviews in the named subset. """
+    return ReviewStore(store_path).review_dict(subset)
+
+
+def main():
+    store = ReviewStore("./reviews.store")
+    print "Reviews in store:", len(store)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,26 @@ import readyelp
 import cleanyelp
 import splitdata
 import baselineclassifier
+import classifyyelp
+import pipeline
+import instrument
 import sys
 
+def baseline_split_stage(inputs):
+    splitdata.main()
+    cleanyelp.filter_users()
+
 review_path = sys.argv[1]
 user_path = sys.argv[2]
 
-reviews = []
-users = []
-reviews_by_user = {}
-readyelp.parse_review_dataset_file(reviews, reviews_by_user, review_path)
-readyelp.parse_user_dataset_file(users, reviews_by_user, user_path)
-readyelp.write_output(reviews, "reviews.json")
-readyelp.write_output(users, "users.json")
+instrument.enable()
 
-splitdata.main()
+# Parsing and splitting are skipped when their inputs have not changed since the last run.
+stages = pipeline.Pipeline()
+stages.add(pipeline.Stage("ingest", classifyyelp.ingest_stage, params = {"review_path" : review_path, "user_path" : user_path}, input_files = [review_path, user_path], output_files = ["./reviews.json", "./users.json"]))
+stages.add(pipeline.Stage("baseline_split", baseline_split_stage, ["ingest"], output_files = ["./clean_reviews.json", "./train_reviews.json", "./test_reviews.json", "./users_limited.json"]))
+stages.run()
 
-baselineclassifier.main()
\ No newline at end of file
+with instrument.span("baseline"):
+    baselineclassifier.main()
+instrument.write_report()
\ No newline at end of file
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+""" A compact social graph of Yelp users.  User ids are interned to int32 codes and friendships are held as CSR arrays: the friends of the user with code u are indices[indptr[u]:indptr[u + 1]], sorted, without duplicates, and symmetric, so that a friendship listed by either user is seen from both sides.  Users from the user file take the first codes; friends that have no record of their own are interned after them.  Each user's review_ids are kept in a second CSR pair.  A graph can be saved as .npy files and loaded memory-mapped, and user_dict() gives a read-only view with the interface of readyelp.read_users_to_dict for the existing functions. """
+
+import os
+import json
+import array
+import collections
+import numpy
+import reviewstore
+
+
+class SocialGraph(object):
+    """ A symmetric friendship graph in CSR form.  Methods take user_id strings unless their name says they take codes. """
+
+    def __init__(self, user_ids, num_users, indptr, indices, review_indptr, review_ids):
+        self.user_ids = user_ids
+        self.num_users = num_users
+        self.indptr = indptr
+        self.indices = indices
+        self.review_indptr = review_indptr
+        self.review_ids = review_ids
+        self._codes = None
+
+    @classmethod
+    def from_users(cls, users):
+        """ Builds a graph from user objects (with user_id, friends and optionally reviews), given as an iterable or as a dictionary keyed by user_id. """
+        if isinstance(users, dict):
+            users = users.itervalues()
+        interner = reviewstore._Interner()
+        user_codes = array.array('i')
+        sources = array.array('i')
+        targets = array.array('i')
+        review_ids = []
+        review_indptr = array.array('l', [0])
+        for user in users:
+            code = interner.code(user["user_id"])
+            user_codes.append(code)
+            for friend_id in user["friends"]:
+                sources.append(code)
+                targets.append(interner.code(friend_id))
+            review_ids.extend(reviewstore._utf8(review_id) for review_id in user.get("reviews", ()))
+            review_indptr.append(len(review_ids))
+
+        # Renumber so that the users with records come first, in the order they were read.
+        num_users = len(user_codes)
+        num_nodes = len(interner.values)
+        is_user = numpy.zeros(num_nodes, dtype = bool)
+        user_codes = numpy.fromiter(user_codes, dtype = numpy.int32, count = num_users)
+        is_user[user_codes] = True
+        order = numpy.concatenate((user_codes, numpy.nonzero(~is_user)[0].astype(numpy.int32)))
+        new_code = numpy.empty(num_nodes, dtype = numpy.int64)
+        new_code[order] = numpy.arange(num_nodes)
+        width = max([len(value) for value in interner.values] or [1])
+        user_ids = numpy.array([interner.values[code] for code in order], dtype = "S%d" % width)
+
+        sources = new_code[numpy.fromiter(sources, dtype = numpy.int32, count = len(sources))]
+        targets = new_code[numpy.fromiter(targets, dtype = numpy.int32, count = len(targets))]
+        # Both directions of every listed friendship, without self-loops, sorted and deduplicated through a single int64 key.
+        keep = sources != targets
+        keys = numpy.unique(numpy.concatenate((sources[keep] * num_nodes + targets[keep], targets[keep] * num_nodes + sources[keep])))
+        rows = keys // max(num_nodes, 1)
+        indices = (keys % max(num_nodes, 1)).astype(numpy.int32)
+        indptr = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(rows, minlength = num_nodes)))).astype(numpy.int64)
+
+        width = max([len(review_id) for review_id in review_ids] or [1])
+        review_indptr = numpy.fromiter(review_indptr, dtype = numpy.int64, count = num_users + 1)
+        return cls(user_ids, num_users, indptr, indices, review_indptr, numpy.array(review_ids, dtype = "S%d" % width))
+
+    @classmethod
+    def from_user_file(cls, user_path):
+        """ Builds a graph from a user json file such as users.json, streaming its records. """
+        def records():
+            with open(user_path) as user_file:
+                for line in user_file:
+                    if not line.strip(): continue
+                    yield json.loads(line)
+        return cls.from_users(records())
+
+    @classmethod
+    def load(cls, graph_path):
+        """ Opens a graph saved with save, memory-mapping its arrays. """
+        with open(os.path.join(graph_path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        def load(name):
+            return numpy.load(os.path.join(graph_path, name), mmap_mode = 'r')
+        return cls(load("user_ids.npy"), meta["num_users"], load("indptr.npy"), load("indices.npy"), load("review_indptr.npy"), load("review_ids.npy"))
+
+    def save(self, graph_path):
+        """ Writes the graph to the directory graph_path as .npy files. """
+        if not os.path.isdir(graph_path):
+            os.makedirs(graph_path)
+        numpy.save(os.path.join(graph_path, "user_ids.npy"), self.user_ids)
+        numpy.save(os.path.join(graph_path, "indptr.npy"), self.indptr)
+        numpy.save(os.path.join(graph_path, "indices.npy"), self.indices)
+        numpy.save(os.path.join(graph_path, "review_indptr.npy"), self.review_indptr)
+        numpy.save(os.path.join(graph_path, "review_ids.npy"), self.review_ids)
+        with open(os.path.join(graph_path, "meta.json"), 'w') as meta_file:
+            json.dump({"num_users" : self.num_users, "num_nodes" : self.num_nodes, "num_edges" : len(self.indices) // 2}, meta_file)
+
+    @property
+    def num_nodes(self):
+        return len(self.indptr) - 1
+
+    def code(self, user_id):
+        """ Returns the code of a user_id.  The id index is built on first use.  Raises KeyError for unknown ids. """
+        if self._codes is None:
+            self._codes = dict((str(user_id), code) for code, user_id in enumerate(self.user_ids))
+        return self._codes[reviewstore._utf8(user_id)]
+
+    def user_id(self, code):
+        return str(self.user_ids[code])
+
+    def friend_codes(self, code):
+        """ Returns the sorted array of the codes of a user's friends. """
+        return self.indices[self.indptr[code]:self.indptr[code + 1]]
+
+    def degree(self, user_id):
+        code = self.code(user_id)
+        return int(self.indptr[code + 1] - self.indptr[code])
+
+    def friends(self, user_id):
+        """ Returns the list of the user_ids of a user's friends. """
+        return [str(self.user_ids[friend]) for friend in self.friend_codes(self.code(user_id))]
+
+    def are_friends_codes(self, code, other_code):
+        """ Returns whether two users, given by code, are friends, by binary search in the first user's friend list. """
+        friends = self.friend_codes(code)
+        position = numpy.searchsorted(friends, other_code)
+        return bool(position < len(friends) and friends[position] == other_code)
+
+    def are_friends(self, user_id, other_id):
+        return self.are_friends_codes(self.code(user_id), self.code(other_id))
+
+    def reviews_of_code(self, code):
+        if code >= self.num_users:
+            return []
+        return [str(review_id) for review_id in self.review_ids[self.review_indptr[code]:self.review_indptr[code + 1]]]
+
+    def user_dict(self):
+        """ Returns a GraphUserDict over the users of this graph. """
+        return GraphUserDict(self)
+
+
+class GraphUserDict(collections.Mapping):
+    """ A read-only dictionary of user objects keyed by user_id, as read_users_to_dict returns, built from a SocialGraph on access.  It holds the users that had records when the graph was built; their friends lists are the symmetrised friendships of the graph. """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def _user_code(self, user_id):
+        try:
+            code = self.graph.code(user_id)
+        except KeyError:
+            return None
+        if code >= self.graph.num_users:
+            return None
+        return code
+
+    def __len__(self):
+        return self.graph.num_users
+
+    def __iter__(self):
+        for code in xrange(self.graph.num_users):
+            yield self.graph.user_id(code)
+
+    def __contains__(self, user_id):
+        return self._user_code(user_id) is not None
+
+    def __getitem__(self, user_id):
+        code = self._user_code(user_id)
+        if code is None:
+            raise KeyError(user_id)
+        return {"user_id" : self.graph.user_id(code), "friends" : [self.graph.user_id(friend) for friend in self.graph.friend_codes(code)], "reviews" : self.graph.reviews_of_code(code)}
+
+    def keys(self):
+        return list(self)
+
+
+def write_social_graph(user_path, graph_path):
+    """ Builds the graph of the user json file at user_path and saves it to graph_path.  Returns the graph. """
+    graph = SocialGraph.from_user_file(user_path)
+    graph.save(graph_path)
+    return graph
+
+
+def open_user_dict(graph_path):
+    """ Loads the graph saved at graph_path memory-mapped and returns its user dictionary view. """
+    return SocialGraph.load(graph_path).user_dict()
+
+
+def main():
+    graph = write_social_graph("./users_limited.json", "./users.graph")
+    print "Users, friend nodes, friendships:", graph.num_users, graph.num_nodes, len(graph.indices) // 2
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,8 @@ def main():
     """ Splits the review data in reviews.json into training and testing data sets.  Reviews created on or before split_date are placed in the training set and reviews created afterward are placed in the test set. """
 
     users = readyelp.read_users_to_dict("./users.json")
-    reviews = readyelp.read_reviews_to_dict("./reviews.json")
-    cleanyelp.clean_review_dict(reviews, users)
+    reviews = readyelp.read_reviews_to_dict("./reviews.json", lazy_text = True)
+    cleanyelp.clean_review_dict(reviews, users, output_path = "./clean_reviews.json")
 
     split_date = cleanyelp.median_date(reviews)
 
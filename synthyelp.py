@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+""" Generates synthetic review and user files in the schema of the Yelp Academic Dataset, for benchmarking without the licensed dump.  Friend degrees follow a power law, business popularity is Zipf-distributed, a share of reviews follow a friend to a business they reviewed, and a review copies the rating of an earlier friend's review of the same business at the homophily rate.  Review text is drawn from a filler vocabulary mixed with positive or negative lexicon words according to the rating, so that text classifiers have signal to find.  Output is determined by the seed. """
+
+import sys
+import json
+import random
+import base64
+import bisect
+import hashlib
+import datetime
+import crffeatures
+
+FILLER_WORDS = ["food", "service", "place", "time", "menu", "order", "table", "staff", "lunch", "dinner", "price", "wait", "drink", "bar", "pizza", "burger", "salad", "chicken", "coffee", "sandwich", "sushi", "taco", "beer", "wine", "dessert", "room", "parking", "location", "night", "weekend", "friend", "family", "portion", "sauce", "side", "visit", "server", "kitchen", "patio", "breakfast"]
+
+# Sorted so that the generated text does not depend on set ordering.
+POSITIVE_WORDS = sorted(crffeatures.POSITIVE_WORDS)
+NEGATIVE_WORDS = sorted(crffeatures.NEGATIVE_WORDS)
+
+FIRST_DATE = datetime.date(2005, 1, 1)
+LAST_DATE = datetime.date(2014, 12, 31)
+
+
+def _yelp_id(kind, number, seed):
+    """ Returns a 22 character url-safe id, as used for users, reviews and businesses in the dataset. """
+    return base64.urlsafe_b64encode(hashlib.md5("%s %d %d" % (kind, seed, number)).digest())[:22]
+
+
+def _cumulative(weights):
+    total = 0.0
+    cumulative = []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def _weighted_choice(rng, cumulative):
+    """ Returns an index drawn with probability proportional to its weight, given the cumulative weights. """
+    return bisect.bisect_right(cumulative, rng.random() * cumulative[-1])
+
+
+def power_law_friend_graph(rng, num_users, degree_exponent = 2.5, min_degree = 1, max_degree = 5000):
+    """ Returns a list of friend sets for num_users users.  Target degrees are drawn from a power law with the given exponent and joined by random stub matching; self-loops and repeated pairs are dropped, so realised degrees are at most the targets. """
+    stubs = []
+    for user in xrange(num_users):
+        degree = min(max_degree, int(min_degree * rng.paretovariate(degree_exponent - 1)))
+        stubs.extend([user] * degree)
+    rng.shuffle(stubs)
+    friends = [set() for user in xrange(num_users)]
+    for i in xrange(0, len(stubs) - 1, 2):
+        a = stubs[i]
+        b = stubs[i + 1]
+        if a != b:
+            friends[a].add(b)
+            friends[b].add(a)
+    return friends
+
+
+def _review_text(rng, klass_words, num_words, sentiment_rate):
+    words = []
+    for i in xrange(num_words):
+        if rng.random() < sentiment_rate:
+            words.append(rng.choice(klass_words))
+        else:
+            words.append(FILLER_WORDS[min(int(rng.paretovariate(1.0)) - 1, len(FILLER_WORDS) - 1)])
+    return " ".join(words).capitalize() + "."
+
+
+def generate_dataset(review_path, user_path, num_users = 10000, num_reviews = 100000, num_businesses = None, degree_exponent = 2.5, min_degree = 3, business_skew = 1.1, social_rate = 0.3, homophily = 0.7, sentiment_rate = 0.15, seed = 0):
+    """ Writes num_reviews reviews to review_path and num_users users to user_path, one json object per line as in the Yelp Academic Dataset.  num_businesses defaults to one business per 20 reviews.  Friend degrees follow a power law with exponent degree_exponent and a minimum of min_degree.  Business popularity is Zipf-distributed with exponent business_skew.  A review follows a random friend of its author to a business that friend has reviewed with probability social_rate and, when friends of the author have already reviewed the business, copies the stars of one of those reviews with probability homophily.  Returns a dictionary of counts describing the generated data. """
+    rng = random.Random(seed)
+    if num_businesses is None:
+        num_businesses = max(1, num_reviews // 20)
+    user_ids = [_yelp_id("user", i, seed) for i in xrange(num_users)]
+    business_ids = [_yelp_id("business", i, seed) for i in xrange(num_businesses)]
+    friends = power_law_friend_graph(rng, num_users, degree_exponent, min_degree)
+
+    # Users write reviews at heavy-tailed rates, and businesses have a base quality that sets their typical stars.
+    user_activity = _cumulative([rng.paretovariate(1.5) for user in xrange(num_users)])
+    user_bias = [rng.gauss(0, 0.5) for user in xrange(num_users)]
+    business_popularity = _cumulative([1.0 / (rank + 1) ** business_skew for rank in xrange(num_businesses)])
+    business_quality = [rng.uniform(2.0, 4.5) for business in xrange(num_businesses)]
+
+    span_days = (LAST_DATE - FIRST_DATE).days
+    reviews = sorted((rng.randint(0, span_days), _weighted_choice(rng, user_activity)) for i in xrange(num_reviews))
+
+    # user -> businesses reviewed so far, and business -> {user : stars of that user's review}
+    user_businesses = [[] for user in xrange(num_users)]
+    business_stars = [{} for business in xrange(num_businesses)]
+    review_counts = [0] * num_users
+    star_totals = [0] * num_users
+    num_followed = 0
+    num_copied = 0
+    with open(review_path, 'w') as review_file:
+        for number, (day, user) in enumerate(reviews):
+            business = None
+            if friends[user] and rng.random() < social_rate:
+                friend = rng.choice(list(friends[user]))
+                if user_businesses[friend]:
+                    business = rng.choice(user_businesses[friend])
+                    num_followed += 1
+            if business is None:
+                business = _weighted_choice(rng, business_popularity)
+
+            reviewers = business_stars[business]
+            if len(friends[user]) < len(reviewers):
+                friend_stars = [reviewers[friend] for friend in friends[user] if friend in reviewers]
+            else:
+                friend_stars = [reviewers[friend] for friend in reviewers if friend in friends[user]]
+            if friend_stars and rng.random() < homophily:
+                stars = rng.choice(friend_stars)
+                num_copied += 1
+            else:
+                stars = int(round(rng.gauss(business_quality[business] + user_bias[user], 1.0)))
+                stars = min(5, max(1, stars))
+
+            if stars > 3:
+                klass_words = POSITIVE_WORDS
+            else:
+                klass_words = NEGATIVE_WORDS
+            review = {"votes" : {"funny" : 0, "useful" : 0, "cool" : 0}, "user_id" : user_ids[user], "review_id" : _yelp_id("review", number, seed), "stars" : stars, "date" : (FIRST_DATE + datetime.timedelta(days = day)).isoformat(), "text" : _review_text(rng, klass_words, rng.randint(20, 120), sentiment_rate), "type" : "review", "business_id" : business_ids[business]}
+            review_file.write(json.dumps(review))
+            review_file.write('\n')
+
+            reviewers[user] = stars
+            user_businesses[user].append(business)
+            review_counts[user] += 1
+            star_totals[user] += stars
+
+    num_friend_edges = 0
+    with open(user_path, 'w') as user_file:
+        for user in xrange(num_users):
+            num_friend_edges += len(friends[user])
+            average_stars = 0.0
+            if review_counts[user]:
+                average_stars = round(float(star_totals[user]) / review_counts[user], 2)
+            user_out = {"yelping_since" : "%d-01" % FIRST_DATE.year, "votes" : {"funny" : 0, "useful" : 0, "cool" : 0}, "review_count" : review_counts[user], "name" : "User %d" % user, "user_id" : user_ids[user], "friends" : [user_ids[friend] for friend in sorted(friends[user])], "fans" : 0, "average_stars" : average_stars, "type" : "user", "compliments" : {}, "elite" : []}
+            user_file.write(json.dumps(user_out))
+            user_file.write('\n')
+
+    counts = {"users" : num_users, "reviews" : num_reviews, "businesses" : num_businesses, "friend_edges" : num_friend_edges // 2, "followed_reviews" : num_followed, "copied_ratings" : num_copied}
+    print "Generated %(reviews)d reviews of %(businesses)d businesses by %(users)d users with %(friend_edges)d friendships (%(followed_reviews)d reviews followed a friend, %(copied_ratings)d copied a friend's rating)" % counts
+    return counts
+
+
+def main():
+    """ Takes optional arguments: the number of users and the number of reviews.  Writes synthetic_review.json and synthetic_user.json to the current directory. """
+    num_users = 10000
+    num_reviews = 100000
+    if len(sys.argv) > 2:
+        num_users = int(sys.argv[1])
+        num_reviews = int(sys.argv[2])
+    generate_dataset("./synthetic_review.json", "./synthetic_user.json", num_users, num_reviews)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+""" Rolling-origin temporal evaluation of the bag-of-words and min-cut classifiers.  Cut dates are exact quantiles of the review dates.  At each cut the classifiers are trained on the reviews dated on or before the cut and evaluated on the reviews dated after it, up to the next cut.  The reviews between consecutive cuts are hashed once, used as the test window of one cut, and then added to the training data of the next with partial_fit, so that the Naive Bayes counts are updated incrementally instead of being refitted at every cut.  The min-cut pair strengths are the CRF probabilities of reviewcrf.crftag_probabilities, from a given model or from a model trained once on the training data of the first cut, and optionally retrained every few cuts; without user data for the CRF features they fall back to the rate at which friends' reviews of a business agree in the training data, which is updated incrementally. """
+
+import sys
+import time
+import numpy
+import readyelp
+import crffeatures
+import reviewcrf
+import reviewgraph
+import instrument
+import temporalindex
+from sklearn import metrics
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+klass_list = ["negative", "positive"]
+
+# Models trained by the temporal evaluation are kept apart from the classification pipeline's models, so that they are never taken for its latest model.
+TEMPORAL_CRF_MODEL_DIR = "./crfmodels_temporal"
+
+
+def cut_days(days, num_cuts = 12, first_quantile = 0.5, last_quantile = 0.95):
+    """ Returns the date ordinals of num_cuts cut dates at evenly spaced quantiles of days, from first_quantile to last_quantile, in ascending order. """
+    return temporalindex.quantile_days(days, numpy.linspace(first_quantile, last_quantile, num_cuts))
+
+
+def _window_labels(reviews, review_ids):
+    return [reviews[review_id]["rating"] for review_id in review_ids]
+
+
+def _count_agreement(reviews, review_ids, trained, counts):
+    """ Adds to counts, a [same, total] pair, the friend pairs formed by each of review_ids with its influencers in trained that were dated on or before it. """
+    for review_id in review_ids:
+        review = reviews[review_id]
+        for friend_review_id in review.get("friend_reviews_of_business", ()):
+            if friend_review_id not in trained: continue
+            friend_review = reviews[friend_review_id]
+            if friend_review["date"] > review["date"]: continue
+            counts[1] += 1
+            if friend_review["rating"] == review["rating"]:
+                counts[0] += 1
+
+
+def rolling_origin_evaluation(reviews, num_cuts = 12, first_quantile = 0.5, last_quantile = 0.95, alpha = 1.0, n_features = 2 ** 20, user_dict = None, crf_model_path = None, crf_model_dir = TEMPORAL_CRF_MODEL_DIR, crf_params = None, crf_retrain_every = None, pair_strength = None, backend = None, processes = 1):
+    """ Evaluates the Naive Bayes and min-cut classifiers at num_cuts cut dates, at evenly spaced quantiles of the dates of reviews, a dictionary of cleaned reviews with influencer lists.  At each cut, reviews dated on or before the cut are the training set, and reviews dated after it and on or before the next cut (or any later, for the last cut) are the test set.  Texts are hashed into n_features columns by a HashingVectorizer, which needs no refitting as the training set grows, and the MultinomialNB with smoothing alpha is updated with partial_fit on each window after it has been evaluated.  The min-cut graph of each test set links the friend review pairs within it.  Given user_dict, a dictionary of user objects for the CRF features, the pair strengths are the probabilities of reviewcrf.crftag_probabilities, tagged with the model at crf_model_path or, if it is None, with a model trained by reviewcrf.train_crf_incremental in crf_model_dir with the pycrfsuite parameters crf_params.  That model is trained once, on the training set of the first cut that has friend review pairs, and reused at later cuts, so that CRF training costs about as much as in one pipeline run; if crf_retrain_every is given, it is retrained on the grown training set every crf_retrain_every cuts after that.  Without user_dict, or while the training set has no friend review pairs, every pair has strength pair_strength or, by default, the fraction of friend review pairs in the training set whose ratings agree.  Returns a list with a dictionary of results for each cut with a non-empty test set. """
+    review_ids = reviews.keys()
+    days = numpy.array([temporalindex.date_ordinal(reviews[review_id]["date"]) for review_id in review_ids], dtype = numpy.int64)
+    cuts = cut_days(days, num_cuts, first_quantile, last_quantile)
+
+    # Window 0 holds the reviews on or before the first cut, window i those after cut i - 1 and on or before cut i, and the last window those after the last cut.
+    windows = numpy.searchsorted(cuts, days, side = 'left')
+    order = numpy.argsort(windows, kind = 'mergesort')
+    bounds = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(windows, minlength = len(cuts) + 1))))
+    window_ids = [[review_ids[i] for i in order[bounds[window]:bounds[window + 1]]] for window in range(len(cuts) + 1)]
+
+    vectorizer = HashingVectorizer(stop_words = 'english', n_features = n_features, alternate_sign = False, norm = None)
+    clf = MultinomialNB(alpha = alpha)
+    trained = set()
+    agreement = [0, 0]
+    extractor = None
+    if user_dict is not None:
+        extractor = crffeatures.PairFeatureExtractor(user_dict)
+    model_path = crf_model_path
+    model_cut = None
+
+    def vectorise(window):
+        with instrument.span("vectorise", len(window_ids[window])):
+            return vectorizer.transform([reviews[review_id]["text"] for review_id in window_ids[window]])
+
+    def train(window, X_window):
+        if not window_ids[window]:
+            return
+        with instrument.span("fit", len(window_ids[window])):
+            clf.partial_fit(X_window, _window_labels(reviews, window_ids[window]), classes = klass_list)
+            trained.update(window_ids[window])
+            _count_agreement(reviews, window_ids[window], trained, agreement)
+
+    train(0, vectorise(0))
+
+    results = []
+    for cut in range(len(cuts)):
+        test_ids = window_ids[cut + 1]
+        if not test_ids or not trained:
+            continue
+        start = time.time()
+        with instrument.span("cut_%d" % cut, len(test_ids)):
+            X_test = vectorise(cut + 1)
+            with instrument.span("predict", len(test_ids)):
+                positive_column = list(clf.classes_).index(klass_list[1])
+                Y_probability = clf.predict_proba(X_test)[:, positive_column]
+            ind_pref = dict((test_ids[i], Y_probability[i]) for i in range(len(test_ids)))
+
+            test_reviews = dict((review_id, reviews[review_id]) for review_id in test_ids)
+            if extractor is not None and agreement[1]:
+                scoring = "crf"
+                if crf_model_path is None and (model_cut is None or (crf_retrain_every and cut - model_cut >= crf_retrain_every)):
+                    with instrument.span("crf_train", len(trained)):
+                        model_path = reviewcrf.train_crf_incremental(dict((review_id, reviews[review_id]) for review_id in trained), user_dict, crf_model_dir, params = crf_params, extractor = extractor)
+                    model_cut = cut
+                pair_str = reviewcrf.crftag_probabilities(test_reviews, user_dict, processes, model_path, extractor)
+                pairs = list(pair_str)
+                strength = numpy.mean(pair_str.values()) if pair_str else None
+            else:
+                scoring = "agreement"
+                strength = pair_strength
+                if strength is None:
+                    strength = agreement[0] / float(agreement[1]) if agreement[1] else 0.5
+                pairs = reviewcrf.friend_review_pairs(test_reviews)
+                pair_str = dict((pair, strength) for pair in pairs)
+            min_cut_classes = reviewgraph.build_graph(klass_list, test_reviews, ind_pref, pair_str, backend, decompose = True, processes = processes)
+
+            Y_gold = _window_labels(reviews, test_ids)
+            Y_nb = [klass_list[1] if Y_probability[i] >= 0.5 else klass_list[0] for i in range(len(test_ids))]
+            Y_min_cut = [klass_list[min_cut_classes[review_id]] for review_id in test_ids]
+            results.append({"cut" : temporalindex.ordinal_date_string(cuts[cut]), "train" : len(trained), "test" : len(test_ids), "pairs" : len(pairs), "pair_scoring" : scoring, "pair_strength" : strength, "crf_model" : model_path if scoring == "crf" else None, "nb_accuracy" : metrics.accuracy_score(Y_gold, Y_nb), "nb_f1" : metrics.f1_score(Y_gold, Y_nb, labels = klass_list, average = 'macro'), "min_cut_accuracy" : metrics.accuracy_score(Y_gold, Y_min_cut), "min_cut_f1" : metrics.f1_score(Y_gold, Y_min_cut, labels = klass_list, average = 'macro')})
+
+            # The test window becomes training data for the next cut.
+            train(cut + 1, X_test)
+        results[-1]["seconds"] = time.time() - start
+
+    print "%-12s %8s %8s %8s %9s %9s %9s %9s %8s" % ("cut", "train", "test", "pairs", "nb acc", "nb f1", "cut acc", "cut f1", "secs")
+    for result in results:
+        print "%-12s %8d %8d %8d %9.3f %9.3f %9.3f %9.3f %8.2f" % (result["cut"], result["train"], result["test"], result["pairs"], result["nb_accuracy"], result["nb_f1"], result["min_cut_accuracy"], result["min_cut_f1"], result["seconds"])
+    return results
+
+
+def main():
+    """ Takes an optional number of cut dates (default 12).  Evaluates the classifiers on ./clean_reviews.json, as written by cleanyelp.clean_review_dict, with CRF pair strengths from a model trained at the first cut on the features of the users in ./users_limited.json, and writes the results with a timing report to ./instrument_report.json. """
+    num_cuts = 12
+    if len(sys.argv) > 1:
+        num_cuts = int(sys.argv[1])
+    instrument.enable()
+    reviews = readyelp.read_reviews_to_dict("./clean_reviews.json", lazy_text = True)
+    user_dict = readyelp.read_users_to_dict("./users_limited.json")
+    with instrument.span("temporal_evaluation", len(reviews)):
+        results = rolling_origin_evaluation(reviews, num_cuts, user_dict = user_dict)
+    instrument.write_report(extra = {"temporal_evaluation" : results})
+
+
+if __name__ == "__main__":
+    main()
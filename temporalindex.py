@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+""" A per-business temporal index of reviews.  Each business's reviews are held sorted by the proleptic ordinal of their date (ties broken by review_id), with each author's positions in that order, so that queries such as "the friends' reviews of this business in the N days up to this review" or "the last k friend reviews before this review" are answered by binary search over the dates instead of by scanning every review of the business. """
+
+import bisect
+import datetime
+import numpy
+
+
+def date_ordinal(date_string):
+    """ Returns the proleptic Gregorian ordinal of a "YYYY-MM-DD" date string. """
+    return datetime.date(int(date_string[:4]), int(date_string[5:7]), int(date_string[8:10])).toordinal()
+
+
+def ordinal_date_string(day):
+    """ Returns the "YYYY-MM-DD" date string of a proleptic Gregorian ordinal. """
+    return datetime.date.fromordinal(int(day)).isoformat()
+
+
+def quantile_days(days, quantiles):
+    """ Returns the exact quantiles of the array of date ordinals days: for each q in quantiles, the element that would be at position int(q * len(days)) (at most the last position) if days were sorted.  The elements are selected with numpy.partition in linear time, without sorting days. """
+    days = numpy.asarray(days)
+    positions = [min(int(q * len(days)), len(days) - 1) for q in quantiles]
+    partitioned = numpy.partition(days, sorted(set(positions)))
+    return partitioned[positions]
+
+
+def recent(dated_reviews, day, window_days = None, max_reviews = None, earlier_only = False):
+    """ Given a list of (day, review_id) tuples sorted by day, returns the tuples dated on or before day (strictly before if earlier_only is True), no more than window_days days before it when window_days is given, and only the last max_reviews of those when max_reviews is given. """
+    days = [dated_review[0] for dated_review in dated_reviews]
+    start = 0
+    if window_days is not None:
+        start = bisect.bisect_left(days, day - window_days)
+    if earlier_only:
+        end = bisect.bisect_left(days, day)
+    else:
+        end = bisect.bisect_right(days, day)
+    selected = dated_reviews[start:end]
+    if max_reviews is not None:
+        selected = selected[len(selected) - min(max_reviews, len(selected)):]
+    return selected
+
+
+class TemporalIndex(object):
+    """ Reviews of each business in date order.  Built from a dictionary of reviews keyed by review_id; if authors is given, only reviews by users in authors are indexed. """
+
+    def __init__(self, reviews, authors = None):
+        rows_by_business = {}
+        for review_id in reviews:
+            review = reviews[review_id]
+            if authors is not None and review["user_id"] not in authors: continue
+            business_id = review["business_id"]
+            if business_id not in rows_by_business:
+                rows_by_business[business_id] = []
+            rows_by_business[business_id].append((date_ordinal(review["date"]), review_id, review["user_id"]))
+
+        # business_id -> sorted days, review_ids in the same order, and user_id -> ascending positions of that user's reviews
+        self.days = {}
+        self.review_ids = {}
+        self.reviewers = {}
+        for business_id in rows_by_business:
+            rows = rows_by_business[business_id]
+            rows.sort()
+            reviewers = {}
+            for position, (day, review_id, user_id) in enumerate(rows):
+                if user_id in reviewers:
+                    reviewers[user_id].append(position)
+                else:
+                    reviewers[user_id] = [position]
+            self.days[business_id] = [row[0] for row in rows]
+            self.review_ids[business_id] = [row[1] for row in rows]
+            self.reviewers[business_id] = reviewers
+
+    def _window(self, business_id, day, window_days, max_reviews, earlier_only):
+        """ Returns the [start, end) positions of the reviews of business_id that a query at day may return. """
+        days = self.days[business_id]
+        start = 0
+        if window_days is not None:
+            start = bisect.bisect_left(days, day - window_days)
+        if earlier_only:
+            end = bisect.bisect_left(days, day)
+        elif window_days is None and max_reviews is None:
+            end = len(days)
+        else:
+            end = bisect.bisect_right(days, day)
+        return start, end
+
+    def reviews_between(self, business_id, first_date, last_date):
+        """ Returns the review_ids of the reviews of business_id dated from first_date to last_date inclusive, oldest first. """
+        if business_id not in self.days:
+            return []
+        days = self.days[business_id]
+        start = bisect.bisect_left(days, date_ordinal(first_date))
+        end = bisect.bisect_right(days, date_ordinal(last_date))
+        return self.review_ids[business_id][start:end]
+
+    def friend_reviews(self, business_id, friends, date, window_days = None, max_reviews = None, earlier_only = False):
+        """ Returns the review_ids of the reviews of business_id written by the users in friends, oldest first.  With neither window_days nor max_reviews, reviews of any date are returned, or only those dated strictly before date if earlier_only is True.  Otherwise only reviews dated on or before date (strictly before if earlier_only is True) are returned: those at most window_days days before date when window_days is given, and the last max_reviews of them when max_reviews is given. """
+        if business_id not in self.days:
+            return []
+        start, end = self._window(business_id, date_ordinal(date), window_days, max_reviews, earlier_only)
+        if start >= end:
+            return []
+        reviewers = self.reviewers[business_id]
+        positions = []
+        for friend_id in friends:
+            if friend_id not in reviewers: continue
+            friend_positions = reviewers[friend_id]
+            positions.extend(friend_positions[bisect.bisect_left(friend_positions, start):bisect.bisect_left(friend_positions, end)])
+        positions.sort()
+        if max_reviews is not None:
+            positions = positions[len(positions) - min(max_reviews, len(positions)):]
+        review_ids = self.review_ids[business_id]
+        return [review_ids[position] for position in positions]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+""" Tests for baselineclassifier.  Run with python -m unittest discover. """
+
+import random
+import shutil
+import datetime
+import tempfile
+import unittest
+import featurecache
+import baselineclassifier
+import temporalindex
+
+
+def _influenced_reviews(seed, num_reviews = 300):
+    """ Returns (train_reviews, test_reviews) whose influencer lists name test reviews, training reviews and reviews in neither set. """
+    rng = random.Random(seed)
+    train_reviews = dict(("t%d" % i, {"rating" : "positive"}) for i in range(20))
+    test_reviews = {}
+    for i in range(num_reviews):
+        date = datetime.date(2010, 1, 1) + datetime.timedelta(days = rng.randint(0, 90))
+        test_reviews["r%d" % i] = {"rating" : rng.choice(["negative", "positive"]), "date" : date.isoformat()}
+    candidates = sorted(test_reviews) + sorted(train_reviews) + ["gone"]
+    for review_id in test_reviews:
+        test_reviews[review_id]["friend_reviews_of_business"] = rng.sample(candidates, rng.randint(0, 6))
+    return train_reviews, test_reviews
+
+
+def _reference_predictions(test_reviews, recency_half_life):
+    """ The majority vote of the test set influencers of each review, summed one influencer at a time. """
+    predictions = []
+    for review_id in test_reviews:
+        review = test_reviews[review_id]
+        influence_sum = 0.0
+        for influencer_id in review["friend_reviews_of_business"]:
+            if influencer_id not in test_reviews: continue
+            influencer = test_reviews[influencer_id]
+            weight = 1.0
+            if recency_half_life is not None:
+                days = abs(temporalindex.date_ordinal(review["date"]) - temporalindex.date_ordinal(influencer["date"]))
+                weight = 0.5 ** (days / float(recency_half_life))
+            if influencer["rating"] == "negative":
+                influence_sum -= weight
+            else:
+                influence_sum += weight
+        if influence_sum < 0:
+            predictions.append("negative")
+        elif influence_sum > 0:
+            predictions.append("positive")
+        else:
+            predictions.append("UNKNOWN")
+    return predictions
+
+
+class InfluenceBaselineTest(unittest.TestCase):
+
+    def test_votes_match_a_loop(self):
+        train_reviews, test_reviews = _influenced_reviews(0)
+        predictions = baselineclassifier.influence_baseline(train_reviews, test_reviews, {})
+        self.assertEqual(predictions, _reference_predictions(test_reviews, None))
+        self.assertEqual(set(predictions), set(["negative", "positive", "UNKNOWN"]))
+
+    def test_recency_weighted_votes_match_a_loop(self):
+        train_reviews, test_reviews = _influenced_reviews(1)
+        for recency_half_life in [1, 7, 30.5]:
+            self.assertEqual(baselineclassifier.influence_baseline(train_reviews, test_reviews, {}, recency_half_life), _reference_predictions(test_reviews, recency_half_life))
+
+    def test_empty_test_set(self):
+        self.assertEqual(baselineclassifier.influence_baseline({}, {}, {}), [])
+
+
+class BagOfWordsFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix = "baselineclassifier_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cached_features_match_a_refit(self):
+        rng = random.Random(2)
+        words = ["good", "bad", "food", "service", "slow", "great", "the", "and"]
+        reviews = dict(("r%d" % i, {"rating" : rng.choice(["negative", "positive"]), "text" : " ".join(rng.choice(words) for j in range(rng.randint(1, 10)))}) for i in range(80))
+        train_reviews = dict((review_id, reviews[review_id]) for review_id in sorted(reviews)[:60])
+        test_reviews = dict((review_id, reviews[review_id]) for review_id in sorted(reviews)[60:])
+        X_train, Y_train, X_test = baselineclassifier.bag_of_words_features(train_reviews, test_reviews)
+        self.assertEqual(Y_train, [train_reviews[review_id]["rating"] for review_id in train_reviews])
+        feature_cache = featurecache.FeatureCache(self.cache_dir)
+        for i in range(2):
+            X_train_cached, Y_train_cached, X_test_cached = baselineclassifier.bag_of_words_features(train_reviews, test_reviews, feature_cache)
+            self.assertEqual((X_train_cached != X_train).nnz, 0)
+            self.assertEqual((X_test_cached != X_test).nnz, 0)
+            self.assertEqual(Y_train_cached, Y_train)
+        self.assertEqual((feature_cache.misses, feature_cache.hits), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+""" Tests for cleanyelp.  Run with python -m unittest discover. """
+
+import os
+import copy
+import random
+import datetime
+import shutil
+import tempfile
+import unittest
+import cleanyelp
+import readyelp
+import data_statistics
+
+
+def _social_reviews(seed, num_users = 50, num_businesses = 15, num_reviews = 600):
+    """ Returns (review_dict, user_dict) with star ratings, as read by readyelp.  Some authors have no user record, some users list reviews that are not in review_dict, and some users reviewed a business more than once. """
+    rng = random.Random(seed)
+    user_ids = ["u%d" % i for i in range(num_users)]
+    friends = dict((user_id, set()) for user_id in user_ids)
+    for i in range(2 * num_users):
+        user_id, friend_id = rng.sample(user_ids, 2)
+        friends[user_id].add(friend_id)
+        friends[friend_id].add(user_id)
+    review_dict = {}
+    reviews_by_user = dict((user_id, []) for user_id in user_ids)
+    for i in range(num_reviews):
+        review_id = "r%03d" % i
+        user_id = rng.choice(user_ids + ["unknown%d" % rng.randint(0, 3)])
+        date = datetime.date(2010, 1, 1) + datetime.timedelta(days = rng.randint(0, 30))
+        review_dict[review_id] = {"review_id" : review_id, "user_id" : user_id, "business_id" : "b%d" % rng.randint(0, num_businesses - 1), "rating" : rng.randint(1, 5), "text" : "text", "date" : date.isoformat()}
+        if user_id in reviews_by_user:
+            reviews_by_user[user_id].append(review_id)
+    user_dict = {}
+    for user_id in user_ids:
+        reviews = reviews_by_user[user_id] + ["missing_%s" % user_id]
+        rng.shuffle(reviews)
+        user_dict[user_id] = {"user_id" : user_id, "friends" : sorted(friends[user_id]), "reviews" : reviews}
+    return review_dict, user_dict
+
+
+def _scan_influencers(review, review_dict, user_dict, earlier_only):
+    """ The friends' reviews of the business of review, found by scanning every review of every friend. """
+    influencers = []
+    for friend_id in user_dict[review["user_id"]]["friends"]:
+        for friend_review_id in user_dict[friend_id]["reviews"]:
+            friend_review = review_dict.get(friend_review_id)
+            if friend_review is None or friend_review["business_id"] != review["business_id"]: continue
+            if earlier_only and friend_review["date"] >= review["date"]: continue
+            influencers.append(friend_review_id)
+    return influencers
+
+
+def _naive_review_pairs(user_dict, review_dict, pair_order):
+    """ Pairs of friends' reviews of the same business, found by comparing the businesses of every user with those of each friend.  A user's last listed review of a business stands for the user. """
+    def by_business(review_ids):
+        businesses = {}
+        for review_id in review_ids:
+            if review_id in review_dict:
+                businesses[review_dict[review_id]["business_id"]] = review_id
+        return businesses
+    pairs = set()
+    for user_id in user_dict:
+        user_businesses = by_business(user_dict[user_id]["reviews"])
+        for friend_id in user_dict[user_id]["friends"]:
+            friend_businesses = by_business(user_dict[friend_id]["reviews"])
+            for business_id in friend_businesses:
+                if business_id not in user_businesses: continue
+                user_review_id = user_businesses[business_id]
+                friend_review_id = friend_businesses[business_id]
+                pair = pair_order((user_review_id, review_dict[user_review_id]["date"]), (friend_review_id, review_dict[friend_review_id]["date"]))
+                if pair is not None:
+                    pairs.add(pair)
+    return pairs
+
+
+class InfluencerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "cleanyelp_test_")
+        self.review_dict, self.user_dict = _social_reviews(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_indexed_search_matches_a_scan(self):
+        index = cleanyelp.business_reviewers_index(self.review_dict, self.user_dict)
+        found = 0
+        for review_id in self.review_dict:
+            review = self.review_dict[review_id]
+            if review["user_id"] not in self.user_dict: continue
+            for earlier_only in [False, True]:
+                expected = _scan_influencers(review, self.review_dict, self.user_dict, earlier_only)
+                self.assertEqual(cleanyelp.find_influencers(review, self.review_dict, self.user_dict, None, earlier_only), expected)
+                self.assertEqual(cleanyelp.find_influencers(review, self.review_dict, self.user_dict, index, earlier_only), expected)
+                found += len(expected)
+        self.assertTrue(found > 100)
+
+    def test_clean_review_dict_matches_a_scan(self):
+        for earlier_only in [False, True]:
+            review_dict = copy.deepcopy(self.review_dict)
+            expected = {}
+            for review_id in review_dict:
+                review = review_dict[review_id]
+                if review["user_id"] not in self.user_dict: continue
+                influencers = _scan_influencers(review, review_dict, self.user_dict, earlier_only)
+                if influencers:
+                    expected[review_id] = influencers
+            output_path = os.path.join(self.directory, "reviews.json")
+            cleanyelp.clean_review_dict(review_dict, self.user_dict, earlier_only, output_path)
+            self.assertEqual(dict((review_id, review_dict[review_id]["friend_reviews_of_business"]) for review_id in review_dict), expected)
+            for review_id in review_dict:
+                self.assertTrue(review_dict[review_id]["rating"] in ["negative", "positive"])
+            self.assertEqual(readyelp.read_reviews_to_dict(output_path), review_dict)
+
+
+class PairJoinTest(unittest.TestCase):
+
+    def setUp(self):
+        self.review_dict, self.user_dict = _social_reviews(1)
+
+    def test_join_matches_the_naive_pairs(self):
+        expected = _naive_review_pairs(self.user_dict, self.review_dict, cleanyelp.later_earlier_pair)
+        self.assertTrue(len(expected) > 100)
+        for processes in [1, 2]:
+            self.assertEqual(cleanyelp.find_review_pairs_by_friends(self.user_dict, self.review_dict, processes), expected)
+
+    def test_pair_order(self):
+        expected = _naive_review_pairs(self.user_dict, self.review_dict, data_statistics.earlier_later_pair)
+        for processes in [1, 2]:
+            self.assertEqual(data_statistics.find_review_pairs_by_friends(self.user_dict, self.review_dict, processes), expected)
+        later_earlier = cleanyelp.find_review_pairs_by_friends(self.user_dict, self.review_dict)
+        for later_id, earlier_id in later_earlier:
+            self.assertTrue((self.review_dict[later_id]["date"], later_id) > (self.review_dict[earlier_id]["date"], earlier_id))
+            self.assertFalse((earlier_id, later_id) in later_earlier)
+
+    def test_no_friends(self):
+        user_dict = dict((user_id, dict(self.user_dict[user_id], friends = [])) for user_id in self.user_dict)
+        self.assertEqual(cleanyelp.find_review_pairs_by_friends(user_dict, self.review_dict, 2), set())
+
+
+class StreamSplitTest(unittest.TestCase):
+
+    def setUp(self):
+        # The split filters ./users.json into ./users_limited.json, so it runs in a scratch directory.
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix = "cleanyelp_test_")
+        os.chdir(self.directory)
+        review_dict, user_dict = _social_reviews(2, num_businesses = 200, num_reviews = 2000)
+        self.reviews = [review_dict[review_id] for review_id in sorted(review_dict)]
+        readyelp.write_output(self.reviews, "./reviews.json")
+        readyelp.write_output([user_dict[user_id] for user_id in sorted(user_dict)], "./users.json")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def _review_ids(self, path):
+        return [review["review_id"] for review in readyelp.iter_records(path)]
+
+    def _businesses(self, path):
+        return set(review["business_id"] for review in readyelp.iter_records(path))
+
+    def test_split_is_by_business_and_keeps_input_order(self):
+        train_count, test_count = cleanyelp.stream_split_data_by_business(0.7, seed = 3)
+        train_ids = self._review_ids("./train_reviews.json")
+        test_ids = self._review_ids("./test_reviews.json")
+        self.assertEqual((len(train_ids), len(test_ids)), (train_count, test_count))
+        self.assertEqual(sorted(train_ids + test_ids), [review["review_id"] for review in self.reviews])
+        self.assertEqual(train_ids, sorted(train_ids))
+        self.assertEqual(test_ids, sorted(test_ids))
+        self.assertEqual(self._businesses("./train_reviews.json") & self._businesses("./test_reviews.json"), set())
+        self.assertTrue(0.6 < len(self._businesses("./train_reviews.json")) / 200.0 < 0.8)
+        kept_ids = set(train_ids + test_ids)
+        for user in readyelp.iter_records("./users_limited.json"):
+            self.assertTrue(user["reviews"])
+            self.assertTrue(set(user["reviews"]) <= kept_ids)
+
+    def test_split_is_reproducible(self):
+        cleanyelp.stream_split_data_by_business(0.5, seed = 3)
+        first = self._review_ids("./train_reviews.json")
+        cleanyelp.stream_split_data_by_business(0.5, seed = 3)
+        self.assertEqual(self._review_ids("./train_reviews.json"), first)
+        cleanyelp.stream_split_data_by_business(0.5, seed = 4)
+        self.assertNotEqual(self._review_ids("./train_reviews.json"), first)
+
+    def test_store_subsets_match_the_split(self):
+        cleanyelp.stream_split_data_by_business(0.5, seed = 3, store_path = "./reviews.store")
+        for name in ["train", "test"]:
+            self.assertEqual(sorted(readyelp.read_reviews_to_dict("./reviews.store", name)), self._review_ids("./%s_reviews.json" % name))
+
+    def test_escaped_business_ids_are_routed_by_their_value(self):
+        reviews = [dict(review, business_id = business_id) for review, business_id in zip(self.reviews, [u"caf\xe9", u'quote"d', "back\\slash", "plain"] * 200)]
+        readyelp.write_output(reviews, "./reviews.json")
+        cleanyelp.stream_kfold_split_by_business(3, seed = 5)
+        for fold in range(3):
+            for review in readyelp.iter_records("./fold_%d_reviews.json" % fold):
+                self.assertEqual(int(cleanyelp._business_hash_fraction(review["business_id"], 5) * 3), fold)
+
+    def test_kfold_split(self):
+        fold_paths = cleanyelp.stream_kfold_split_by_business(4, seed = 3)
+        self.assertEqual(sorted(review_id for fold_path in fold_paths for review_id in self._review_ids(fold_path)), [review["review_id"] for review in self.reviews])
+        for fold, fold_path in enumerate(fold_paths):
+            self.assertTrue(self._review_ids(fold_path))
+            for other_path in fold_paths[fold + 1:]:
+                self.assertEqual(self._businesses(fold_path) & self._businesses(other_path), set())
+        # Two folds put a business in the first fold exactly when an even split puts it in the training set.
+        fold_paths = cleanyelp.stream_kfold_split_by_business(2, seed = 3)
+        cleanyelp.stream_split_data_by_business(0.5, seed = 3)
+        self.assertEqual(self._review_ids(fold_paths[0]), self._review_ids("./train_reviews.json"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+""" Tests for onlineclassifier.  Run with python -m unittest discover. """
+
+import random
+import datetime
+import shutil
+import tempfile
+import unittest
+import crffeatures
+import reviewcrf
+import reviewgraph
+import onlineclassifier
+
+WORDS = sorted(crffeatures.POSITIVE_WORDS) + sorted(crffeatures.NEGATIVE_WORDS) + ["food", "service", "place", "menu", "table"]
+
+
+def _reviews(seed, user_ids, num_businesses, num_reviews, prefix):
+    """ Returns a list of new review objects, without influencer lists, by authors drawn from user_ids.  Dates are drawn from a few weeks, so that some friends review a business on the same day. """
+    rng = random.Random(seed)
+    reviews = []
+    for i in range(num_reviews):
+        rating = rng.choice(["negative", "positive"])
+        lexicon = sorted(crffeatures.POSITIVE_WORDS if rating == "positive" else crffeatures.NEGATIVE_WORDS)
+        text = " ".join(rng.choice(lexicon if rng.random() < 0.2 else WORDS) for j in range(rng.randint(5, 20)))
+        date = datetime.date(2012, 1, 1) + datetime.timedelta(days = rng.randint(0, 20))
+        reviews.append({"review_id" : "%s%03d" % (prefix, i), "user_id" : rng.choice(user_ids), "business_id" : "b%d" % rng.randint(0, num_businesses - 1), "rating" : rating, "text" : text, "date" : date.isoformat()})
+    return reviews
+
+
+def _with_influencers(reviews, user_dict):
+    """ Returns a dictionary of copies of reviews, each listing the reviews of its business by friends of its author, as cleanyelp.clean_review_dict does. """
+    review_dict = {}
+    for review in reviews:
+        friends = set(user_dict[review["user_id"]]["friends"]) if review["user_id"] in user_dict else set()
+        review_dict[review["review_id"]] = dict(review, friend_reviews_of_business = [other["review_id"] for other in reviews if other["business_id"] == review["business_id"] and other["user_id"] in friends])
+    return review_dict
+
+
+class OnlineClassifierTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(0)
+        user_ids = ["u%d" % i for i in range(30)]
+        friends = dict((user_id, set()) for user_id in user_ids)
+        for i in range(60):
+            user_id, friend_id = rng.sample(user_ids, 2)
+            friends[user_id].add(friend_id)
+            friends[friend_id].add(user_id)
+        # u0 and u1 wrote reviews but have no user record, though other users list them as friends.
+        cls.user_dict = dict((user_id, {"user_id" : user_id, "friends" : sorted(friends[user_id]), "reviews" : []}) for user_id in user_ids[2:])
+        cls.model_dir = tempfile.mkdtemp(prefix = "onlineclassifier_test_")
+        train_reviews = _with_influencers(_reviews(1, user_ids, 8, 300, "t"), cls.user_dict)
+        cls.model_path = reviewcrf.train_crf_incremental(train_reviews, cls.user_dict, cls.model_dir, params = {"max_iterations" : 20})
+        cls.train_reviews = train_reviews
+        cls.test_reviews = _reviews(2, user_ids, 25, 250, "r")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_dir)
+
+    def _classifier(self):
+        return onlineclassifier.OnlineReviewClassifier.from_training(self.train_reviews, self.user_dict, self.model_path, backend = "native")
+
+    def _batch_classes(self, classifier):
+        """ Classifies the test reviews at once with build_graph, given the classifier's bag-of-words model. """
+        test_reviews = _with_influencers(self.test_reviews, self.user_dict)
+        review_ids = [review["review_id"] for review in self.test_reviews]
+        probabilities = classifier.clf.predict_proba(classifier.vectorizer.transform([review["text"] for review in self.test_reviews]))
+        ind_pref = dict((review_id, probability[classifier.positive_column]) for review_id, probability in zip(review_ids, probabilities))
+        pair_str = reviewcrf.crftag_probabilities(test_reviews, self.user_dict, 1, self.model_path)
+        self.assertTrue(len(pair_str) > 100)
+        classes = reviewgraph.build_graph(classifier.klass_list, test_reviews, ind_pref, pair_str, "native")
+        return dict((review_id, classifier.klass_list[classes[review_id]]) for review_id in review_ids), pair_str
+
+    def _online_classes(self, classifier):
+        return dict((review["review_id"], classifier.klass_of(review["review_id"])) for review in self.test_reviews)
+
+    def test_arrival_orders_match_the_batch_cut(self):
+        expected, pair_str = self._batch_classes(self._classifier())
+        rng = random.Random(3)
+        by_date = sorted(self.test_reviews, key = lambda review: (review["date"], review["review_id"]))
+        shuffled = list(self.test_reviews)
+        rng.shuffle(shuffled)
+        for arrivals in [by_date, shuffled]:
+            for batch_size in [1, 7, len(arrivals)]:
+                classifier = self._classifier()
+                for start in range(0, len(arrivals), batch_size):
+                    classifier.classify_new_reviews(arrivals[start:start + batch_size])
+                self.assertEqual(self._online_classes(classifier), expected, "batches of %d" % batch_size)
+                # Every pair of the batch graph is in exactly one component, with the same strength.
+                online_pairs = {}
+                for root in classifier.components:
+                    members, component_pairs = classifier.components[root]
+                    for pair in component_pairs:
+                        self.assertTrue(pair[0] in members and pair[1] in members)
+                        self.assertEqual(classifier.component_of[pair[0]], root)
+                    online_pairs.update(component_pairs)
+                self.assertEqual(online_pairs, pair_str)
+
+    def test_components_are_the_connected_components(self):
+        classifier = self._classifier()
+        classifier.classify_new_reviews(self.test_reviews)
+        neighbours = dict((review["review_id"], set()) for review in self.test_reviews)
+        for root in classifier.components:
+            for earlier_id, later_id in classifier.components[root][1]:
+                neighbours[earlier_id].add(later_id)
+                neighbours[later_id].add(earlier_id)
+        for review_id in neighbours:
+            reached = set([review_id])
+            pending = [review_id]
+            while pending:
+                for other_id in neighbours[pending.pop()]:
+                    if other_id not in reached:
+                        reached.add(other_id)
+                        pending.append(other_id)
+            self.assertEqual(classifier.components[classifier.component_of[review_id]][0], reached)
+
+
+if __name__ == "__main__":
+    unittest.main()
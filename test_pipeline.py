@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+""" Tests for pipeline.  Run with python -m unittest discover. """
+
+import os
+import shutil
+import tempfile
+import unittest
+import pipeline
+import classifyyelp
+
+# The names of the stages that ran, in order, appended to by the toy stages.
+_runs = []
+
+
+def _source_stage(inputs, path):
+    _runs.append("source")
+    with open(path) as input_file:
+        return input_file.read().split()
+
+
+def _scale_stage(inputs, factor):
+    _runs.append("scale")
+    return [word * factor for word in inputs["source"]]
+
+
+def _join_stage(inputs, separator):
+    _runs.append("join")
+    return separator.join(inputs["scale"])
+
+
+def _count_stage(inputs, output_path):
+    _runs.append("count")
+    with open(output_path, 'w') as output_file:
+        output_file.write("%d\n" % len(inputs["source"]))
+    return len(inputs["source"])
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "pipeline_test_")
+        self.input_path = os.path.join(self.directory, "words.txt")
+        self.output_path = os.path.join(self.directory, "count.txt")
+        with open(self.input_path, 'w') as input_file:
+            input_file.write("a b c\n")
+        del _runs[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _pipeline(self, factor = 2, separator = "-"):
+        """ source -> scale -> join, with count also depending on source. """
+        stages = pipeline.Pipeline(os.path.join(self.directory, "cache"))
+        stages.add(pipeline.Stage("source", _source_stage, params = {"path" : self.input_path}, input_files = [self.input_path]))
+        stages.add(pipeline.Stage("scale", _scale_stage, ["source"], {"factor" : factor}))
+        stages.add(pipeline.Stage("join", _join_stage, ["scale"], {"separator" : separator}))
+        stages.add(pipeline.Stage("count", _count_stage, ["source"], {"output_path" : self.output_path}, output_files = [self.output_path]))
+        return stages
+
+    def _run(self, stages, targets = None):
+        del _runs[:]
+        results = stages.run(targets)
+        return results, list(_runs)
+
+    def test_unchanged_pipeline_is_cached(self):
+        results, runs = self._run(self._pipeline())
+        self.assertEqual(runs, ["source", "scale", "join", "count"])
+        self.assertEqual(results["join"], "aa-bb-cc")
+        cached_results, runs = self._run(self._pipeline())
+        self.assertEqual(runs, [])
+        self.assertEqual(cached_results, results)
+
+    def test_changed_parameter_reruns_only_downstream_stages(self):
+        self._run(self._pipeline())
+        results, runs = self._run(self._pipeline(factor = 3))
+        self.assertEqual(runs, ["scale", "join"])
+        self.assertEqual(results["join"], "aaa-bbb-ccc")
+        self.assertEqual(results["count"], 3)
+        results, runs = self._run(self._pipeline(factor = 3, separator = "+"))
+        self.assertEqual(runs, ["join"])
+        self.assertEqual(results["join"], "aaa+bbb+ccc")
+        # Only the latest fingerprint of each stage is kept, so changing a parameter back runs the stage again.
+        results, runs = self._run(self._pipeline(factor = 3))
+        self.assertEqual(runs, ["join"])
+        self.assertEqual(results["join"], "aaa-bbb-ccc")
+
+    def test_changed_input_file_reruns_every_dependent_stage(self):
+        self._run(self._pipeline())
+        with open(self.input_path, 'w') as input_file:
+            input_file.write("a b c d\n")
+        results, runs = self._run(self._pipeline())
+        self.assertEqual(runs, ["source", "scale", "join", "count"])
+        self.assertEqual(results["count"], 4)
+
+    def test_changed_output_file_reruns_its_stage(self):
+        self._run(self._pipeline())
+        os.remove(self.output_path)
+        results, runs = self._run(self._pipeline())
+        self.assertEqual(runs, ["count"])
+        self.assertTrue(os.path.exists(self.output_path))
+
+    def test_targets_run_only_their_dependencies(self):
+        results, runs = self._run(self._pipeline(), ["count"])
+        self.assertEqual(runs, ["source", "count"])
+        self.assertEqual(results, {"count" : 3})
+        results, runs = self._run(self._pipeline(), ["join"])
+        self.assertEqual(runs, ["scale", "join"])
+
+
+class ClassificationPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "pipeline_test_")
+        self.review_path = os.path.join(self.directory, "reviews.json")
+        self.user_path = os.path.join(self.directory, "users.json")
+        for path in [self.review_path, self.user_path]:
+            with open(path, 'w') as dataset_file:
+                dataset_file.write("{}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _fingerprints(self, **params):
+        stages = classifyyelp.classification_pipeline(self.review_path, self.user_path, cache_dir = os.path.join(self.directory, "cache"), **params)
+        fingerprints = {}
+        for name in stages.order:
+            fingerprints[name] = stages.fingerprint(name, fingerprints)
+        return fingerprints
+
+    def _changed(self, **params):
+        default = self._fingerprints()
+        changed = self._fingerprints(**params)
+        return set(name for name in default if changed[name] != default[name])
+
+    def test_changed_parameters_change_only_downstream_fingerprints(self):
+        self.assertEqual(self._changed(), set())
+        self.assertEqual(self._changed(crf_params = {"c2" : 0.1}), set(["train_crf", "pair_score", "min_cut", "evaluate"]))
+        self.assertEqual(self._changed(alpha = 0.5), set(["train_nb", "min_cut", "evaluate"]))
+        self.assertEqual(self._changed(seed = 1), set(["split", "featurise", "train_nb", "train_crf", "pair_score", "min_cut", "evaluate"]))
+        self.assertEqual(self._changed(window_days = 30), set(["clean", "split", "featurise", "train_nb", "train_crf", "pair_score", "min_cut", "evaluate"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
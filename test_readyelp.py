@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+""" Tests for readyelp.  Run with python -m unittest discover. """
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+import readyelp
+import recordio
+import reviewstore
+import pipeline
+
+
+def _raw_dataset(seed, num_users = 80, num_reviews = 500):
+    """ Returns (reviews, users) in the format of the Yelp Academic Dataset, with texts of varied length so that byte ranges end mid-record.  Some users have no reviews and some have no friends. """
+    rng = random.Random(seed)
+    user_ids = ["u%d" % i for i in range(num_users)]
+    reviews = []
+    for i in range(num_reviews):
+        text = u" ".join(rng.choice([u"good", u"bad", u"caf\xe9", u"line\nbreak"]) for j in range(rng.randint(0, 80)))
+        reviews.append({"type" : "review", "review_id" : "r%d" % i, "user_id" : rng.choice(user_ids[:60]), "business_id" : "b%d" % rng.randint(0, 20), "stars" : rng.randint(1, 5), "text" : text, "date" : "2010-01-%02d" % rng.randint(1, 28), "votes" : {"useful" : 0}})
+    review_counts = dict((user_id, 0) for user_id in user_ids)
+    for review in reviews:
+        review_counts[review["user_id"]] += 1
+    users = [{"type" : "user", "user_id" : user_id, "name" : user_id, "friends" : rng.sample(user_ids, rng.randint(0, 5)), "review_count" : review_counts[user_id]} for user_id in user_ids]
+    return reviews, users
+
+
+class StreamParseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "readyelp_test_")
+        self.reviews, self.users = _raw_dataset(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, records):
+        path = os.path.join(self.directory, name)
+        with recordio.RecordWriter(path) as writer:
+            for record in records:
+                writer.write(record)
+        return path
+
+    def _expected(self, review_path, user_path):
+        reviews_output = []
+        reviews_by_user = {}
+        readyelp.parse_review_dataset_file(reviews_output, reviews_by_user, review_path)
+        users_output = []
+        readyelp.parse_user_dataset_file(users_output, reviews_by_user, user_path)
+        return reviews_output, users_output, reviews_by_user
+
+    def _stream(self, review_path, user_path, processes, chunk_bytes):
+        reviews_by_user = {}
+        output_path = os.path.join(self.directory, "reviews_%d_%d.json" % (processes, chunk_bytes))
+        stats = readyelp.stream_review_dataset_file(review_path, output_path, reviews_by_user, processes, chunk_bytes)
+        self.assertEqual(stats["records"], len(self.reviews))
+        user_output_path = os.path.join(self.directory, "users_%d_%d.json" % (processes, chunk_bytes))
+        readyelp.stream_user_dataset_file(user_path, user_output_path, reviews_by_user, processes, chunk_bytes)
+        return list(recordio.iter_records(output_path)), list(recordio.iter_records(user_output_path)), reviews_by_user
+
+    def test_line_aligned_ranges_cover_whole_lines(self):
+        path = self._write("raw_reviews.json", self.reviews)
+        with open(path, 'rb') as input_file:
+            data = input_file.read()
+        for chunk_bytes in [1, 100, 4096, len(data), 10 * len(data)]:
+            ranges = readyelp._line_aligned_ranges(path, chunk_bytes)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(data))
+            for (start, end), (next_start, next_end) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, next_start)
+                self.assertEqual(data[end - 1], '\n')
+            self.assertEqual([line for start, end in ranges for line in readyelp._read_range(path, start, end) if line], data.split("\n")[:-1])
+
+    def test_serial_and_parallel_match_the_reference_parse(self):
+        review_path = self._write("raw_reviews.json", self.reviews)
+        user_path = self._write("raw_users.json", self.users)
+        expected_reviews, expected_users, expected_by_user = self._expected(review_path, user_path)
+        for processes in [1, 2]:
+            for chunk_bytes in [512, 4096, readyelp.CHUNK_BYTES]:
+                reviews, users, reviews_by_user = self._stream(review_path, user_path, processes, chunk_bytes)
+                self.assertEqual(reviews, expected_reviews, "%d processes, %d byte chunks" % (processes, chunk_bytes))
+                self.assertEqual(users, expected_users, "%d processes, %d byte chunks" % (processes, chunk_bytes))
+                self.assertEqual(reviews_by_user, expected_by_user)
+
+    def test_compressed_input_matches_plain_input(self):
+        plain = self._stream(self._write("raw_reviews.json", self.reviews), self._write("raw_users.json", self.users), 1, 4096)
+        for suffix in [".gz", ".bz2"]:
+            review_path = self._write("raw_reviews.json" + suffix, self.reviews)
+            user_path = self._write("raw_users.json" + suffix, self.users)
+            for processes in [1, 2]:
+                self.assertEqual(self._stream(review_path, user_path, processes, 4096), plain)
+
+    def test_carriage_returns_do_not_split_records(self):
+        # json allows a carriage return between tokens, and Windows line endings leave one at the end of each record.
+        path = os.path.join(self.directory, "raw_reviews.json")
+        with open(path, 'wb') as raw_file:
+            for review in self.reviews[:50]:
+                line = json.dumps(review)
+                raw_file.write(line.replace('", "', '",\r "', 1) + '\r\n')
+        for processes in [1, 2]:
+            output_path = os.path.join(self.directory, "reviews_%d.json" % processes)
+            readyelp.stream_review_dataset_file(path, output_path, {}, processes, 256)
+            self.assertEqual([review["review_id"] for review in recordio.iter_records(output_path)], [review["review_id"] for review in self.reviews[:50]])
+
+    def test_users_without_indexed_reviews_are_skipped(self):
+        user_path = self._write("raw_users.json", self.users)
+        reviews_by_user = {"u0" : ["r1"], "u1" : ["r2"]}
+        self.assertRaises(KeyError, readyelp.parse_user_dataset_file, [], reviews_by_user, user_path)
+        output_path = os.path.join(self.directory, "users.json")
+        readyelp.stream_user_dataset_file(user_path, output_path, reviews_by_user, 1)
+        expected = [user["user_id"] for user in self.users if user["user_id"] in reviews_by_user and user["friends"] and user["review_count"]]
+        self.assertEqual([user["user_id"] for user in recordio.iter_records(output_path)], expected)
+
+
+class ReadSplitTest(unittest.TestCase):
+
+    def setUp(self):
+        # read_split reads ./train_reviews.json, so it runs in a scratch directory.
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix = "readyelp_test_")
+        os.chdir(self.directory)
+        self.reviews = [{"review_id" : "r%d" % i, "user_id" : "u%d" % (i % 7), "business_id" : "b%d" % (i % 5), "rating" : "positive", "text" : "text %d" % i, "date" : "2010-01-%02d" % (i % 28 + 1)} for i in range(40)]
+        readyelp.write_output(self.reviews[:30], "./train_reviews.json")
+        readyelp.write_review_store(self.reviews, "./reviews.store")
+        reviewstore.ReviewStore("./reviews.store").write_subset("train", [review["review_id"] for review in self.reviews[:30]], pipeline.file_digest("./train_reviews.json"))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def _from_store(self):
+        return isinstance(readyelp.read_split("train", "./reviews.store"), reviewstore.StoreReviewDict)
+
+    def test_store_is_read_while_the_split_file_is_unchanged(self):
+        self.assertTrue(self._from_store())
+        os.utime("./train_reviews.json", (0, 0))
+        self.assertTrue(self._from_store())
+        os.remove("./train_reviews.json")
+        self.assertTrue(self._from_store())
+        self.assertEqual(len(readyelp.read_split("train", "./reviews.store")), 30)
+
+    def test_json_is_read_once_the_split_file_changes(self):
+        readyelp.write_output(self.reviews[10:], "./train_reviews.json")
+        os.utime("./train_reviews.json", (0, 0))
+        self.assertFalse(self._from_store())
+        self.assertEqual(sorted(readyelp.read_split("train", "./reviews.store")), sorted(review["review_id"] for review in self.reviews[10:]))
+
+    def test_json_is_read_without_a_store(self):
+        self.assertTrue(isinstance(readyelp.read_split("train", None), dict))
+        self.assertTrue(isinstance(readyelp.read_split("train", "./missing.store"), dict))
+        self.assertRaises(IOError, readyelp.read_split, "test", "./reviews.store")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+""" Tests for recordio.  Run with python -m unittest discover. """
+
+import os
+import shutil
+import tempfile
+import unittest
+import recordio
+
+RECORDS = [{"review_id" : "r%d" % i, "stars" : i % 5 + 1, "text" : u"caf\xe9 number %d\nsecond line" % i} for i in range(2000)]
+
+
+class RecordIOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "recordio_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _round_trip(self, name, codec = None, buffer_bytes = recordio.WRITE_BUFFER_BYTES):
+        path = os.path.join(self.directory, name)
+        with recordio.RecordWriter(path, buffer_bytes, codec) as writer:
+            for record in RECORDS:
+                writer.write(record)
+        self.assertEqual(writer.count, len(RECORDS))
+        return path
+
+    def test_plain_round_trip(self):
+        path = self._round_trip("records.json")
+        self.assertEqual(recordio.compression(path), None)
+        self.assertEqual(list(recordio.iter_records(path)), RECORDS)
+
+    def test_gzip_round_trip(self):
+        path = self._round_trip("records.json.gz")
+        self.assertEqual(recordio.compression(path), "gzip")
+        self.assertEqual(list(recordio.iter_records(path)), RECORDS)
+
+    def test_bz2_round_trip(self):
+        path = self._round_trip("records.json.bz2")
+        self.assertEqual(recordio.compression(path), "bz2")
+        self.assertEqual(list(recordio.iter_records(path)), RECORDS)
+
+    def test_compression_is_detected_from_contents(self):
+        path = self._round_trip("records.json", codec = "gzip")
+        self.assertEqual(recordio.compression(path), "gzip")
+        self.assertEqual(recordio.read_dict(path, "review_id"), dict((record["review_id"], record) for record in RECORDS))
+
+    def test_small_buffers_write_every_record(self):
+        path = self._round_trip("records.json.gz", buffer_bytes = 100)
+        self.assertEqual(list(recordio.iter_records(path)), RECORDS)
+
+    def test_backends_decode_alike(self):
+        path = self._round_trip("records.json")
+        for backend in recordio.available_backends():
+            self.assertEqual(list(recordio.iter_records(path, backend)), RECORDS)
+
+    def test_batches_hold_every_line_in_order(self):
+        path = self._round_trip("records.json.bz2")
+        batches = list(recordio.iter_batches(path, 4096))
+        self.assertTrue(len(batches) > 1)
+        self.assertEqual([recordio.loads(line) for batch in batches for line in batch], RECORDS)
+
+    def test_write_lines_and_blank_lines(self):
+        path = os.path.join(self.directory, "lines.json")
+        with recordio.RecordWriter(path) as writer:
+            writer.write_lines(['{"a": 1}', '', '{"a": 2}'])
+        self.assertEqual(list(recordio.iter_records(path)), [{"a" : 1}, {"a" : 2}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+""" Tests for reviewcrf.  Run with python -m unittest discover. """
+
+import os
+import random
+import datetime
+import shutil
+import tempfile
+import unittest
+import crffeatures
+import reviewcrf
+
+WORDS = sorted(crffeatures.POSITIVE_WORDS) + sorted(crffeatures.NEGATIVE_WORDS) + ["food", "service", "place", "menu", "table"]
+
+
+def _friend_reviews(seed, num_users = 40, num_businesses = 12, num_reviews = 400):
+    """ Returns (reviews, user_dict) for a small random social network.  Each review lists the reviews of its business by friends of its author, as cleanyelp.clean_review_dict does. """
+    rng = random.Random(seed)
+    user_ids = ["u%d" % i for i in range(num_users)]
+    friends = dict((user_id, set()) for user_id in user_ids)
+    for i in range(3 * num_users):
+        user_id, friend_id = rng.sample(user_ids, 2)
+        friends[user_id].add(friend_id)
+        friends[friend_id].add(user_id)
+    reviews = {}
+    for i in range(num_reviews):
+        rating = rng.choice(["negative", "positive"])
+        text = " ".join(rng.choice(WORDS) for j in range(rng.randint(5, 30)))
+        date = datetime.date(2010, 1, 1) + datetime.timedelta(days = rng.randint(0, 365))
+        reviews["r%03d" % i] = {"review_id" : "r%03d" % i, "user_id" : rng.choice(user_ids), "business_id" : "b%d" % rng.randint(0, num_businesses - 1), "rating" : rating, "text" : text, "date" : date.isoformat()}
+    for review_id in reviews:
+        review = reviews[review_id]
+        review["friend_reviews_of_business"] = [other_id for other_id in sorted(reviews) if other_id != review_id and reviews[other_id]["business_id"] == review["business_id"] and reviews[other_id]["user_id"] in friends[review["user_id"]]]
+    user_dict = dict((user_id, {"user_id" : user_id, "friends" : sorted(friends[user_id]), "reviews" : []}) for user_id in user_ids)
+    return reviews, user_dict
+
+
+class CrfTagTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model_dir = tempfile.mkdtemp(prefix = "reviewcrf_test_")
+        train_reviews, cls.user_dict = _friend_reviews(0)
+        cls.model_path = reviewcrf.train_crf_incremental(train_reviews, cls.user_dict, cls.model_dir, params = {"max_iterations" : 20})
+        cls.test_reviews, test_users = _friend_reviews(1)
+        cls.user_dict.update(test_users)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.model_dir)
+
+    def test_sharded_tagging_matches_serial(self):
+        serial = reviewcrf.crftag_probabilities(self.test_reviews, self.user_dict, 1, self.model_path)
+        self.assertEqual(sorted(serial), sorted(reviewcrf.friend_review_pairs(self.test_reviews)))
+        self.assertTrue(len(serial) > 100)
+        for processes in [2, 3]:
+            self.assertEqual(reviewcrf.crftag_probabilities(self.test_reviews, self.user_dict, processes, self.model_path), serial)
+
+    def test_window_limits_the_tagged_pairs(self):
+        limited = reviewcrf.crftag_probabilities(self.test_reviews, self.user_dict, 2, self.model_path, window_days = 30, max_influencers = 1)
+        self.assertEqual(sorted(limited), sorted(reviewcrf.friend_review_pairs(self.test_reviews, 30, 1)))
+        serial = reviewcrf.crftag_probabilities(self.test_reviews, self.user_dict, 1, self.model_path)
+        for pair in limited:
+            self.assertEqual(limited[pair], serial[pair])
+
+    def test_probabilities_are_probabilities(self):
+        for probability in reviewcrf.crftag_probabilities(self.test_reviews, self.user_dict, 1, self.model_path).values():
+            self.assertTrue(0.0 <= probability <= 1.0)
+
+
+class VersionTest(unittest.TestCase):
+
+    PARAMS = {"max_iterations" : 5}
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp(prefix = "reviewcrf_test_")
+        self.reviews_a, self.user_dict = _friend_reviews(2, num_reviews = 150)
+        self.reviews_b, users_b = _friend_reviews(3, num_reviews = 150)
+        self.user_dict.update(users_b)
+
+    def tearDown(self):
+        shutil.rmtree(self.model_dir)
+
+    def _train(self, reviews, params = PARAMS, extractor = None):
+        return reviewcrf.train_crf_incremental(reviews, self.user_dict, self.model_dir, params = params, extractor = extractor)
+
+    def _versions(self):
+        return reviewcrf._read_manifest(self.model_dir)["versions"]
+
+    def _pair_log(self):
+        with open(os.path.join(self.model_dir, "pairs.log")) as pair_log:
+            return [line.split()[:2] for line in pair_log]
+
+    def test_unchanged_pairs_reuse_any_earlier_version(self):
+        model_a = self._train(self.reviews_a)
+        self.assertEqual(self._train(self.reviews_a), model_a)
+        model_b = self._train(self.reviews_b)
+        self.assertNotEqual(model_b, model_a)
+        # Switching back to earlier pairs reuses their model rather than retraining.
+        self.assertEqual(self._train(self.reviews_a), model_a)
+        self.assertEqual(len(self._versions()), 2)
+        self.assertEqual(reviewcrf.latest_crf_model(self.model_dir), model_b)
+
+    def test_parameters_features_and_missing_models_retrain(self):
+        model = self._train(self.reviews_a)
+        self.assertNotEqual(self._train(self.reviews_a, {"max_iterations" : 6}), model)
+        self.assertNotEqual(self._train(self.reviews_a, extractor = crffeatures.PairFeatureExtractor(self.user_dict, top_k = 5)), model)
+        os.remove(model)
+        retrained = self._train(self.reviews_a)
+        self.assertNotEqual(retrained, model)
+        self.assertTrue(os.path.exists(retrained))
+        self.assertEqual(len(self._versions()), 4)
+
+    def test_pair_log_holds_the_latest_pairs(self):
+        self._train(self.reviews_a)
+        pairs_a = reviewcrf.friend_review_pairs(self.reviews_a)
+        self.assertEqual(self._pair_log(), [list(pair) for pair in pairs_a])
+        self.assertEqual(self._versions()[0]["new_pairs"], len(pairs_a))
+        subset = dict((review_id, self.reviews_a[review_id]) for review_id in sorted(self.reviews_a)[:100])
+        self._train(subset)
+        pairs_subset = reviewcrf.friend_review_pairs(subset)
+        self.assertEqual(self._pair_log(), [list(pair) for pair in pairs_subset])
+        # Every pair among a subset of the reviews was already a pair of the full set.
+        self.assertEqual(self._versions()[1]["new_pairs"], 0)
+        self.assertEqual(self._versions()[1]["num_pairs"], len(pairs_subset))
+
+    def test_no_pairs(self):
+        no_pairs = dict((review_id, dict(review, friend_reviews_of_business = [])) for review_id, review in self.reviews_a.items())
+        self.assertRaises(ValueError, self._train, no_pairs)
+        model = self._train(self.reviews_a)
+        self.assertEqual(self._train(no_pairs), model)
+        self.assertEqual(len(self._versions()), 1)
+        os.remove(model)
+        self.assertEqual(reviewcrf.latest_crf_model(self.model_dir), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
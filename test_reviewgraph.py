@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+""" Tests for reviewgraph.  Run with python -m unittest discover. """
+
+import random
+import itertools
+import unittest
+import numpy
+import scipy.sparse.csgraph
+import reviewgraph
+
+
+def _installed_backends():
+    backends = ["native"]
+    if hasattr(scipy.sparse.csgraph, "maximum_flow"):
+        backends.append("scipy")
+    if reviewgraph.graph_tool is not None:
+        backends.append("graph_tool")
+    return backends
+
+
+def _random_review_graph(rng, num_reviews, num_pairs, steps = 4):
+    """ Returns (test_reviews, ind_pref, pair_str) with preferences and strengths on a coarse grid, so that ties and alternative minimum cuts are common. """
+    review_ids = ["r%d" % i for i in range(num_reviews)]
+    test_reviews = dict((review_id, {"review_id" : review_id}) for review_id in review_ids)
+    ind_pref = dict((review_id, rng.randint(0, steps) / float(steps)) for review_id in review_ids)
+    pair_str = {}
+    for i in range(num_pairs if num_reviews > 1 else 0):
+        pair = tuple(rng.sample(review_ids, 2))
+        pair_str[pair] = rng.randint(0, steps) / float(steps)
+    return test_reviews, ind_pref, pair_str
+
+
+def _brute_force_source_side(num_nodes, source, target, capacity):
+    """ Returns the smallest source side among all minimum cuts, found by trying every partition of the review nodes. """
+    units = reviewgraph._scaled(capacity)
+    best = None
+    best_sides = []
+    for bits in itertools.product([False, True], repeat = num_nodes - 2):
+        side = numpy.array([True, False] + list(bits))
+        cut = units[side[source] & ~side[target]].sum()
+        if best is None or cut < best:
+            best = cut
+            best_sides = [side]
+        elif cut == best:
+            best_sides.append(side)
+    # Minimum cuts are closed under intersection, so the smallest source side is the intersection of them all.
+    return numpy.logical_and.reduce(best_sides)
+
+
+class BackendTest(unittest.TestCase):
+
+    def test_backends_find_the_smallest_minimum_cut(self):
+        rng = random.Random(0)
+        for trial in range(60):
+            test_reviews, ind_pref, pair_str = _random_review_graph(rng, rng.randint(1, 7), rng.randint(0, 10))
+            review_ids, source, target, capacity = reviewgraph.review_graph_arrays(test_reviews, ind_pref, pair_str)
+            expected = _brute_force_source_side(len(review_ids) + 2, source, target, capacity)
+            for backend in _installed_backends():
+                source_side = reviewgraph.min_cut_source_side(len(review_ids) + 2, source, target, capacity, backend)
+                self.assertEqual(list(source_side), list(expected), "%s on trial %d" % (backend, trial))
+
+    def test_backends_agree_on_larger_graphs(self):
+        rng = random.Random(1)
+        for trial in range(10):
+            test_reviews, ind_pref, pair_str = _random_review_graph(rng, 60, 120, steps = 20)
+            review_ids, source, target, capacity = reviewgraph.review_graph_arrays(test_reviews, ind_pref, pair_str)
+            sides = [reviewgraph.min_cut_source_side(len(review_ids) + 2, source, target, capacity, backend) for backend in _installed_backends()]
+            for side in sides[1:]:
+                self.assertEqual(list(side), list(sides[0]))
+
+    def test_build_graph_classes(self):
+        # r0 leans negative and r1 positive; their strong link pulls r1 to the negative class, while r2 is left alone.
+        test_reviews = {"r0" : {}, "r1" : {}, "r2" : {}}
+        ind_pref = {"r0" : 0.1, "r1" : 0.6, "r2" : 0.9}
+        classes = reviewgraph.build_graph(["negative", "positive"], test_reviews, ind_pref, {("r0", "r1") : 0.9, ("r1", "r0") : 0.9}, "native")
+        self.assertEqual(classes, {"r0" : 0, "r1" : 0, "r2" : 1})
+        self.assertEqual(reviewgraph.build_graph(["negative", "positive"], test_reviews, ind_pref, {}, "native"), {"r0" : 0, "r1" : 1, "r2" : 1})
+
+
+class ComponentTest(unittest.TestCase):
+
+    def _clustered_graph(self, rng, num_clusters, cluster_size, steps):
+        """ Returns a review graph whose pairs only link reviews of the same cluster, so that it has many components, including isolated reviews. """
+        test_reviews = {}
+        ind_pref = {}
+        pair_str = {}
+        for cluster in range(num_clusters):
+            review_ids = ["c%d_r%d" % (cluster, i) for i in range(rng.randint(1, cluster_size))]
+            for review_id in review_ids:
+                test_reviews[review_id] = {"review_id" : review_id}
+                ind_pref[review_id] = rng.randint(0, steps) / float(steps)
+            for i in range(rng.randint(0, 2 * len(review_ids)) if len(review_ids) > 1 else 0):
+                pair_str[tuple(rng.sample(review_ids, 2))] = rng.randint(0, steps) / float(steps)
+        return test_reviews, ind_pref, pair_str
+
+    def test_components_match_the_whole_graph(self):
+        rng = random.Random(2)
+        for trial in range(20):
+            test_reviews, ind_pref, pair_str = self._clustered_graph(rng, 40, 6, rng.choice([4, 1000]))
+            review_ids, source, target, capacity = reviewgraph.review_graph_arrays(test_reviews, ind_pref, pair_str)
+            for backend in _installed_backends():
+                whole = reviewgraph.min_cut_source_side(len(review_ids) + 2, source, target, capacity, backend)
+                by_component = reviewgraph.component_min_cut_source_side(len(review_ids) + 2, source, target, capacity, backend)
+                self.assertEqual(list(by_component), list(whole), "%s on trial %d" % (backend, trial))
+
+    def test_parallel_components_match_serial(self):
+        rng = random.Random(3)
+        test_reviews, ind_pref, pair_str = self._clustered_graph(rng, 200, 8, 10)
+        serial = reviewgraph.build_graph(["negative", "positive"], test_reviews, ind_pref, pair_str, "native", decompose = True)
+        parallel = reviewgraph.build_graph(["negative", "positive"], test_reviews, ind_pref, pair_str, "native", decompose = True, processes = 2)
+        whole = reviewgraph.build_graph(["negative", "positive"], test_reviews, ind_pref, pair_str, "native")
+        self.assertEqual(serial, whole)
+        self.assertEqual(parallel, whole)
+
+    def test_empty_graph(self):
+        self.assertEqual(reviewgraph.build_graph(["negative", "positive"], {}, {}, {}, "native", decompose = True), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
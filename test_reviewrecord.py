@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Tests for reviewrecord.  Run with python -m unittest discover. """
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+import collections
+import reviewrecord
+
+# Texts that look like the fields read with regular expressions.
+TRICKY_TEXTS = [u'The "rating": 1 here is wrong', u'"friend_reviews_of_business": ["r000"], "review_id": "nope"', u'Back\\slash and ] bracket', u'Caf\xe9 ☃ \U0001f600', u'']
+
+
+def _reviews(seed, num_reviews = 200):
+    """ Returns review objects with klass or star ratings, with and without influencer lists, some with ids that need escapes in json. """
+    rng = random.Random(seed)
+    reviews = []
+    for i in range(num_reviews):
+        review = {"review_id" : u"r%03d" % i, "user_id" : rng.choice([u"u1", u"u\"2", u"\xfc3", u"u4"]), "business_id" : rng.choice([u"b1", u"b\\2", u"b☃"]), "date" : u"2012-01-%02d" % rng.randint(1, 28), "text" : rng.choice(TRICKY_TEXTS) + u" food %d" % i}
+        review["rating"] = rng.choice([u"negative", u"positive", 1, 4, 3.5])
+        choice = rng.random()
+        if choice < 0.3:
+            review["friend_reviews_of_business"] = []
+        elif choice < 0.8:
+            review["friend_reviews_of_business"] = [u"r%03d" % rng.randint(0, num_reviews - 1) for j in range(rng.randint(1, 4))] + rng.choice([[], [u"r]x"], [u"r\"y"]])
+        reviews.append(review)
+    return reviews
+
+
+class ReadReviewRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "reviewrecord_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, reviews, ensure_ascii = True, separators = None, text_first = False):
+        """ Writes reviews as json lines, with the text before or after the other fields. """
+        path = os.path.join(self.directory, "reviews.json")
+        with open(path, 'wb') as review_file:
+            for review in reviews:
+                keys = sorted(review, key = lambda key: (key != "text") == text_first)
+                line = json.dumps(collections.OrderedDict((key, review[key]) for key in keys), ensure_ascii = ensure_ascii, separators = separators)
+                if isinstance(line, unicode):
+                    line = line.encode('utf-8')
+                review_file.write(line + "\n")
+        return path
+
+    def test_records_match_json(self):
+        reviews = _reviews(0)
+        for ensure_ascii in [True, False]:
+            for separators in [None, (",", ":")]:
+                for text_first in [True, False]:
+                    records = reviewrecord.read_review_records(self._write(reviews, ensure_ascii, separators, text_first))
+                    self.assertEqual(sorted(records), sorted(review["review_id"] for review in reviews))
+                    for review in reviews:
+                        record = records[review["review_id"]]
+                        self.assertEqual(record.to_dict(), review)
+                        self.assertEqual(record.friend_reviews_of_business, review.get("friend_reviews_of_business"))
+                        for field in ["review_id", "user_id", "business_id", "date", "rating"]:
+                            self.assertEqual(type(record[field]), type(review[field]))
+
+    def test_text_is_not_kept(self):
+        records = reviewrecord.read_review_records(self._write(_reviews(1)))
+        for record in records.values():
+            self.assertEqual(record._text, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+""" Tests for reviewstats.  Run with python -m unittest discover. """
+
+import os
+import json
+import random
+import shutil
+import datetime
+import tempfile
+import unittest
+import cleanyelp
+import data_statistics
+import reviewstats
+
+
+def _write_dataset(directory, seed, num_users = 40, num_businesses = 15, num_reviews = 500):
+    """ Writes reviews.json and users.json for a small random social network and returns their paths.  Authors often review a business more than once, review lists are in a random order, a few authors have no user record and a few reviews are missing from their author's review list. """
+    rng = random.Random(seed)
+    user_ids = ["u%d" % i for i in range(num_users)]
+    friends = dict((user_id, set()) for user_id in user_ids)
+    for i in range(3 * num_users):
+        user_id, friend_id = rng.sample(user_ids, 2)
+        friends[user_id].add(friend_id)
+        friends[friend_id].add(user_id)
+    reviews = []
+    review_lists = dict((user_id, []) for user_id in user_ids)
+    for i in range(num_reviews):
+        user_id = rng.choice(user_ids)
+        date = datetime.date(2010, 1, 1) + datetime.timedelta(days = rng.randint(0, 60))
+        reviews.append({"review_id" : "r%03d" % i, "user_id" : user_id, "business_id" : "b%d" % rng.randint(0, num_businesses - 1), "stars" : rng.randint(1, 5), "date" : date.isoformat()})
+        if rng.random() < 0.95:
+            review_lists[user_id].append("r%03d" % i)
+    review_path = os.path.join(directory, "reviews.json")
+    with open(review_path, 'w') as review_file:
+        for review in reviews:
+            review_file.write(json.dumps(review) + "\n")
+    user_path = os.path.join(directory, "users.json")
+    with open(user_path, 'w') as user_file:
+        for user_id in user_ids[3:]:
+            rng.shuffle(review_lists[user_id])
+            user_file.write(json.dumps({"user_id" : user_id, "friends" : sorted(friends[user_id]), "reviews" : review_lists[user_id]}) + "\n")
+    return review_path, user_path
+
+
+def _read_json_lines(path):
+    with open(path) as json_file:
+        return [json.loads(line) for line in json_file]
+
+
+def _reference_statistics(review_path, user_path, klass_of, pair_order, known_users_only):
+    """ The statistics as the dict-based code computed them: class counts over the review dictionary and homophily over the pairs of cleanyelp.find_review_pairs_by_friends. """
+    user_dict = dict((user["user_id"], user) for user in _read_json_lines(user_path))
+    review_dict = dict((review["review_id"], review) for review in _read_json_lines(review_path))
+    if known_users_only:
+        data_statistics.remove_reviews_from_users_without_friends(review_dict, user_dict)
+    klass_counts = {}
+    business_reviews = {}
+    for review_id in review_dict:
+        klass = klass_of(review_dict[review_id])
+        klass_counts[klass] = klass_counts.get(klass, 0) + 1
+        business_id = review_dict[review_id]["business_id"]
+        business_reviews[business_id] = business_reviews.get(business_id, 0) + 1
+    business_size_counts = {}
+    for business_id in business_reviews:
+        business_size_counts[business_reviews[business_id]] = business_size_counts.get(business_reviews[business_id], 0) + 1
+    pairs = cleanyelp.find_review_pairs_by_friends(user_dict, review_dict, 1, pair_order)
+    pair_klass_counts = {}
+    homophily_counts = {}
+    for first_id, second_id in pairs:
+        first_klass = klass_of(review_dict[first_id])
+        pair_klass_counts[first_klass] = pair_klass_counts.get(first_klass, 0) + 1
+        if klass_of(review_dict[second_id]) == first_klass:
+            homophily_counts[first_klass] = homophily_counts.get(first_klass, 0) + 1
+    return {"num_users" : len(user_dict), "num_reviews" : len(review_dict), "num_businesses" : len(business_reviews), "num_pairs" : len(pairs), "klass_counts" : klass_counts, "pair_klass_counts" : pair_klass_counts, "homophily_counts" : homophily_counts, "business_size_counts" : business_size_counts}
+
+
+class ReviewStatisticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "reviewstats_test_")
+        self.review_path, self.user_path = _write_dataset(self.directory, 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _assert_matches_reference(self, klass_of, pair_order, known_users_only):
+        expected = _reference_statistics(self.review_path, self.user_path, klass_of, pair_order, known_users_only)
+        self.assertTrue(expected["num_pairs"] > 50)
+        for processes, num_shards in [(1, 1), (1, 7), (3, None)]:
+            stats = reviewstats.compute_review_statistics(self.review_path, self.user_path, klass_of, pair_order, known_users_only, processes, num_shards).to_dict()
+            for key in expected:
+                self.assertEqual(stats[key], expected[key], "%s with %s processes and %s shards" % (key, processes, num_shards))
+
+    def test_binary_statistics_match_the_dict_based_computation(self):
+        self._assert_matches_reference(reviewstats.binary_klass, cleanyelp.later_earlier_pair, False)
+
+    def test_three_klass_statistics_match_the_dict_based_computation(self):
+        self._assert_matches_reference(data_statistics.three_klass, data_statistics.earlier_later_pair, True)
+
+    def test_user_distributions(self):
+        users = _read_json_lines(self.user_path)
+        stats = reviewstats.compute_review_statistics(self.review_path, self.user_path, processes = 1)
+        self.assertEqual(stats.num_users, len(users))
+        self.assertEqual(sum(stats.degree_counts.values()), len(users))
+        self.assertEqual(sum(degree * count for degree, count in stats.degree_counts.items()), sum(len(user["friends"]) for user in users))
+        self.assertEqual(sum(size * count for size, count in stats.user_review_counts.items()), sum(len(user["reviews"]) for user in users))
+
+    def test_wrappers_count_as_before(self):
+        review_dict = dict((review["review_id"], dict(review, rating = reviewstats.binary_klass(review))) for review in _read_json_lines(self.review_path))
+        counts = cleanyelp.klass_counts(review_dict, ["negative", "positive"])
+        self.assertEqual(counts["total"], len(review_dict))
+        self.assertEqual(counts["negative"] + counts["positive"], len(review_dict))
+        self.assertEqual(counts["positive"], sum(1 for review in review_dict.values() if review["stars"] > 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+""" Tests for reviewstore.  Run with python -m unittest discover. """
+
+import os
+import copy
+import pickle
+import random
+import datetime
+import shutil
+import tempfile
+import unittest
+import numpy
+import reviewstore
+
+
+def _reviews(seed, num_reviews = 300):
+    """ Returns a list of cleaned review objects in random id order, some with non-ascii text and influencers that are not in the list. """
+    rng = random.Random(seed)
+    review_ids = ["r%d" % i for i in range(num_reviews)]
+    rng.shuffle(review_ids)
+    reviews = []
+    for review_id in review_ids:
+        date = datetime.date(2009, 1, 1) + datetime.timedelta(days = rng.randint(0, 900))
+        text = u" ".join(rng.choice([u"good", u"bad", u"caf\xe9", u"\u2603"]) for i in range(rng.randint(0, 20)))
+        influencers = rng.sample(review_ids, rng.randint(0, 4)) + ["outside%d" % rng.randint(0, 5) for i in range(rng.randint(0, 1))]
+        reviews.append({"review_id" : review_id, "user_id" : "u%d" % rng.randint(0, 40), "business_id" : "b%d" % rng.randint(0, 30), "rating" : rng.choice(["negative", "positive"]), "text" : text, "date" : date.isoformat(), "friend_reviews_of_business" : influencers})
+    return reviews
+
+
+class ReviewStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "reviewstore_test_")
+        self.store_path = os.path.join(self.directory, "reviews.store")
+        self.reviews = _reviews(0)
+        reviewstore.write_review_store(self.reviews, self.store_path)
+        self.store = reviewstore.ReviewStore(self.store_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.store), len(self.reviews))
+        for row, review in enumerate(self.reviews):
+            self.assertEqual(self.store.review(row), review)
+        self.assertEqual(dict(self.store.review_dict()), dict((review["review_id"], review) for review in self.reviews))
+
+    def test_star_ratings_and_no_influencers(self):
+        reviews = [dict(review, rating = i % 5 + 1) for i, review in enumerate(self.reviews)]
+        for review in reviews:
+            del review["friend_reviews_of_business"]
+        store_path = os.path.join(self.directory, "stars.store")
+        reviewstore.write_review_store(reviews, store_path)
+        self.assertEqual(list(reviewstore.open_review_dict(store_path).values()), reviews)
+
+    def test_row_lookup(self):
+        for row, review in enumerate(self.reviews):
+            self.assertEqual(self.store.row(review["review_id"]), row)
+            self.assertEqual(self.store.row(unicode(review["review_id"])), row)
+        # Influencers outside the store have ids but no rows.
+        for review_id in ["outside0", "r", "r1000", "", "zzz", "r10x", "a" * 40]:
+            self.assertRaises(KeyError, self.store.row, review_id)
+
+    def test_stores_without_a_sorted_id_column(self):
+        os.remove(os.path.join(self.store_path, "review_ids_sorted.npy"))
+        os.remove(os.path.join(self.store_path, "review_id_order.npy"))
+        store = reviewstore.ReviewStore(self.store_path)
+        for row, review in enumerate(self.reviews):
+            self.assertEqual(store.row(review["review_id"]), row)
+        self.assertRaises(KeyError, store.row, "outside0")
+
+    def test_empty_store(self):
+        store_path = os.path.join(self.directory, "empty.store")
+        reviewstore.write_review_store([], store_path)
+        review_dict = reviewstore.open_review_dict(store_path)
+        self.assertEqual(len(review_dict), 0)
+        self.assertFalse("r1" in review_dict)
+
+    def test_subsets(self):
+        subset_ids = [review["review_id"] for review in self.reviews[::3]]
+        self.store.write_subset("test", subset_ids, "digest")
+        self.assertTrue(self.store.has_subset("test"))
+        self.assertFalse(self.store.has_subset("train"))
+        store = reviewstore.ReviewStore(self.store_path)
+        self.assertEqual(store.subset_source("test"), "digest")
+        self.assertEqual(store.subset_source("train"), None)
+        review_dict = store.review_dict("test")
+        self.assertEqual(list(review_dict), subset_ids)
+        self.assertEqual(len(review_dict), len(subset_ids))
+        self.assertTrue(subset_ids[0] in review_dict)
+        self.assertFalse(self.reviews[1]["review_id"] in review_dict)
+        self.assertRaises(KeyError, lambda: review_dict[self.reviews[1]["review_id"]])
+
+
+class StoreReviewDictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "reviewstore_test_")
+        self.reviews = _reviews(1)
+        reviewstore.write_review_store(self.reviews, self.directory)
+        self.review_dict = reviewstore.open_review_dict(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reading_keeps_nothing(self):
+        for review_id in self.review_dict:
+            self.review_dict[review_id]["text"]
+        self.assertEqual(self.review_dict._overrides, {})
+
+    def test_changes_in_place_persist(self):
+        review_id = self.reviews[0]["review_id"]
+        review = self.review_dict[review_id]
+        review["rating"] = "neutral"
+        review["extra"] = 1
+        self.assertTrue(self.review_dict[review_id] is review)
+        self.assertEqual(self.review_dict[review_id]["rating"], "neutral")
+        self.review_dict[self.reviews[1]["review_id"]].update(rating = "neutral")
+        self.assertEqual(self.review_dict[self.reviews[1]["review_id"]]["rating"], "neutral")
+        self.assertEqual(len(self.review_dict._overrides), 2)
+        self.assertEqual(self.review_dict[self.reviews[2]["review_id"]], self.reviews[2])
+
+    def test_assignment_and_deletion(self):
+        review_ids = [review["review_id"] for review in self.reviews]
+        stale = self.review_dict[review_ids[0]]
+        del self.review_dict[review_ids[0]]
+        # Changing a review after its deletion does not bring it back.
+        stale["rating"] = "neutral"
+        self.assertFalse(review_ids[0] in self.review_dict)
+        self.assertRaises(KeyError, lambda: self.review_dict[review_ids[0]])
+        self.review_dict["new"] = {"review_id" : "new"}
+        self.review_dict[review_ids[1]] = {"review_id" : review_ids[1]}
+        self.assertEqual(len(self.review_dict), len(review_ids))
+        self.assertEqual(list(self.review_dict), review_ids[1:] + ["new"])
+        self.assertEqual(self.review_dict[review_ids[1]], {"review_id" : review_ids[1]})
+        self.review_dict[review_ids[0]] = self.reviews[0]
+        self.assertEqual(len(self.review_dict), len(review_ids) + 1)
+        self.assertRaises(KeyError, self.review_dict.__delitem__, "missing")
+
+    def test_copies_are_plain_reviews(self):
+        review = self.review_dict[self.reviews[0]["review_id"]]
+        for duplicate in [copy.copy(review), copy.deepcopy(review), pickle.loads(pickle.dumps(review, pickle.HIGHEST_PROTOCOL))]:
+            self.assertEqual(type(duplicate), dict)
+            self.assertEqual(duplicate, self.reviews[0])
+        self.assertEqual(self.review_dict._overrides, {})
+
+    def test_lookups_use_no_id_dictionary(self):
+        self.assertTrue(self.reviews[5]["review_id"] in self.review_dict)
+        self.assertTrue(isinstance(self.review_dict.store.sorted_ids, numpy.memmap))
+        self.assertEqual([name for name in vars(self.review_dict.store) if isinstance(getattr(self.review_dict.store, name), dict)], ["meta"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+""" Tests for socialgraph.  Run with python -m unittest discover. """
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+import readyelp
+import socialgraph
+
+# "eve" is a friend without a record, "carol" lists "carol" once and "dan" twice, and "dan" lists no friends but is listed by "carol".
+USERS = [
+    {"user_id" : "alice", "friends" : ["bob", "carol"], "reviews" : ["r1", "r2"]},
+    {"user_id" : "bob", "friends" : ["alice", "eve"], "reviews" : []},
+    {"user_id" : "carol", "friends" : ["carol", "dan", "dan"], "reviews" : ["r3"]},
+    {"user_id" : "dan", "friends" : [], "reviews" : ["r4"]},
+]
+
+
+def _symmetric_friends(users):
+    """ Returns user_id -> set of friends, with every listed friendship seen from both sides and self-friendships dropped. """
+    friends = {}
+    for user in users:
+        for friend_id in user["friends"]:
+            if friend_id == user["user_id"]: continue
+            friends.setdefault(user["user_id"], set()).add(friend_id)
+            friends.setdefault(friend_id, set()).add(user["user_id"])
+    return friends
+
+
+class SocialGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "socialgraph_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookups(self):
+        graph = socialgraph.SocialGraph.from_users(USERS)
+        self.assertEqual(graph.num_users, 4)
+        self.assertEqual(graph.num_nodes, 5)
+        self.assertEqual([graph.user_id(code) for code in range(4)], ["alice", "bob", "carol", "dan"])
+        self.assertEqual(sorted(graph.friends("alice")), ["bob", "carol"])
+        self.assertEqual(sorted(graph.friends("carol")), ["alice", "dan"])
+        self.assertEqual(graph.friends("dan"), ["carol"])
+        self.assertEqual(graph.friends("eve"), ["bob"])
+        self.assertEqual(graph.degree("carol"), 2)
+        self.assertTrue(graph.are_friends("dan", "carol"))
+        self.assertTrue(graph.are_friends("carol", "dan"))
+        self.assertFalse(graph.are_friends("alice", "dan"))
+        self.assertFalse(graph.are_friends("carol", "carol"))
+        self.assertRaises(KeyError, graph.code, "mallory")
+
+    def test_user_dict_view(self):
+        user_dict = socialgraph.SocialGraph.from_users(USERS).user_dict()
+        self.assertEqual(len(user_dict), 4)
+        self.assertEqual(list(user_dict), ["alice", "bob", "carol", "dan"])
+        # Friends without a record are friends of the users, but not users of the view.
+        self.assertFalse("eve" in user_dict)
+        self.assertRaises(KeyError, lambda: user_dict["eve"])
+        self.assertEqual(user_dict["alice"]["reviews"], ["r1", "r2"])
+        self.assertEqual(user_dict["bob"]["reviews"], [])
+        self.assertEqual(sorted(user_dict["bob"]["friends"]), ["alice", "eve"])
+
+    def test_random_graph_matches_symmetric_friend_sets(self):
+        rng = random.Random(0)
+        user_ids = ["user%03d" % i for i in range(300)]
+        users = [{"user_id" : user_id, "friends" : rng.sample(user_ids, rng.randint(0, 8)), "reviews" : ["%s_r%d" % (user_id, i) for i in range(rng.randint(0, 3))]} for user_id in user_ids[:250]]
+        graph = socialgraph.SocialGraph.from_users(users)
+        friends = _symmetric_friends(users)
+        known = set(friends) | set(user["user_id"] for user in users)
+        for user_id in known:
+            self.assertEqual(set(graph.friends(user_id)), friends.get(user_id, set()))
+            codes = graph.friend_codes(graph.code(user_id))
+            self.assertTrue((codes[1:] > codes[:-1]).all())
+        for user in users:
+            self.assertEqual(graph.user_dict()[user["user_id"]]["reviews"], user["reviews"])
+
+    def test_save_and_load_from_file(self):
+        user_path = os.path.join(self.directory, "users.json")
+        with open(user_path, 'w') as user_file:
+            for user in USERS:
+                user_file.write(json.dumps(user) + '\n')
+        graph_path = os.path.join(self.directory, "users.graph")
+        built = socialgraph.write_social_graph(user_path, graph_path)
+        loaded = socialgraph.SocialGraph.load(graph_path)
+        self.assertEqual(loaded.num_users, built.num_users)
+        self.assertEqual(list(loaded.indices), list(built.indices))
+        user_dict = readyelp.read_users_to_dict(graph_path)
+        self.assertEqual(dict(user_dict), dict(built.user_dict()))
+        self.assertEqual(sorted(user_dict["carol"]["friends"]), ["alice", "dan"])
+
+
+if __name__ == "__main__":
+    unittest.main()
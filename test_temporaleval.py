@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+""" Tests for temporaleval.  Run with python -m unittest discover. """
+
+import os
+import random
+import datetime
+import shutil
+import tempfile
+import unittest
+import numpy
+import crffeatures
+import reviewcrf
+import temporalindex
+import temporaleval
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+WORDS = sorted(crffeatures.POSITIVE_WORDS) + sorted(crffeatures.NEGATIVE_WORDS) + ["food", "service", "place", "menu", "table"]
+
+
+def _dated_reviews(seed, num_users = 40, num_businesses = 10, num_reviews = 600):
+    """ Returns (reviews, user_dict) for reviews spread over two years, whose texts lean towards their ratings.  Each review lists the reviews of its business by friends of its author.  A few authors have no user record. """
+    rng = random.Random(seed)
+    user_ids = ["u%d" % i for i in range(num_users)]
+    friends = dict((user_id, set()) for user_id in user_ids)
+    for i in range(3 * num_users):
+        user_id, friend_id = rng.sample(user_ids, 2)
+        friends[user_id].add(friend_id)
+        friends[friend_id].add(user_id)
+    reviews = {}
+    for i in range(num_reviews):
+        rating = rng.choice(["negative", "positive"])
+        lexicon = sorted(crffeatures.POSITIVE_WORDS if rating == "positive" else crffeatures.NEGATIVE_WORDS)
+        text = " ".join(rng.choice(lexicon if rng.random() < 0.3 else WORDS) for j in range(rng.randint(5, 20)))
+        date = datetime.date(2010, 1, 1) + datetime.timedelta(days = rng.randint(0, 730))
+        reviews["r%03d" % i] = {"review_id" : "r%03d" % i, "user_id" : rng.choice(user_ids), "business_id" : "b%d" % rng.randint(0, num_businesses - 1), "rating" : rating, "text" : text, "date" : date.isoformat()}
+    for review_id in reviews:
+        review = reviews[review_id]
+        review["friend_reviews_of_business"] = [other_id for other_id in sorted(reviews) if other_id != review_id and reviews[other_id]["business_id"] == review["business_id"] and reviews[other_id]["user_id"] in friends[review["user_id"]]]
+    user_dict = dict((user_id, {"user_id" : user_id, "friends" : sorted(friends[user_id]), "reviews" : []}) for user_id in user_ids[3:])
+    return reviews, user_dict
+
+
+class RollingOriginTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix = "temporaleval_test_")
+        self.reviews, self.user_dict = _dated_reviews(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _versions(self, model_dir):
+        return reviewcrf._read_manifest(model_dir)["versions"]
+
+    def test_windows_follow_the_cuts(self):
+        results = temporaleval.rolling_origin_evaluation(self.reviews, 6, n_features = 2 ** 12)
+        days = [temporalindex.date_ordinal(review["date"]) for review in self.reviews.values()]
+        cuts = temporaleval.cut_days(days, 6)
+        self.assertEqual(len(results), 6)
+        for cut, result in zip(cuts, results):
+            self.assertEqual(result["cut"], temporalindex.ordinal_date_string(cut))
+            self.assertEqual(result["train"], sum(1 for day in days if day <= cut))
+            self.assertEqual(result["pair_scoring"], "agreement")
+        self.assertEqual(sum(result["test"] for result in results), sum(1 for day in days if day > cuts[0]))
+
+    def test_incremental_naive_bayes_matches_a_refit(self):
+        results = temporaleval.rolling_origin_evaluation(self.reviews, 4, n_features = 2 ** 12)
+        vectorizer = HashingVectorizer(stop_words = 'english', n_features = 2 ** 12, alternate_sign = False, norm = None)
+        cuts = [temporalindex.date_ordinal(result["cut"]) for result in results] + [None]
+        for result, cut, next_cut in zip(results, cuts, cuts[1:]):
+            train_ids = [review_id for review_id in self.reviews if temporalindex.date_ordinal(self.reviews[review_id]["date"]) <= cut]
+            test_ids = [review_id for review_id in self.reviews if temporalindex.date_ordinal(self.reviews[review_id]["date"]) > cut and (next_cut is None or temporalindex.date_ordinal(self.reviews[review_id]["date"]) <= next_cut)]
+            clf = MultinomialNB().fit(vectorizer.transform([self.reviews[review_id]["text"] for review_id in train_ids]), [self.reviews[review_id]["rating"] for review_id in train_ids])
+            Y_predict = clf.predict(vectorizer.transform([self.reviews[review_id]["text"] for review_id in test_ids]))
+            accuracy = numpy.mean([Y_predict[i] == self.reviews[review_id]["rating"] for i, review_id in enumerate(test_ids)])
+            self.assertAlmostEqual(result["nb_accuracy"], accuracy)
+
+    def test_crf_is_trained_once(self):
+        model_dir = os.path.join(self.directory, "crfmodels")
+        results = temporaleval.rolling_origin_evaluation(self.reviews, 6, n_features = 2 ** 12, user_dict = self.user_dict, crf_model_dir = model_dir, crf_params = {"max_iterations" : 5})
+        self.assertEqual(len(self._versions(model_dir)), 1)
+        self.assertEqual(set(result["pair_scoring"] for result in results), set(["crf"]))
+        self.assertEqual(set(result["crf_model"] for result in results), set([self._versions(model_dir)[0]["model"]]))
+        # A second run on the same reviews reuses the model.
+        temporaleval.rolling_origin_evaluation(self.reviews, 6, n_features = 2 ** 12, user_dict = self.user_dict, crf_model_dir = model_dir, crf_params = {"max_iterations" : 5})
+        self.assertEqual(len(self._versions(model_dir)), 1)
+
+    def test_crf_retrain_every(self):
+        model_dir = os.path.join(self.directory, "crfmodels")
+        results = temporaleval.rolling_origin_evaluation(self.reviews, 6, n_features = 2 ** 12, user_dict = self.user_dict, crf_model_dir = model_dir, crf_params = {"max_iterations" : 5}, crf_retrain_every = 2)
+        self.assertEqual(len(self._versions(model_dir)), 3)
+        models = [result["crf_model"] for result in results]
+        self.assertEqual(models[0], models[1])
+        self.assertNotEqual(models[1], models[2])
+
+    def test_given_crf_model(self):
+        model_dir = os.path.join(self.directory, "crfmodels")
+        model_path = reviewcrf.train_crf_incremental(self.reviews, self.user_dict, model_dir, params = {"max_iterations" : 5})
+        results = temporaleval.rolling_origin_evaluation(self.reviews, 3, n_features = 2 ** 12, user_dict = self.user_dict, crf_model_path = model_path, crf_model_dir = os.path.join(self.directory, "unused"))
+        self.assertEqual([result["crf_model"] for result in results], [model_path] * 3)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "unused")))
+
+
+if __name__ == "__main__":
+    unittest.main()
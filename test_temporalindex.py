@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+""" Tests for temporalindex.  Run with python -m unittest discover. """
+
+import random
+import datetime
+import unittest
+import temporalindex
+
+
+def _brute_friend_reviews(reviews, business_id, friends, date, window_days, max_reviews, earlier_only):
+    """ friend_reviews by scanning every review of the business. """
+    day = temporalindex.date_ordinal(date)
+    rows = []
+    for review_id in reviews:
+        review = reviews[review_id]
+        if review["business_id"] != business_id or review["user_id"] not in friends: continue
+        review_day = temporalindex.date_ordinal(review["date"])
+        if window_days is None and max_reviews is None:
+            if earlier_only and review_day >= day: continue
+        else:
+            if review_day > day or (earlier_only and review_day == day): continue
+            if window_days is not None and review_day < day - window_days: continue
+        rows.append((review_day, review_id))
+    rows.sort()
+    if max_reviews is not None:
+        rows = rows[len(rows) - min(max_reviews, len(rows)):]
+    return [review_id for day, review_id in rows]
+
+
+class RecentTest(unittest.TestCase):
+
+    # Two reviews on day 10, and one each on days 4, 7, 12 and 20.
+    DATED = [(4, "a"), (7, "b"), (10, "c"), (10, "d"), (12, "e"), (20, "f")]
+
+    def test_on_or_before_day(self):
+        self.assertEqual(temporalindex.recent(self.DATED, 10), self.DATED[:4])
+        self.assertEqual(temporalindex.recent(self.DATED, 3), [])
+        self.assertEqual(temporalindex.recent(self.DATED, 25), self.DATED)
+
+    def test_earlier_only_excludes_the_same_day(self):
+        self.assertEqual(temporalindex.recent(self.DATED, 10, earlier_only = True), self.DATED[:2])
+
+    def test_window_includes_its_first_day(self):
+        # The window of 3 days before day 10 starts at day 7.
+        self.assertEqual(temporalindex.recent(self.DATED, 10, window_days = 3), [(7, "b"), (10, "c"), (10, "d")])
+        self.assertEqual(temporalindex.recent(self.DATED, 10, window_days = 2), [(10, "c"), (10, "d")])
+        self.assertEqual(temporalindex.recent(self.DATED, 10, window_days = 0), [(10, "c"), (10, "d")])
+        self.assertEqual(temporalindex.recent(self.DATED, 10, window_days = 0, earlier_only = True), [])
+
+    def test_max_reviews_keeps_the_latest(self):
+        self.assertEqual(temporalindex.recent(self.DATED, 12, max_reviews = 2), [(10, "d"), (12, "e")])
+        self.assertEqual(temporalindex.recent(self.DATED, 12, max_reviews = 0), [])
+        self.assertEqual(temporalindex.recent(self.DATED, 12, max_reviews = 10), self.DATED[:5])
+        self.assertEqual(temporalindex.recent(self.DATED, 12, window_days = 5, max_reviews = 10), self.DATED[1:5])
+        self.assertEqual(temporalindex.recent([], 12, window_days = 5, max_reviews = 1), [])
+
+
+class DateTest(unittest.TestCase):
+
+    def test_date_ordinal_round_trip(self):
+        for date_string in ["2004-02-29", "2010-12-31", "2015-01-01"]:
+            day = temporalindex.date_ordinal(date_string)
+            self.assertEqual(day, datetime.datetime.strptime(date_string, "%Y-%m-%d").toordinal())
+            self.assertEqual(temporalindex.ordinal_date_string(day), date_string)
+
+    def test_quantile_days(self):
+        days = [5, 1, 4, 2, 3]
+        self.assertEqual(list(temporalindex.quantile_days(days, [0.0, 0.5, 0.99, 1.0])), [1, 3, 5, 5])
+
+
+class TemporalIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(0)
+        first = datetime.date(2010, 1, 1)
+        self.reviews = {}
+        for i in range(400):
+            date = first + datetime.timedelta(days = rng.randint(0, 60))
+            self.reviews["r%03d" % i] = {"business_id" : "b%d" % rng.randint(0, 3), "user_id" : "u%d" % rng.randint(0, 40), "date" : date.isoformat()}
+        self.index = temporalindex.TemporalIndex(self.reviews)
+
+    def test_friend_reviews_match_a_scan(self):
+        rng = random.Random(1)
+        for trial in range(300):
+            business_id = "b%d" % rng.randint(0, 4)
+            friends = set("u%d" % rng.randint(0, 40) for i in range(rng.randint(0, 12)))
+            date = (datetime.date(2010, 1, 1) + datetime.timedelta(days = rng.randint(-5, 65))).isoformat()
+            window_days = rng.choice([None, 0, 1, 7, 30])
+            max_reviews = rng.choice([None, 0, 1, 3])
+            earlier_only = rng.choice([False, True])
+            expected = _brute_friend_reviews(self.reviews, business_id, friends, date, window_days, max_reviews, earlier_only)
+            self.assertEqual(self.index.friend_reviews(business_id, friends, date, window_days, max_reviews, earlier_only), expected)
+
+    def test_reviews_between_is_inclusive(self):
+        for business_id in ["b0", "b3"]:
+            expected = sorted((temporalindex.date_ordinal(review["date"]), review_id) for review_id, review in self.reviews.items() if review["business_id"] == business_id and "2010-01-10" <= review["date"] <= "2010-01-20")
+            self.assertEqual(self.index.reviews_between(business_id, "2010-01-10", "2010-01-20"), [review_id for day, review_id in expected])
+        self.assertEqual(self.index.reviews_between("unknown", "2010-01-10", "2010-01-20"), [])
+
+    def test_authors_limit_the_index(self):
+        index = temporalindex.TemporalIndex(self.reviews, authors = set(["u1", "u2"]))
+        self.assertEqual(index.friend_reviews("b0", set(["u1", "u3"]), "2011-01-01"), _brute_friend_reviews(self.reviews, "b0", set(["u1"]), "2011-01-01", None, None, False))
+
+
+if __name__ == "__main__":
+    unittest.main()